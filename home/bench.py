@@ -0,0 +1,59 @@
+import json
+import platform
+import time
+from pathlib import Path
+
+from .metrics import percentile
+
+
+def default_results_dir() -> Path:
+    # Resultados de los comandos bench_* / loadtest (ignorado por git)
+    try:
+        from django.conf import settings
+        return Path(getattr(settings, "BENCH_RESULTS_DIR", None) or Path(settings.BASE_DIR) / "bench_results")
+    except Exception:
+        return Path("bench_results")
+
+
+def summarize_ms(seconds: list[float]) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
+
+
+def save_results(kind: str, payload: dict, results_dir: Path | str | None = None) -> Path:
+    """
+    Guarda un JSON `<kind>-<fecha>.json` con metadatos del entorno para poder
+    comparar corridas en el tiempo.
+    """
+    directory = Path(results_dir or default_results_dir())
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = directory / f"{kind}-{stamp}.json"
+    document = {
+        "kind": kind,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        **payload,
+    }
+    path.write_text(json.dumps(document, indent=2, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def load_results(kind: str, reference: str, results_dir: Path | str | None = None) -> dict | None:
+    # `reference` es una ruta a un JSON o "latest" para la corrida más reciente de ese tipo
+    if reference == "latest":
+        candidates = sorted(Path(results_dir or default_results_dir()).glob(f"{kind}-*.json"))
+        if not candidates:
+            return None
+        path = candidates[-1]
+    else:
+        path = Path(reference)
+        if not path.exists():
+            return None
+    return json.loads(path.read_text(encoding="utf-8"))
@@ -0,0 +1,166 @@
+import contextlib
+import threading
+import time
+
+# Valores por defecto; se pueden sobrescribir por fuente con settings.SCRAPER_CIRCUIT_BREAKER
+# FAILURE_THRESHOLD: fallos seguidos (errores o bloqueos) que abren el circuito (0 lo desactiva),
+# COOLDOWN: segundos abierto antes de probar de nuevo; se duplica con cada sonda fallida
+# hasta MAX_COOLDOWN. HALF_OPEN_PROBES: llamadas de prueba simultáneas al reabrir
+DEFAULT_BREAKER = {
+    "default": {"FAILURE_THRESHOLD": 3, "COOLDOWN": 30, "MAX_COOLDOWN": 300, "HALF_OPEN_PROBES": 1},
+}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def get_breaker_config() -> dict:
+    config = {k: dict(v) for k, v in DEFAULT_BREAKER.items()}
+    try:
+        from django.conf import settings
+        for source, values in (getattr(settings, "SCRAPER_CIRCUIT_BREAKER", {}) or {}).items():
+            config.setdefault(source, dict(config["default"])).update(values)
+    except Exception:
+        pass
+    return config
+
+
+class CircuitOpen(Exception):
+    """La fuente falló o nos bloqueó varias veces seguidas; no se consulta por un tiempo."""
+
+    def __init__(self, source: str, retry_in: float):
+        self.source = source
+        self.retry_in = retry_in
+        super().__init__(f"temporalmente no disponible (se reintentará en {max(1, round(retry_in))} s)")
+
+
+def failure_reason(data) -> str | None:
+    # Una respuesta sin excepción también cuenta como fallo si trae error o es una página de bloqueo
+    if not isinstance(data, dict):
+        return None
+    if data.get("blocked"):
+        return "Blocked"
+    if data.get("error"):
+        return "Error"
+    return None
+
+
+class CircuitBreaker:
+    """
+    Circuito por fuente compartido por todos los hilos del proceso. Tras varios
+    fallos seguidos se abre y las llamadas fallan al instante con CircuitOpen;
+    al vencer la espera deja pasar una sonda (semiabierto) que lo cierra si va bien
+    o lo vuelve a abrir con una espera mayor si falla.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._circuits: dict[str, dict] = {}
+
+    def _limits(self, source: str) -> dict:
+        config = get_breaker_config()
+        return {**config["default"], **config.get(source, {})}
+
+    def _circuit(self, source: str) -> dict:
+        circuit = self._circuits.get(source)
+        if circuit is None:
+            circuit = self._circuits[source] = {
+                "state": CLOSED, "failures": 0, "open_until": 0.0, "cooldown": 0.0, "probes": 0,
+                "opened": 0, "short_circuits": 0, "last_failure": None,
+            }
+        return circuit
+
+    def available(self, source: str) -> bool:
+        # Consulta sin efectos: False mientras el circuito está abierto y no toca sondear
+        with self._lock:
+            circuit = self._circuits.get(source)
+            return circuit is None or circuit["state"] != OPEN or time.monotonic() >= circuit["open_until"]
+
+    def _acquire(self, source: str) -> bool:
+        # Devuelve True si la llamada es una sonda; lanza CircuitOpen si no puede pasar
+        limits = self._limits(source)
+        if not limits["FAILURE_THRESHOLD"]:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(source)
+            if circuit["state"] == CLOSED:
+                return False
+            if circuit["state"] == OPEN and now >= circuit["open_until"]:
+                circuit["state"] = HALF_OPEN
+            if circuit["state"] == HALF_OPEN and circuit["probes"] < limits["HALF_OPEN_PROBES"]:
+                circuit["probes"] += 1
+                return True
+            circuit["short_circuits"] += 1
+            retry_in = max(0.0, circuit["open_until"] - now)
+        raise CircuitOpen(source, retry_in)
+
+    def _release(self, source: str, probe: bool, completed: bool, failure: str | None) -> None:
+        limits = self._limits(source)
+        if not limits["FAILURE_THRESHOLD"]:
+            return
+        with self._lock:
+            circuit = self._circuit(source)
+            if probe:
+                circuit["probes"] -= 1
+            if not completed:
+                # Llamada cancelada: no dice nada de la salud de la fuente
+                return
+            if failure is None:
+                circuit.update(state=CLOSED, failures=0, cooldown=0.0)
+                return
+            circuit["failures"] += 1
+            circuit["last_failure"] = failure
+            if probe or (circuit["state"] == CLOSED and circuit["failures"] >= limits["FAILURE_THRESHOLD"]):
+                previous = circuit["cooldown"]
+                circuit["cooldown"] = min(limits["MAX_COOLDOWN"], previous * 2) if previous else limits["COOLDOWN"]
+                circuit["open_until"] = time.monotonic() + circuit["cooldown"]
+                circuit["state"] = OPEN
+                circuit["opened"] += 1
+
+    @contextlib.contextmanager
+    def guard(self, source: str):
+        """
+        Protege una llamada a la fuente. Lanza CircuitOpen si el circuito está abierto.
+        Una excepción cuenta como fallo; si no, el llamador puede anotar el motivo en
+        `outcome["failure"]` (ver failure_reason), o marcar `outcome["inconclusive"]`
+        si la llamada no llegó a la fuente y no dice nada de su salud.
+        """
+        probe = self._acquire(source)
+        outcome = {"failure": None, "inconclusive": False}
+        completed = False
+        try:
+            yield outcome
+            completed = True
+        except Exception as exc:
+            outcome["failure"] = type(exc).__name__
+            completed = True
+            raise
+        finally:
+            self._release(source, probe, completed and not outcome["inconclusive"], outcome["failure"])
+
+    def reset(self, source: str | None = None) -> None:
+        with self._lock:
+            if source is None:
+                self._circuits.clear()
+            else:
+                self._circuits.pop(source, None)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                source: {
+                    "state": c["state"],
+                    "failures": c["failures"],
+                    "opened": c["opened"],
+                    "short_circuits": c["short_circuits"],
+                    "last_failure": c["last_failure"],
+                    "retry_in": round(max(0.0, c["open_until"] - now), 1) if c["state"] == OPEN else 0.0,
+                }
+                for source, c in self._circuits.items()
+            }
+
+
+BREAKER = CircuitBreaker()
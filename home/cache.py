@@ -0,0 +1,296 @@
+import concurrent.futures
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from .canonical import canonical_key
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.SEARCH_CACHE
+DEFAULT_CACHE_CONFIG = {
+    "ENABLED": True,
+    "MEMORY_MAX_ENTRIES": 512,  # entradas (query, fuente, max_items) en el LRU del proceso
+    "SHARED_ALIAS": "search",   # alias de CACHES compartido por los workers del host
+    "TTL": {"default": 300},    # expiración blanda (fresco) en segundos por fuente
+    "STALE_WHILE_REVALIDATE": True,
+    "STALE_TTL": {"default": 3600},  # expiración dura: pasado esto la entrada no se sirve
+    "REFRESH_WORKERS": 4,       # hilos para refrescos en segundo plano
+}
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+def get_cache_config() -> dict:
+    config = dict(DEFAULT_CACHE_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "SEARCH_CACHE", {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def copy_result(data: dict) -> dict:
+    # Copia superficial de cada item: el agregador los etiqueta y no debe tocar la caché
+    copied = dict(data)
+    copied["results"] = [dict(it) for it in data.get("results", [])]
+    return copied
+
+
+class ResultCache:
+    """
+    Caché de resultados por (consulta canónica, fuente, max_items) en dos niveles:
+    un LRU en memoria con TTL delante de una caché de Django compartida entre workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0,
+                       "stale_hits": 0, "refreshes": 0}
+        self._refreshing: set[str] = set()
+        self._refresh_executor: concurrent.futures.ThreadPoolExecutor | None = None
+
+    @staticmethod
+    def make_key(query: str, source: str, max_items: int) -> str:
+        # La misma clave sirve a la coalescencia (SINGLE_FLIGHT) y a los refrescos en segundo plano
+        digest = hashlib.sha1(canonical_key(query).encode("utf-8")).hexdigest()
+        return f"search:{source}:{max_items}:{digest}"
+
+    @staticmethod
+    def ttl_for(source: str, config: dict | None = None) -> int:
+        ttl = (config or get_cache_config())["TTL"]
+        return int(ttl.get(source, ttl.get("default", 300)))
+
+    @classmethod
+    def hard_ttl_for(cls, source: str, config: dict | None = None) -> int:
+        config = config or get_cache_config()
+        soft = cls.ttl_for(source, config)
+        if not config["STALE_WHILE_REVALIDATE"]:
+            return soft
+        ttl = config["STALE_TTL"]
+        return max(soft, int(ttl.get(source, ttl.get("default", soft))))
+
+    def _shared(self, config: dict):
+        alias = config.get("SHARED_ALIAS")
+        if not alias:
+            return None
+        try:
+            from django.core.cache import caches
+            return caches[alias]
+        except Exception:
+            return None
+
+    def get(self, query: str, source: str, max_items: int) -> dict | None:
+        data, state = self.lookup(query, source, max_items)
+        return data if state == FRESH else None
+
+    def lookup(self, query: str, source: str, max_items: int) -> tuple[dict | None, str]:
+        """
+        Devuelve (datos, estado). Con estado STALE los datos superaron la expiración
+        blanda pero no la dura: se pueden servir mientras se refrescan.
+        """
+        data, state, _ = self.lookup_entry(query, source, max_items)
+        return data, state
+
+    def lookup_entry(self, query: str, source: str, max_items: int) -> tuple[dict | None, str, dict]:
+        # Como lookup, más los metadatos con que se guardó la entrada (ver set)
+        config = get_cache_config()
+        if not config["ENABLED"]:
+            return None, MISS, {}
+        key = self.make_key(query, source, max_items)
+        soft_ttl = self.ttl_for(source, config)
+        hard_ttl = self.hard_ttl_for(source, config)
+        now = time.time()
+        stale_entry = None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry["stored_at"] < soft_ttl:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return self._served(entry, source, config, now)
+            if entry and now - entry["stored_at"] < hard_ttl:
+                stale_entry = entry
+            elif entry:
+                del self._entries[key]
+
+        # Si la copia local está vencida, otro worker pudo haber refrescado el nivel compartido
+        shared = self._shared(config)
+        if shared is not None:
+            try:
+                entry = shared.get(key)
+            except Exception:
+                logger.exception("Caché compartida: error al leer")
+                entry = None
+            if entry and now - entry["stored_at"] < hard_ttl and (
+                stale_entry is None or entry["stored_at"] > stale_entry["stored_at"]
+            ):
+                self._remember(key, entry, config)
+                with self._lock:
+                    self._stats["shared_hits"] += 1
+                return self._served(entry, source, config, now)
+
+        with self._lock:
+            if stale_entry is not None:
+                self._stats["memory_hits"] += 1
+                return self._served(stale_entry, source, config, now)
+            self._stats["misses"] += 1
+        return None, MISS, {}
+
+    def has(self, query: str, source: str, max_items: int) -> bool:
+        # Si hay algo servible (fresco o vencido) sin copiar datos ni tocar las estadísticas
+        config = get_cache_config()
+        if not config["ENABLED"]:
+            return False
+        key = self.make_key(query, source, max_items)
+        hard_ttl = self.hard_ttl_for(source, config)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and time.time() - entry["stored_at"] < hard_ttl:
+            return True
+        shared = self._shared(config)
+        if shared is None:
+            return False
+        try:
+            return shared.has_key(key)
+        except Exception:
+            return False
+
+    def age(self, query: str, source: str, max_items: int) -> float | None:
+        # Segundos desde que se guardó la entrada servible más reciente; None si no hay ninguna
+        config = get_cache_config()
+        if not config["ENABLED"]:
+            return None
+        key = self.make_key(query, source, max_items)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        stored_at = entry["stored_at"] if entry else None
+        if stored_at is None or now - stored_at >= self.ttl_for(source, config):
+            # La copia local puede estar vencida y el nivel compartido ya refrescado
+            shared = self._shared(config)
+            try:
+                shared_entry = shared.get(key) if shared is not None else None
+            except Exception:
+                shared_entry = None
+            if shared_entry and (stored_at is None or shared_entry["stored_at"] > stored_at):
+                stored_at = shared_entry["stored_at"]
+        if stored_at is None or now - stored_at >= self.hard_ttl_for(source, config):
+            return None
+        return now - stored_at
+
+    def _served(self, entry: dict, source: str, config: dict, now: float) -> tuple[dict, str, dict]:
+        data = copy_result(entry["data"])
+        meta = dict(entry.get("meta") or {})
+        age = int(now - entry["stored_at"])
+        if age < self.ttl_for(source, config):
+            return data, FRESH, meta
+        # Marcar la antigüedad para que la página pueda indicarla
+        data["stale"] = True
+        data["age_seconds"] = age
+        for item in data["results"]:
+            item["cache_age"] = age
+        # Contador sin lock: es solo estadística
+        self._stats["stale_hits"] += 1
+        return data, STALE, meta
+
+    def schedule_refresh(self, query: str, source: str, max_items: int, fetch) -> bool:
+        """
+        Programa un único refresco en segundo plano por (consulta, fuente, max_items).
+        `fetch` es un callable sin argumentos que devuelve la respuesta del scraper.
+        """
+        config = get_cache_config()
+        key = self.make_key(query, source, max_items)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            if self._refresh_executor is None:
+                self._refresh_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=config["REFRESH_WORKERS"], thread_name_prefix="cache-refresh"
+                )
+            executor = self._refresh_executor
+
+        # Bloqueo best-effort entre workers del host para no refrescar lo mismo N veces
+        shared = self._shared(config)
+        if shared is not None:
+            try:
+                if not shared.add(f"{key}:refreshing", 1, timeout=60):
+                    with self._lock:
+                        self._refreshing.discard(key)
+                    return False
+            except Exception:
+                pass
+
+        def run():
+            try:
+                self.set(query, source, max_items, fetch())
+                with self._lock:
+                    self._stats["refreshes"] += 1
+            except Exception:
+                logger.exception("Caché: error al refrescar %s", source)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+                if shared is not None:
+                    try:
+                        shared.delete(f"{key}:refreshing")
+                    except Exception:
+                        pass
+
+        executor.submit(run)
+        return True
+
+    def set(self, query: str, source: str, max_items: int, data: dict, meta: dict | None = None) -> None:
+        """
+        Guarda `data`. `meta` acompaña a la entrada sin formar parte de la respuesta
+        (p. ej. cuánto tardó un scraping de precalentamiento) y lo devuelve lookup_entry.
+        """
+        config = get_cache_config()
+        # Solo se guardan respuestas útiles; un error o un bloqueo no debe quedar en caché
+        if not config["ENABLED"] or data.get("error") or not data.get("results"):
+            return
+        key = self.make_key(query, source, max_items)
+        entry = {"stored_at": time.time(), "data": copy_result(data)}
+        if meta:
+            entry["meta"] = dict(meta)
+        self._remember(key, entry, config)
+        shared = self._shared(config)
+        if shared is not None:
+            try:
+                shared.set(key, entry, timeout=self.hard_ttl_for(source, config))
+            except Exception:
+                logger.exception("Caché compartida: error al escribir")
+        with self._lock:
+            self._stats["stores"] += 1
+
+    def _remember(self, key: str, entry: dict, config: dict) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > config["MEMORY_MAX_ENTRIES"]:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            for k in self._stats:
+                self._stats[k] = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+        hits = stats["memory_hits"] + stats["shared_hits"]
+        lookups = hits + stats["misses"]
+        stats["hits"] = hits
+        stats["hit_ratio"] = round(hits / lookups, 3) if lookups else 0.0
+        return stats
+
+
+RESULT_CACHE = ResultCache()
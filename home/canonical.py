@@ -0,0 +1,103 @@
+import functools
+import re
+import unicodedata
+
+# Palabras vacías que no cambian lo que devuelven los marketplaces
+STOPWORDS = frozenset({
+    "de", "del", "la", "las", "el", "los", "un", "una", "unos", "unas",
+    "en", "con", "para", "por", "al",
+})
+# Conjunciones y preposiciones de una letra: delante de un número son parte del modelo
+# ("Galaxy A 15", "Moto E 13"), así que solo se descartan cuando no preceden a un número
+LETTER_STOPWORDS = frozenset({"a", "e", "o", "y"})
+
+# Unidades -> forma canónica. Se pegan al número que las precede: "128 GB" y "128gb" -> "128gb"
+UNITS = {
+    "gb": "gb", "giga": "gb", "gigas": "gb", "gigabytes": "gb",
+    "tb": "tb", "terabyte": "tb", "terabytes": "tb",
+    "mb": "mb", "megas": "mb",
+    "mah": "mah",
+    "mp": "mp", "megapixeles": "mp",
+    "hz": "hz", "ghz": "ghz", "mhz": "mhz",
+    "w": "w", "watts": "w", "vatios": "w",
+    "in": "in", "inch": "in", "pulg": "in", "pulgada": "in", "pulgadas": "in",
+    "cm": "cm", "mm": "mm",
+    "kg": "kg", "l": "l", "litro": "l", "litros": "l",
+}
+
+# Palabras; un decimal ("6.5", "8,5gb") es una sola
+_WORD = re.compile(r"\d+(?:\.\d+)?[^\W\d_]*|[^\W_]+")
+# Número con la unidad pegada ("128gb", "6.5in", "5000mah")
+_NUMBER_UNIT = re.compile(r"(\d+(?:\.\d+)?)([a-z]+)")
+# Comillas de pulgadas detrás de un número ('55"' -> "55 in")
+_INCH_MARK = re.compile(r"(\d)\s*(?:\"|”|'')")
+
+
+def fold(text: str) -> str:
+    # Minúsculas sin tildes ni diéresis ("Audífonos" -> "audifonos"); la comparten
+    # la caché, el índice local y los filtros de accesorios
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def clean_query(query: str) -> str:
+    # Texto tal como lo escribió el usuario, con los espacios colapsados: lo que se envía a las fuentes
+    return " ".join(unicodedata.normalize("NFC", query or "").split())
+
+
+def query_tokens(query: str) -> list[str]:
+    """
+    Términos canónicos en el orden de la consulta: sin tildes, en minúsculas, sin
+    puntuación ni palabras vacías y con las unidades pegadas a su número
+    ("Celular de 128 GB" -> ["celular", "128gb"]).
+    """
+    folded = _INCH_MARK.sub(r"\1 in", fold(query))
+    words = _WORD.findall(re.sub(r"(\d),(\d)", r"\1.\2", folded))
+    tokens: list[str] = []
+    for word in words:
+        glued = _NUMBER_UNIT.fullmatch(word)
+        if glued and glued.group(2) in UNITS:
+            tokens.append(glued.group(1) + UNITS[glued.group(2)])
+        elif word in UNITS and tokens and tokens[-1].replace(".", "").isdigit():
+            tokens[-1] += UNITS[word]
+        else:
+            tokens.append(word)
+    meaningful = [
+        t for i, t in enumerate(tokens)
+        if t not in STOPWORDS and not (t in LETTER_STOPWORDS and not _before_number(tokens, i))
+    ]
+    # Una consulta hecha solo de palabras vacías se conserva tal cual
+    return meaningful or tokens
+
+
+def source_words(query: str) -> list[str]:
+    """
+    Palabras de la consulta para la URL de una fuente: en minúsculas pero con sus tildes,
+    sin palabras vacías y con las abreviaturas de unidad pegadas al número, como las
+    escriben los marketplaces ("Cámara de 128 GB" -> ["cámara", "128gb"]).
+    """
+    words: list[str] = []
+    for word in re.findall(r"[^\W_]+", clean_query(query).lower()):
+        if UNITS.get(word) == word and words and words[-1].isdigit():
+            words[-1] += word
+        else:
+            words.append(word)
+    kept = [
+        w for i, w in enumerate(words)
+        if w not in STOPWORDS and not (w in LETTER_STOPWORDS and not _before_number(words, i))
+    ]
+    return kept or words
+
+
+def _before_number(tokens: list[str], i: int) -> bool:
+    return i + 1 < len(tokens) and tokens[i + 1][:1].isdigit()
+
+
+@functools.lru_cache(maxsize=4096)
+def canonical_key(query: str) -> str:
+    """
+    Clave de la consulta para la caché, la coalescencia y el registro de búsquedas:
+    términos canónicos únicos y ordenados, así "iPhone 15 Pro", "pro iphone  15" y
+    "iphone 15 pro " comparten resultados.
+    """
+    return " ".join(sorted(set(query_tokens(query))))
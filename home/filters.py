@@ -0,0 +1,141 @@
+import functools
+import re
+
+from .canonical import fold
+
+# Palabras de accesorios por categoría de producto. Se comparan como palabras
+# completas (con plural opcional) sobre el título sin tildes y en minúsculas.
+DEFAULT_CATEGORY_WORDS: dict[str, list[str]] = {
+    "celulares": [
+        "funda", "estuche", "case", "carcasa", "protector", "protector de pantalla", "proteccion",
+        "vidrio", "templado", "tempered", "mica", "hidrogel", "popsocket",
+        "audifono", "auricular", "earbud", "manos libres", "cable", "cargador", "adaptador",
+        "soporte", "holder", "tripode", "montura", "selfie stick", "parlante", "altavoz", "bocina",
+        "speaker", "power bank", "bateria externa", "punta", "lapiz optico", "malla", "correa",
+    ],
+    "portatiles": [
+        "funda", "estuche", "sleeve", "maletin", "morral", "mochila", "protector", "skin",
+        "cargador", "adaptador", "cable", "hub", "docking", "base refrigerante", "soporte",
+        # Teclado, mouse y batería también describen al equipo ("teclado retroiluminado"):
+        # solo cuentan con contexto de accesorio
+        "mouse inalambrico", "mouse usb", "mouse optico", "mouse gamer", "pad mouse", "mouse pad",
+        "teclado inalambrico", "teclado usb", "teclado externo",
+        "bateria para portatil", "bateria para laptop", "bateria de repuesto",
+    ],
+    "televisores": [
+        # "3 HDMI" o "con control remoto" describen al televisor: se exige contexto de accesorio
+        "soporte tv", "soporte para tv", "soporte de tv", "soporte para televisor",
+        "soporte de pared", "rack", "control remoto universal", "control remoto para tv",
+        "control remoto para televisor", "control remoto de reemplazo", "antena",
+        "cable hdmi", "cable de antena", "cable coaxial", "protector", "forro",
+        "convertidor", "decodificador", "barra de sonido", "soundbar",
+    ],
+    # Consultas sin categoría reconocida: solo accesorios inequívocos
+    "default": [
+        "funda", "estuche", "protector", "cable", "cargador", "adaptador", "soporte", "repuesto",
+    ],
+}
+
+# Palabras de la consulta que identifican la categoría (en orden de prioridad)
+DEFAULT_QUERY_CATEGORIES: dict[str, list[str]] = {
+    "celulares": [
+        "celular", "smartphone", "telefono", "iphone", "galaxy", "motorola", "moto", "xiaomi",
+        "redmi", "huawei", "honor", "oppo", "realme", "pixel",
+    ],
+    "portatiles": ["portatil", "laptop", "notebook", "macbook", "chromebook", "computador"],
+    "televisores": ["televisor", "tv", "smart tv", "qled", "oled"],
+}
+
+# Valores por defecto; se pueden sobrescribir con settings.ACCESSORY_FILTER
+DEFAULT_FILTER_CONFIG = {
+    "ENABLED": True,
+    "CATEGORIES": DEFAULT_CATEGORY_WORDS,
+    "QUERY_CATEGORIES": DEFAULT_QUERY_CATEGORIES,
+}
+
+
+def get_filter_config() -> dict:
+    config = dict(DEFAULT_FILTER_CONFIG)
+    try:
+        from django.conf import settings
+        overrides = getattr(settings, "ACCESSORY_FILTER", {}) or {}
+    except Exception:
+        overrides = {}
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            # Las categorías se fusionan: basta con declarar las que cambian
+            config[key] = {**config[key], **value}
+        else:
+            config[key] = value
+    return config
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+", fold(text))
+
+
+_CONNECTORS = {"de", "para", "con"}
+
+
+def _query_forms(query: str) -> set[str]:
+    # Palabras de la consulta en singular y plural ("fundas" cubre "funda")
+    forms: set[str] = set()
+    for word in _words(query):
+        forms.add(word)
+        if word.endswith("es"):
+            forms.add(word[:-2])
+        if word.endswith("s"):
+            forms.add(word[:-1])
+    return forms
+
+
+def detect_category(query: str, config: dict | None = None) -> str:
+    config = config or get_filter_config()
+    folded = " " + " ".join(_words(query)) + " "
+    for category, keywords in config["QUERY_CATEGORIES"].items():
+        if any(f" {fold(k)} " in folded for k in keywords):
+            return category
+    return "default"
+
+
+@functools.lru_cache(maxsize=256)
+def compile_terms(terms: tuple[str, ...]) -> re.Pattern | None:
+    """
+    Compila una lista de términos en una sola alternancia con límites de palabra.
+    Los términos de varias palabras admiten cualquier espacio entre ellas y todos
+    aceptan plural (-s / -es). Las más largas van primero para que ganen.
+    """
+    if not terms:
+        return None
+    parts = sorted({fold(t).strip() for t in terms if t and t.strip()}, key=len, reverse=True)
+    alternation = "|".join(r"\s+".join(re.escape(w) for w in part.split()) for part in parts)
+    return re.compile(rf"\b(?:{alternation})(?:e?s)?\b")
+
+
+def accessory_pattern(query: str) -> re.Pattern | None:
+    """
+    Patrón de accesorios para una consulta: lista de su categoría menos los términos
+    que el usuario buscó explícitamente (buscar "funda iphone" no filtra las fundas).
+    None si el filtro está desactivado o no queda ningún término.
+    """
+    config = get_filter_config()
+    if not config["ENABLED"]:
+        return None
+    category = detect_category(query, config)
+    words = config["CATEGORIES"].get(category) or config["CATEGORIES"].get("default", [])
+    query_words = _query_forms(query)
+    terms = tuple(sorted(
+        w for w in words
+        if not all(tw in query_words for tw in fold(w).split() if tw not in _CONNECTORS)
+    ))
+    return compile_terms(terms)
+
+
+def filter_accessories(items: list[dict], query: str) -> tuple[list[dict], int]:
+    # Devuelve (items relevantes, cantidad descartada) según el título de cada item
+    pattern = accessory_pattern(query)
+    if pattern is None or not items:
+        return items, 0
+    search = pattern.search
+    kept = [it for it in items if not search(fold(it.get("title") or ""))]
+    return kept, len(items) - len(kept)
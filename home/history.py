@@ -0,0 +1,283 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.PRICE_HISTORY.
+# Los items se encolan al scrapear y un hilo los escribe en lotes de hasta BATCH_SIZE
+# o cada FLUSH_INTERVAL s. Con la cola llena (QUEUE_MAX) se descartan: nunca se
+# frena una búsqueda por el histórico
+DEFAULT_HISTORY = {
+    "ENABLED": True,
+    "PATH": None,  # por defecto BASE_DIR/data/price_history.sqlite3
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 2.0,
+    "QUEUE_MAX": 50_000,
+}
+
+DAY = 86400
+
+SCHEMA = (
+    # Un producto por link; last_price permite descartar en SQL las observaciones repetidas
+    "CREATE TABLE IF NOT EXISTS products ("
+    " id INTEGER PRIMARY KEY, link TEXT NOT NULL UNIQUE, source TEXT NOT NULL, title TEXT NOT NULL,"
+    " last_price INTEGER, first_seen INTEGER NOT NULL, last_seen INTEGER NOT NULL)",
+    # Solo los cambios de precio: (producto, momento) -> precio, ordenado por producto y tiempo
+    "CREATE TABLE IF NOT EXISTS prices ("
+    " product_id INTEGER NOT NULL, seen_at INTEGER NOT NULL, price_cop INTEGER NOT NULL,"
+    " PRIMARY KEY (product_id, seen_at)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS prices_seen_at ON prices (seen_at)",
+)
+
+# Índice de texto completo sobre los títulos (home.index), sincronizado por triggers.
+# Tabla de contenido externo: solo guarda el índice invertido, el texto sigue en products
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+    " title, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN"
+    " INSERT INTO products_fts (rowid, title) VALUES (new.id, new.title); END",
+    "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN"
+    " INSERT INTO products_fts (products_fts, rowid, title) VALUES ('delete', old.id, old.title); END",
+    # El upsert de write_batch reescribe el título en cada observación: solo se reindexa si cambió
+    "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF title ON products"
+    " WHEN old.title <> new.title BEGIN"
+    " INSERT INTO products_fts (products_fts, rowid, title) VALUES ('delete', old.id, old.title);"
+    " INSERT INTO products_fts (rowid, title) VALUES (new.id, new.title); END",
+)
+
+
+def get_history_config() -> dict:
+    config = dict(DEFAULT_HISTORY)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "PRICE_HISTORY", {}) or {})
+        if not config["PATH"]:
+            config["PATH"] = Path(settings.BASE_DIR) / "data" / "price_history.sqlite3"
+    except Exception:
+        config["PATH"] = config["PATH"] or "price_history.sqlite3"
+    return config
+
+
+def connect(path) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=5.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    _migrate(conn)
+    return conn
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    # Bases creadas antes del índice de búsqueda: columna de miniatura y FTS sobre lo ya guardado
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts_au'").fetchone():
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Se vuelve a mirar dentro de la transacción: otro worker pudo migrar mientras tanto
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts_au'").fetchone():
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+            if "thumbnail" not in columns:
+                conn.execute("ALTER TABLE products ADD COLUMN thumbnail TEXT")
+            for statement in FTS_SCHEMA:
+                conn.execute(statement)
+            conn.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def write_batch(conn: sqlite3.Connection, rows: list[tuple]) -> int:
+    """
+    Escribe (source, link, title, price_cop, seen_at, thumbnail) en una transacción. Una fila
+    solo crea un punto de historial si el precio cambió respecto al último conocido
+    del link; si no, solo actualiza last_seen. Devuelve los puntos nuevos.
+    """
+    added = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for source, link, title, price, seen_at, thumbnail in sorted(rows, key=lambda r: r[4]):
+            conn.execute(
+                "INSERT INTO products (link, source, title, first_seen, last_seen, thumbnail) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (link) DO UPDATE SET title = excluded.title, "
+                "last_seen = MAX(last_seen, excluded.last_seen), "
+                "thumbnail = COALESCE(excluded.thumbnail, thumbnail)",
+                (link, source, title, seen_at, seen_at, thumbnail),
+            )
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO prices (product_id, seen_at, price_cop) "
+                "SELECT id, ?, ? FROM products WHERE link = ? AND (last_price IS NULL OR last_price <> ?)",
+                (seen_at, price, link, price),
+            )
+            if cursor.rowcount > 0:
+                added += 1
+                conn.execute("UPDATE products SET last_price = ? WHERE link = ?", (price, link))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+
+class PriceHistoryWriter:
+    """
+    Cola en memoria + hilo escritor por proceso. `record` solo encola (O(items) sin
+    E/S); el hilo agrupa y escribe en la base SQLite compartida por los workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: queue.Queue | None = None
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._stats = {"queued": 0, "dropped": 0, "written": 0, "price_points": 0, "batches": 0, "errors": 0}
+
+    def _ensure_started(self, config: dict) -> queue.Queue:
+        # El hilo se arranca en el primer uso de cada proceso (después del fork de gunicorn)
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                self._queue = queue.Queue(maxsize=config["QUEUE_MAX"])
+                self._thread = threading.Thread(target=self._run, args=(config, self._queue),
+                                                name="price-history", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            return self._queue
+
+    def record(self, source: str, items: list[dict], seen_at: float | None = None) -> int:
+        config = get_history_config()
+        if not config["ENABLED"] or not items:
+            return 0
+        seen_at = int(seen_at or time.time())
+        pending = self._ensure_started(config)
+        queued = 0
+        for item in items:
+            link, price = item.get("link"), item.get("price_cop")
+            if not link or not price:
+                continue
+            try:
+                pending.put_nowait((source, link, (item.get("title") or "")[:300], int(price), seen_at,
+                                    item.get("thumbnail") or None))
+                queued += 1
+            except queue.Full:
+                with self._lock:
+                    self._stats["dropped"] += 1
+        with self._lock:
+            self._stats["queued"] += queued
+        return queued
+
+    def _run(self, config: dict, pending: queue.Queue) -> None:
+        conn = None
+        while True:
+            batch = [pending.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + config["FLUSH_INTERVAL"]
+            stop = False
+            while len(batch) < config["BATCH_SIZE"]:
+                try:
+                    row = pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            try:
+                conn = conn or connect(config["PATH"])
+                added = write_batch(conn, batch)
+                with self._lock:
+                    self._stats["written"] += len(batch)
+                    self._stats["price_points"] += added
+                    self._stats["batches"] += 1
+            except sqlite3.Error:
+                logger.exception("Histórico de precios: no se pudo escribir un lote de %d items", len(batch))
+                with self._lock:
+                    self._stats["errors"] += 1
+            finally:
+                for _ in batch:
+                    pending.task_done()
+            if stop:
+                return
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        # Espera a que lo encolado hasta ahora quede escrito (pruebas, cierre del proceso)
+        with self._lock:
+            pending = self._queue if self._pid == os.getpid() else None
+        if pending is None:
+            return True
+        deadline = time.monotonic() + timeout
+        while pending.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queue_depth"] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+
+HISTORY = PriceHistoryWriter()
+atexit.register(HISTORY.flush, 5.0)
+
+_readers = threading.local()
+
+
+def _reader() -> sqlite3.Connection:
+    # Una conexión de lectura por hilo; WAL permite leer mientras el escritor confirma lotes
+    config = get_history_config()
+    conn = getattr(_readers, "conn", None)
+    if conn is None or getattr(_readers, "path", None) != config["PATH"]:
+        conn = _readers.conn = connect(config["PATH"])
+        _readers.path = config["PATH"]
+    return conn
+
+
+def price_history(link: str, days: float | None = None) -> list[dict]:
+    # Cambios de precio del link, del más antiguo al más reciente
+    since = int(time.time() - days * DAY) if days else 0
+    rows = _reader().execute(
+        "SELECT p.seen_at, p.price_cop FROM prices p JOIN products pr ON pr.id = p.product_id "
+        "WHERE pr.link = ? AND p.seen_at >= ? ORDER BY p.seen_at",
+        (link, since),
+    ).fetchall()
+    return [{"seen_at": seen_at, "price_cop": price} for seen_at, price in rows]
+
+
+def lowest_price(link: str, days: float) -> dict | None:
+    """
+    Precio más bajo del link en los últimos `days` días. Cuenta también el precio
+    vigente al empezar el periodo (el último cambio anterior a él).
+    """
+    since = int(time.time() - days * DAY)
+    conn = _reader()
+    product = conn.execute("SELECT id, title, source, last_seen FROM products WHERE link = ?", (link,)).fetchone()
+    if product is None:
+        return None
+    product_id, title, source, last_seen = product
+    candidates = conn.execute(
+        "SELECT price_cop, seen_at FROM prices WHERE product_id = ? AND seen_at >= ? "
+        "ORDER BY price_cop, seen_at LIMIT 1",
+        (product_id, since),
+    ).fetchall()
+    candidates += conn.execute(
+        "SELECT price_cop, seen_at FROM prices WHERE product_id = ? AND seen_at < ? "
+        "ORDER BY seen_at DESC LIMIT 1",
+        (product_id, since),
+    ).fetchall()
+    if not candidates or last_seen < since:
+        return None
+    price, seen_at = min(candidates)
+    return {"link": link, "title": title, "source": source, "price_cop": price,
+            "seen_at": max(seen_at, since), "days": days}
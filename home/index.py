@@ -0,0 +1,199 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+from .canonical import LETTER_STOPWORDS, UNITS, query_tokens
+from .history import connect, get_history_config
+from .metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.SEARCH_INDEX.
+# El índice son los títulos del histórico de precios (home.history) en FTS5: todo lo que
+# devuelven los scrapers queda buscable con su fuente, último precio y última vez visto.
+# INDEX_FIRST: search_aggregated responde desde el índice si hay al menos MIN_RESULTS items
+# de la fuente vistos hace menos de MAX_AGE s; con REFRESH se scrapea igual en segundo plano
+DEFAULT_INDEX = {
+    "ENABLED": True,
+    "INDEX_FIRST": False,
+    "MAX_AGE": 900,
+    "MIN_RESULTS": 3,
+    "REFRESH": True,
+    "POOL_SIZE": 8,
+}
+
+METRICS.describe("search_index_total", "Consultas al índice local por fuente y resultado (hit, miss, error).")
+METRICS.describe("search_index_seconds", "Duración de las consultas al índice local.",
+                 buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+
+def get_index_config() -> dict:
+    config = dict(DEFAULT_INDEX)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "SEARCH_INDEX", {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+# Unidad canónica -> cómo puede aparecer en un título ("in" -> in, inch, pulg, pulgada, pulgadas)
+_UNIT_ALIASES: dict[str, list[str]] = {}
+for _alias, _unit in UNITS.items():
+    _UNIT_ALIASES.setdefault(_unit, []).append(_alias)
+
+_NUMBER_UNIT = re.compile(r"(\d+(?:\.\d+)?)([a-z]+)")
+
+
+def _term_forms(term: str) -> list[str]:
+    # Singular y plural ("celular" -> celular, celulares), como _query_forms de home.filters.
+    # Las medidas van pegadas o separadas y con cualquier alias de la unidad: "128gb" ->
+    # 128gb, "128 gb", 128gigas... (unicode61 corta "128 GB" en dos términos)
+    size = _NUMBER_UNIT.fullmatch(term)
+    if size and size.group(2) in _UNIT_ALIASES:
+        number, aliases = size.group(1), _UNIT_ALIASES[size.group(2)]
+        return [number + alias for alias in aliases] + [f"{number} {alias}" for alias in aliases]
+    if not term.isalpha() or len(term) < 3:
+        return [term]
+    if term.endswith("es"):
+        return [term, term[:-2], term[:-1]]
+    if term.endswith("s"):
+        return [term, term[:-1]]
+    return [term, term + "s", term + "es"]
+
+
+def _phrase(form: str) -> str:
+    # unicode61 separa en los puntos: "6.5in" se indexa como "6" "5in"
+    return '"' + form.replace(".", " ") + '"'
+
+
+def match_expression(query: str) -> str | None:
+    """
+    Expresión MATCH con los términos canónicos de la consulta (los mismos de la clave
+    de la caché, home.canonical.query_tokens), en cualquier orden y en singular o
+    plural. Son términos exactos y no prefijos ("celular"*): FTS5 materializa la
+    lista completa de un prefijo, mientras que con términos exactos la consulta se
+    detiene al llegar al LIMIT.
+    """
+    tokens = query_tokens(query)
+    groups = []
+    i = 0
+    while i < len(tokens):
+        term = tokens[i]
+        if term in LETTER_STOPWORDS and i + 1 < len(tokens) and tokens[i + 1].isdigit():
+            # Designador de modelo: "a 15" también es "A15" en el título
+            forms = [term + tokens[i + 1], f"{term} {tokens[i + 1]}"]
+            i += 2
+        else:
+            forms = _term_forms(term)
+            i += 1
+        phrases = list(dict.fromkeys(_phrase(form) for form in forms))
+        group = phrases[0] if len(phrases) == 1 else "(" + " OR ".join(phrases) + ")"
+        if group not in groups:
+            groups.append(group)
+    return " AND ".join(groups) or None
+
+
+class ProductIndex:
+    """
+    Búsqueda de texto completo sobre los productos ya scrapeados. Las conexiones de
+    lectura se reutilizan entre hilos (cada búsqueda corre en hilos nuevos del pool),
+    así que se guardan en un pequeño pool en vez de una por hilo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: list[tuple[str, sqlite3.Connection]] = []
+        self._stats = {"queries": 0, "rows": 0, "errors": 0}
+
+    def _acquire(self, path) -> sqlite3.Connection:
+        with self._lock:
+            while self._idle:
+                idle_path, conn = self._idle.pop()
+                if idle_path == str(path):
+                    return conn
+                conn.close()
+        conn = connect(path)
+        # Lecturas por mmap: las páginas del índice se comparten entre conexiones y workers
+        conn.execute("PRAGMA mmap_size = 268435456")
+        return conn
+
+    def _release(self, path, conn: sqlite3.Connection, pool_size: int) -> None:
+        with self._lock:
+            if len(self._idle) < pool_size:
+                self._idle.append((str(path), conn))
+                return
+        conn.close()
+
+    def search(self, source: str, query: str, limit: int, max_age: float | None = None) -> list[dict]:
+        """
+        Productos de `source` cuyo título contiene todos los términos de `query` (ver
+        match_expression), vistos en los últimos `max_age` s, empezando por los
+        últimos que entraron al índice. Devuelve [] si el índice está desactivado o
+        no se puede leer.
+        """
+        config = get_index_config()
+        history = get_history_config()
+        expression = match_expression(query)
+        if not config["ENABLED"] or not history["ENABLED"] or not expression or limit <= 0:
+            return []
+        max_age = config["MAX_AGE"] if max_age is None else max_age
+        started = time.perf_counter()
+        conn = None
+        try:
+            conn = self._acquire(history["PATH"])
+            rows = conn.execute(
+                "SELECT p.link, p.title, p.last_price, p.thumbnail, p.last_seen"
+                " FROM products_fts f JOIN products p ON p.id = f.rowid"
+                " WHERE products_fts MATCH ? AND p.source = ? AND p.last_seen >= ? AND p.last_price IS NOT NULL"
+                # Más nuevos primero: a diferencia de ORDER BY rank (bm25 sobre todas las
+                # coincidencias), recorrer por rowid se detiene al llegar al LIMIT
+                " ORDER BY f.rowid DESC LIMIT ?",
+                (expression, source, int(time.time() - max_age), limit),
+            ).fetchall()
+        except sqlite3.Error:
+            logger.exception("Índice local: error al buscar %r en %s", query, source)
+            if conn is not None:
+                conn.close()
+            with self._lock:
+                self._stats["errors"] += 1
+            METRICS.inc("search_index_total", {"source": source, "outcome": "error"})
+            return []
+        self._release(history["PATH"], conn, config["POOL_SIZE"])
+        METRICS.observe("search_index_seconds", time.perf_counter() - started)
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["rows"] += len(rows)
+        return [
+            {"link": link, "title": title, "price_cop": price, "thumbnail": thumbnail, "seen_at": seen_at}
+            for link, title, price, thumbnail, seen_at in rows
+        ]
+
+    def size(self) -> dict:
+        # Productos indexados y tamaño de la base en disco (sin contar el WAL)
+        history = get_history_config()
+        conn = self._acquire(history["PATH"])
+        try:
+            products = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        finally:
+            self._release(history["PATH"], conn, get_index_config()["POOL_SIZE"])
+        return {"products": products, "bytes": page_size * pages}
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle_connections"] = len(self._idle)
+        return stats
+
+
+INDEX = ProductIndex()
@@ -0,0 +1,259 @@
+import asyncio
+import concurrent.futures
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+
+from .bench import summarize_ms
+
+PAGES_DIR = Path(__file__).resolve().parent / "testdata" / "pages"
+
+# Página que devuelve el servidor según la ruta pedida (la primera que coincida)
+ROUTES = [
+    (re.compile(r"^/falabella-co/"), "falabella_search.html", "falabella_captcha.html"),
+    (re.compile(r"^/(ofertas)?/?$"), None, None),  # portada y ofertas: calentamiento de sesión
+    (re.compile(r"^/"), "mercadolibre_listing.html", "mercadolibre_captcha.html"),
+]
+
+WARMUP_PAGE = b"<!DOCTYPE html><html><head><title>Mercado Libre</title></head><body>ok</body></html>"
+
+
+class StandInMarketplace:
+    """
+    Servidor HTTP local que imita a Mercado Libre y Falabella con las páginas grabadas
+    en testdata. Permite simular latencia, errores 5xx y páginas de captcha.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.3,
+                 jitter: float = 0.1, error_rate: float = 0.0, captcha_rate: float = 0.0,
+                 pages_dir: Path | str = PAGES_DIR):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.captcha_rate = captcha_rate
+        self._pages = self._load_pages(Path(pages_dir))
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "captchas": 0, "in_flight": 0, "max_in_flight": 0}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @staticmethod
+    def _load_pages(pages_dir: Path) -> dict[str, dict]:
+        pages = {}
+        for path in pages_dir.glob("*.html"):
+            body = path.read_bytes()
+            pages[path.name] = {"raw": body, "gzip": gzip.compress(body, 6)}
+        return pages
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInMarketplace":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_peak(self) -> None:
+        with self._lock:
+            self._stats["max_in_flight"] = self._stats["in_flight"]
+
+    def _track(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += delta
+            if key == "in_flight":
+                self._stats["max_in_flight"] = max(self._stats["max_in_flight"], self._stats["in_flight"])
+
+    def _handler_class(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stand_in._track("requests")
+                stand_in._track("in_flight")
+                try:
+                    stand_in._respond(self)
+                finally:
+                    stand_in._track("in_flight", -1)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _respond(self, handler: BaseHTTPRequestHandler) -> None:
+        delay = max(0.0, random.gauss(self.latency, self.jitter)) if self.jitter else self.latency
+        time.sleep(delay)
+        path = handler.path.split("?", 1)[0]
+        if path.startswith("/sites/"):
+            self._send(handler, 200, json.dumps({"results": []}).encode(), "application/json")
+            return
+        if random.random() < self.error_rate:
+            self._track("errors")
+            self._send(handler, random.choice((500, 502, 503)), b"upstream error", "text/plain")
+            return
+        for pattern, page, captcha_page in ROUTES:
+            if not pattern.match(path):
+                continue
+            if page is None:
+                self._send(handler, 200, WARMUP_PAGE, "text/html; charset=utf-8")
+                return
+            if random.random() < self.captcha_rate:
+                self._track("captchas")
+                page = captcha_page
+            entry = self._pages[page]
+            gzipped = "gzip" in (handler.headers.get("Accept-Encoding") or "")
+            self._send(handler, 200, entry["gzip"] if gzipped else entry["raw"],
+                       "text/html; charset=utf-8", encoding="gzip" if gzipped else None)
+            return
+
+    @staticmethod
+    def _send(handler, status: int, body: bytes, content_type: str, encoding: str | None = None) -> None:
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(body)))
+        if encoding:
+            handler.send_header("Content-Encoding", encoding)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def base_url_overrides(stand_in_url: str) -> dict:
+    # Valores de settings.SCRAPER_BASE_URLS para apuntar todas las fuentes al servidor local
+    return {key: stand_in_url for key in ("mercadolibre", "mercadolibre_listado", "mercadolibre_api", "falabella")}
+
+
+def make_queries(queries: list[str], count: int, cold: bool) -> list[str]:
+    # Con `cold`, cada consulta es única para que la caché de resultados no la sirva
+    rnd = random.Random(count)
+    picked = [rnd.choice(queries) for _ in range(count)]
+    if cold:
+        stamp = int(time.time()) % 100000
+        picked = [f"{q} {stamp}{i}" for i, q in enumerate(picked)]
+    return picked
+
+
+def is_error(status: int) -> bool:
+    # 0 = sin respuesta (red, timeout); 4xx/5xx incluye los 429 del rate limit
+    return status == 0 or status >= 400
+
+
+def summarize_level(concurrency: int, samples: list[tuple[float, int]], elapsed: float,
+                    extra: dict | None = None) -> dict:
+    """
+    Resumen de un nivel a partir de (segundos, estado) por petición. El throughput y
+    los percentiles cuentan solo las respuestas correctas: un 5xx rápido no es capacidad.
+    """
+    ok = [seconds for seconds, status in samples if not is_error(status)]
+    errors = len(samples) - len(ok)
+    statuses: dict[int, int] = {}
+    for _, status in samples:
+        statuses[status] = statuses.get(status, 0) + 1
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        **summarize_ms(ok),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        **(extra or {}),
+    }
+
+
+async def run_in_process(queries: list[str], concurrency: int) -> tuple[list[tuple[float, int]], float]:
+    """
+    Lanza los POST contra la vista `home` dentro del proceso (pila ASGI completa,
+    middlewares incluidos) con `concurrency` clientes simultáneos. Devuelve
+    (segundos, estado) por petición y la duración total.
+    """
+    from django.test import AsyncClient
+
+    client = AsyncClient(raise_request_exception=False)
+    pending = list(queries)
+    samples: list[tuple[float, int]] = []
+
+    async def user():
+        while pending:
+            query = pending.pop()
+            started = time.perf_counter()
+            response = await client.post("/", {"search_item": query})
+            samples.append((time.perf_counter() - started, response.status_code))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+
+def run_against_target(target: str, queries: list[str], concurrency: int,
+                       timeout: float = 60) -> tuple[list[tuple[float, int]], float]:
+    """
+    Lanza los POST contra un servidor ya arrancado (p. ej. gunicorn con el Procfile).
+    Cada usuario obtiene primero la cookie y el token CSRF del formulario.
+    """
+    pending = list(queries)
+    lock = threading.Lock()
+    samples: list[tuple[float, int]] = []
+
+    def user():
+        session = requests.Session()
+        page = session.get(target, timeout=timeout)
+        match = re.search(r'name="csrfmiddlewaretoken" value="([^"]+)"', page.text)
+        token = match.group(1) if match else session.cookies.get("csrftoken", "")
+        while True:
+            with lock:
+                if not pending:
+                    return
+                query = pending.pop()
+            started = time.perf_counter()
+            try:
+                response = session.post(
+                    target, data={"search_item": query, "csrfmiddlewaretoken": token},
+                    headers={"Referer": target}, timeout=timeout,
+                )
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples.append((elapsed, status))
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(user) for _ in range(concurrency)]:
+            future.result()
+    return samples, time.perf_counter() - started
+
+
+def saturation_point(levels: list[dict], min_gain: float = 0.1) -> dict | None:
+    """
+    Primer nivel de concurrencia a partir del cual duplicar usuarios ya no sube el
+    throughput al menos `min_gain` (10%): los workers están saturados y solo crece la cola.
+    """
+    for previous, current in zip(levels, levels[1:]):
+        if not previous["throughput_rps"]:
+            continue
+        gain = current["throughput_rps"] / previous["throughput_rps"] - 1
+        if gain < min_gain:
+            return {"concurrency": previous["concurrency"], "throughput_rps": previous["throughput_rps"],
+                    "next_gain": round(gain, 3)}
+    return None
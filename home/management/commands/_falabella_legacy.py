@@ -0,0 +1,228 @@
+"""
+Extractor de tarjetas de Falabella anterior a la pasada única de
+service.parse_falabella_cards (un select_one por selector y tarjeta, más una segunda
+pasada sobre las anclas para contar los descartes sin precio). Solo se usa como
+referencia en bench_parsers; la lista negra de accesorios se omite porque hoy el
+filtro se aplica aparte (home.filters).
+"""
+from typing import Optional
+
+from home.service import _regex_find_price_text, extract_price_cop, format_price_cop
+
+
+def legacy_parse_falabella_cards(soup, max_items: int = 20) -> list[dict]:
+    items: list[dict] = []
+
+    # Anclas típicas que apuntan a la página de producto
+    anchors = soup.select(
+        "a.pod-link, a.pod-product__title, a.grid-pod__title, a.falabella-product-link, a[href*='/falabella-co/product/'], a[href*='/product/']"
+    )
+
+    # Si no hay anclas, intentar seleccionar contenedores de tarjetas y obtener el <a> interno
+    if not anchors:
+        product_cards = soup.select(
+            "[data-pod], div[data-pod='product-pod'], li[data-pod], div.pod, li.pod, [data-testid='searchResults-product']"
+        )
+        for card in product_cards:
+            a = card.select_one("a[href*='/product/'], a.falabella-product-link, a")
+            if a:
+                anchors.append(a)
+
+    seen_links: set[str] = set()
+
+    def find_container(node):
+        if not node:
+            return None
+        # Si el propio nodo parece ser una tarjeta (caso <a class="pod pod-link">), úsalo
+        try:
+            classes = node.get("class", [])
+            if any("pod" in cls for cls in classes):
+                return node
+        except Exception:
+            pass
+        # Buscar un contenedor con pistas de tarjeta de producto
+        return node.find_parent(lambda t: t.name in ["div", "li"] and (
+            t.has_attr("data-pod") or
+            (t.has_attr("class") and any(
+                any(hint in cls for hint in ["pod", "product", "grid", "cards", "tiles"]) for cls in t.get("class", [])
+            ))
+        )) or node.parent
+
+    def resolve_link(a_tag, container_tag) -> Optional[str]:
+        candidates: list[str] = []
+        # 1) href directo del anchor
+        if a_tag:
+            href = a_tag.get("href") or a_tag.get("data-href")
+            if href:
+                candidates.append(href)
+        # 2) anchor descendiente con /product/
+        if container_tag:
+            inner_a = container_tag.find("a", href=True)
+            if inner_a and "/product/" in (inner_a.get("href") or ""):
+                candidates.append(inner_a.get("href"))
+        # 3) mirar padres cercanos por anchors
+        parent = container_tag
+        hop = 0
+        while parent is not None and hop < 2 and not candidates:
+            parent = parent.parent
+            hop += 1
+            if parent and hasattr(parent, "find"):
+                p_a = parent.find("a", href=True)
+                if p_a and "/product/" in (p_a.get("href") or ""):
+                    candidates.append(p_a.get("href"))
+        # 4) data-key -> construir URL base
+        data_key = None
+        try:
+            data_key = (a_tag.get("data-key") if a_tag else None) or (container_tag.get("data-key") if container_tag else None)
+        except Exception:
+            data_key = None
+        if data_key:
+            candidates.append(f"/falabella-co/product/{data_key}")
+
+        # Normalizar y elegir
+        for href in candidates:
+            if not href:
+                continue
+            link = href
+            if link.startswith("/"):
+                link = f"https://www.falabella.com.co{link}"
+            if link.startswith("http") and "falabella.com" in link:
+                return link
+        return None
+
+    def extract_title(a_tag, container_tag):
+        # Priorizar estructura pod-title + pod-subTitle
+        parts: list[str] = []
+        if container_tag:
+            t1 = container_tag.select_one("b.pod-title")
+            t2 = container_tag.select_one("b.pod-subTitle")
+            if t1:
+                parts.append(t1.get_text(strip=True))
+            if t2:
+                parts.append(t2.get_text(strip=True))
+        text = " ".join([p for p in parts if p])
+        if text:
+            return text
+        # Fallback: texto del propio anchor
+        return a_tag.get_text(strip=True)
+
+    def extract_price(container_tag, around_tag) -> tuple[Optional[int], Optional[str]]:
+        if not container_tag and not around_tag:
+            return None, None
+        # 1) Atributos frecuentes en Falabella
+        attr_node = None
+        if container_tag:
+            attr_node = (
+                container_tag.select_one("[data-event-price]")
+                or container_tag.select_one("[data-internet-price]")
+                or container_tag.select_one("li[data-event-price]")
+                or container_tag.select_one("li[data-internet-price]")
+                or container_tag.select_one("li[data-cmr-price]")
+                or container_tag.select_one("li[data-normal-price]")
+            )
+        if attr_node:
+            val = (
+                attr_node.get("data-internet-price")
+                or attr_node.get("data-event-price")
+                or attr_node.get("data-cmr-price")
+                or attr_node.get("data-normal-price")
+            )
+            if val:
+                return extract_price_cop(val), "attr"
+
+        # 2) Nodos de precio comunes por clases/atributos de QA
+        price_node = None
+        if container_tag:
+            price_node = (
+                container_tag.select_one(".pod-prices__price")
+                or container_tag.select_one(".fb-price")
+                or container_tag.select_one("[data-qa='price']")
+                or container_tag.select_one("[class*='price']")
+            )
+        price_text = price_node.get_text(" ", strip=True) if price_node else None
+        if price_text:
+            return extract_price_cop(price_text), "node"
+
+        # 3) Búsqueda cercana por regex de precio con $
+        neighbor_texts = ""
+        context_node = around_tag or container_tag
+        if context_node:
+            try:
+                neighbor_texts = " ".join(s.get_text(" ", strip=True) for s in context_node.find_all(limit=8))
+            except Exception:
+                neighbor_texts = context_node.get_text(" ", strip=True)
+        price_text = _regex_find_price_text(neighbor_texts)
+        if price_text:
+            return extract_price_cop(price_text), "regex"
+        return None, None
+
+    def extract_thumb(container_tag):
+        if not container_tag:
+            return None
+        img_tag = (
+            container_tag.select_one("picture img") or
+            container_tag.select_one("img")
+        )
+        if img_tag:
+            return img_tag.get("data-src") or img_tag.get("src")
+        return None
+
+    discards_duplicate = 0
+    discards_no_title_or_link = 0
+    discards_no_price = 0
+    sample_logged = 0
+    derived_link_count = 0
+
+    for a in anchors:
+        try:
+            container = find_container(a)
+            href = resolve_link(a, container) or ""
+            if not href:
+                discards_no_title_or_link += 1
+                continue
+            else:
+                derived_link_count += 1
+
+            if href in seen_links:
+                discards_duplicate += 1
+                continue
+            seen_links.add(href)
+
+            title = extract_title(a, container)
+            price_cop, price_method = extract_price(container, a)
+            thumbnail = extract_thumb(container)
+
+            if title and href and price_cop is not None:
+                items.append(
+                    {
+                        "title": title,
+                        "link": href,
+                        "price_cop": price_cop,
+                        "price_str": format_price_cop(price_cop),
+                        "thumbnail": thumbnail,
+                    }
+                )
+                sample_logged += 1
+            if len(items) >= max_items:
+                break
+        except Exception:
+            continue
+
+    # Contabilizar descartes por precio
+    for a in anchors:
+        # Nota: segunda pasada para contar no_precio si no estaba en seen_links
+        try:
+            href = a.get("href") or ""
+            if not href:
+                continue
+            if not href.startswith("http"):
+                href = f"https://www.falabella.com.co{href}"
+            if href in {it["link"] for it in items}:
+                continue
+            container = find_container(a)
+            price_val, _ = extract_price(container, a)
+            if price_val is None:
+                discards_no_price += 1
+        except Exception:
+            pass
+    return items
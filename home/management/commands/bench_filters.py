@@ -0,0 +1,76 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from home.filters import accessory_pattern, detect_category, filter_accessories, fold, get_filter_config
+
+BRANDS = ["Samsung", "Motorola", "Xiaomi", "Apple", "Lenovo", "HP", "LG", "TCL", "Honor", "Oppo"]
+PRODUCTS = ["Celular", "Smartphone", "Portátil", "Televisor", "Tablet", "Celular Galaxy", "Smart TV"]
+SPECS = ["128 GB", "256GB", "8GB RAM", "Dual SIM", "5G", "55 Pulgadas", "4K UHD", "Intel Core i5",
+         "Pantalla AMOLED", "Showcase Edition", "Batería 5000 mAh", "Negro", "Azul Ártico"]
+ACCESSORIES = ["Funda", "Fundas", "Protector de Pantalla", "Vidrio Templado", "Audífonos", "Cargador",
+               "Cable USB-C", "Soporte de Pared", "Power Bank", "Estuche", "Correa", "Control Remoto"]
+
+
+def make_titles(count: int, seed: int = 7) -> list[str]:
+    rnd = random.Random(seed)
+    titles = []
+    for i in range(count):
+        parts = [rnd.choice(PRODUCTS), rnd.choice(BRANDS), f"{rnd.choice('AGMXS')}{rnd.randint(10, 99)}"]
+        parts += rnd.sample(SPECS, 2)
+        if i % 4 == 0:
+            parts.insert(0, rnd.choice(ACCESSORIES) + " para")
+        titles.append(" ".join(parts))
+    return titles
+
+
+def substring_filter(titles: list[str], words: list[str]) -> list[str]:
+    # Técnica anterior: búsqueda de subcadena palabra por palabra
+    return [t for t in titles if not any(w in t.lower() for w in words)]
+
+
+class Command(BaseCommand):
+    help = "Compara el filtro de accesorios compilado con la búsqueda por subcadenas sobre títulos sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--titles", type=int, default=5000)
+        parser.add_argument("--iterations", type=int, default=10)
+        parser.add_argument("--query", default="celular samsung")
+
+    def handle(self, *args, **options):
+        titles = make_titles(options["titles"])
+        items = [{"title": t} for t in titles]
+        query = options["query"]
+        category = detect_category(query)
+        words = get_filter_config()["CATEGORIES"][category]
+        pattern = accessory_pattern(query)
+
+        timings = {"subcadena": [], "compilado": [], "compilado+consulta": []}
+        for _ in range(options["iterations"]):
+            started = time.perf_counter()
+            legacy = substring_filter(titles, words)
+            timings["subcadena"].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            compiled = [t for t in titles if not pattern.search(fold(t))] if pattern else titles
+            timings["compilado"].append(time.perf_counter() - started)
+
+            # Incluye construir el patrón de la consulta, como en cada búsqueda real
+            started = time.perf_counter()
+            filter_accessories(items, query)
+            timings["compilado+consulta"].append(time.perf_counter() - started)
+
+        self.stdout.write(f"consulta={query!r} categoría={category} títulos={len(titles)} términos={len(words)}")
+        for name, values in timings.items():
+            total_ms = statistics.median(values) * 1000
+            self.stdout.write(f"{name:<20} {total_ms:>8.2f} ms  {total_ms * 1000 / len(titles):>6.2f} µs/título")
+
+        only_legacy = sorted(set(compiled) - set(legacy))
+        self.stdout.write(
+            f"descartados: subcadena={len(titles) - len(legacy)} compilado={len(titles) - len(compiled)} "
+            f"(falsos positivos de la subcadena: {len(only_legacy)})"
+        )
+        for title in only_legacy[:5]:
+            self.stdout.write(f"  {title}")
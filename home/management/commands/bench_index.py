@@ -0,0 +1,90 @@
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from home.bench import save_results, summarize_ms
+from home.history import connect, write_batch
+from home.index import INDEX
+from home.management.commands.bench_filters import make_titles
+
+SOURCES = ["mercadolibre", "falabella"]
+QUERIES = ["celular samsung", "portatil lenovo intel core", "smart tv 4k", "xiaomi 128", "tablet azul artico",
+           "audifonos", "televisor lg 55 pulgadas", "motorola g54 negro"]
+
+
+class Command(BaseCommand):
+    help = ("Llena una base temporal con N productos sintéticos y mide el tamaño del índice local "
+            "y la latencia de sus consultas (p50/p95/p99).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--items", type=int, default=1_000_000)
+        parser.add_argument("--iterations", type=int, default=200, help="Consultas medidas por término.")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--path", help="Base a usar (por defecto un archivo temporal que se borra al final).")
+        parser.add_argument("--no-save", action="store_true")
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(options["path"] or Path(tmp) / "index.sqlite3")
+            with override_settings(PRICE_HISTORY={"ENABLED": True, "PATH": path},
+                                   SEARCH_INDEX={"ENABLED": True, "POOL_SIZE": 2}):
+                try:
+                    self._run(path, options)
+                finally:
+                    INDEX.close()
+
+    def _run(self, path: Path, options: dict):
+        count = options["items"]
+        conn = connect(path)
+        existing = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+        build_seconds = 0.0
+        if existing < count:
+            # Misma escritura que el hilo del histórico: lotes con upsert y triggers de FTS
+            rnd = random.Random(11)
+            titles = make_titles(50_000)
+            now = int(time.time())
+            started = time.perf_counter()
+            for offset in range(existing, count, 5000):
+                rows = [
+                    (SOURCES[i % 2], f"https://example.com/p/{i}", titles[i % len(titles)],
+                     rnd.randint(50, 9000) * 1000, now - rnd.randint(0, 3600), None)
+                    for i in range(offset, min(count, offset + 5000))
+                ]
+                write_batch(conn, rows)
+            build_seconds = time.perf_counter() - started
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+
+        size = INDEX.size()
+        self.stdout.write(
+            f"productos={size['products']}  base={size['bytes'] / 2**20:.1f} MiB"
+            + (f"  construcción={build_seconds:.1f} s ({(count - existing) / build_seconds:,.0f} items/s)"
+               if build_seconds else "")
+        )
+
+        latencies = {}
+        for query in QUERIES:
+            timings, rows = [], 0
+            for i in range(options["iterations"]):
+                started = time.perf_counter()
+                rows = len(INDEX.search(SOURCES[i % 2], query, options["limit"], max_age=7200))
+                timings.append(time.perf_counter() - started)
+            latencies[query] = {**summarize_ms(timings), "rows": rows}
+            summary = latencies[query]
+            self.stdout.write(f"{query:<28} p50={summary['p50_ms']:>7.3f} ms  p95={summary['p95_ms']:>7.3f} ms  "
+                              f"p99={summary['p99_ms']:>7.3f} ms  filas={rows}")
+
+        if not options["no_save"]:
+            saved = save_results("index", {
+                "items": size["products"],
+                "db_bytes": size["bytes"],
+                "build_seconds": round(build_seconds, 2),
+                "limit": options["limit"],
+                "iterations": options["iterations"],
+                "queries": latencies,
+            })
+            self.stdout.write(self.style.SUCCESS(f"Resultados guardados en {saved}"))
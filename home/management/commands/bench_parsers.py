@@ -0,0 +1,121 @@
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import service
+from home.parsers import RESTRICTED_BACKENDS, available_backends, make_soup
+
+from ._falabella_legacy import legacy_parse_falabella_cards
+
+PAGES_DIR = Path(__file__).resolve().parents[2] / "testdata" / "pages"
+
+
+def extract_mercadolibre(soup, max_items: int) -> list[dict]:
+    anchors = service._select_basic_title_anchors(soup)
+    return service._collect_items_from_anchors(anchors, max_items)
+
+
+def extract_falabella(soup, max_items: int) -> list[dict]:
+    # Misma cadena de fallbacks que process_search_falabella
+    return service.extract_falabella_items(soup, max_items)
+
+
+EXTRACTORS = {
+    "mercadolibre": extract_mercadolibre,
+    "falabella": extract_falabella,
+}
+
+
+class Command(BaseCommand):
+    help = "Mide el tiempo de parseo por página para cada backend HTML sobre las páginas guardadas en testdata."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", action="append", dest="backends",
+                            help="Backend a medir (repetible). Por defecto, todos los instalados.")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--max-items", type=int, default=48)
+        parser.add_argument("--pages", default=str(PAGES_DIR), help="Directorio con las páginas .html")
+        parser.add_argument("--no-region", action="store_true",
+                            help="No medir el parseo restringido a la región de productos.")
+
+    def handle(self, *args, **options):
+        backends = options["backends"] or available_backends()
+        missing = set(backends) - set(available_backends())
+        if missing:
+            raise CommandError(f"Backends no disponibles: {', '.join(sorted(missing))}")
+        pages = sorted(Path(options["pages"]).glob("*.html"))
+        if not pages:
+            raise CommandError(f"No hay páginas en {options['pages']}")
+
+        header = (f"{'página':<32} {'backend':<12} {'modo':<7} {'KB':>6} {'parse ms':>9} "
+                  f"{'extract ms':>11} {'total ms':>9} {'pico KB':>8} {'items':>6}")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for page in pages:
+            source = page.stem.split("_")[0]
+            extractor = EXTRACTORS.get(source)
+            if extractor is None:
+                continue
+            html = page.read_text(encoding="utf-8")
+            modes = [("página", None)]
+            if not options["no_region"] and service.PARSE_REGIONS.get(source):
+                modes.append(("región", service.PARSE_REGIONS[source]))
+            for backend in backends:
+                for mode, region in modes:
+                    if region and backend not in RESTRICTED_BACKENDS:
+                        continue
+                    parse_times, extract_times = [], []
+                    items: list[dict] = []
+                    for _ in range(options["iterations"]):
+                        started = time.perf_counter()
+                        soup = make_soup(html, backend, region=region)
+                        parsed = time.perf_counter()
+                        items = extractor(soup, options["max_items"])
+                        parse_times.append(parsed - started)
+                        extract_times.append(time.perf_counter() - parsed)
+                    parse_ms = statistics.median(parse_times) * 1000
+                    extract_ms = statistics.median(extract_times) * 1000
+                    peak_kb = self._peak_memory(html, backend, region, extractor, options["max_items"]) / 1024
+                    self.stdout.write(
+                        f"{page.name:<32} {backend:<12} {mode:<7} {len(html) / 1024:>6.0f} {parse_ms:>9.1f} "
+                        f"{extract_ms:>11.1f} {parse_ms + extract_ms:>9.1f} {peak_kb:>8.0f} {len(items):>6}"
+                    )
+            if source == "falabella":
+                # Desglose de descartes del extractor de tarjetas sobre la misma página
+                card_stats: dict = {}
+                service.parse_falabella_cards(make_soup(html, backends[0]), options["max_items"], stats=card_stats)
+                summary = ", ".join(f"{k}={v}" for k, v in card_stats.items())
+                self.stdout.write(f"{'':<32} tarjetas: {summary}")
+                for backend in backends if card_stats["cards"] else []:
+                    self._compare_card_extractors(html, backend, options["iterations"], options["max_items"])
+
+    def _compare_card_extractors(self, html: str, backend: str, iterations: int, max_items: int) -> None:
+        # Extractor de tarjetas anterior frente al actual sobre el mismo soup (sin contar el parseo)
+        soup = make_soup(html, backend)
+        timings = {}
+        for label, extract in (("anterior", legacy_parse_falabella_cards), ("actual", service.parse_falabella_cards)):
+            runs = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                items = extract(soup, max_items)
+                runs.append(time.perf_counter() - started)
+            timings[label] = (statistics.median(runs) * 1000, len(items))
+        (old_ms, old_items), (new_ms, new_items) = timings["anterior"], timings["actual"]
+        self.stdout.write(
+            f"{'':<32} {backend:<12} tarjetas anterior {old_ms:.1f} ms ({old_items} items) -> "
+            f"actual {new_ms:.1f} ms ({new_items} items), x{old_ms / new_ms if new_ms else 0:.1f}"
+        )
+
+    @staticmethod
+    def _peak_memory(html: str, backend: str, region, extractor, max_items: int) -> int:
+        # Pico de memoria Python de un parseo + extracción (selectolax reserva en C y no aparece completo)
+        tracemalloc.start()
+        try:
+            soup = make_soup(html, backend, region=region)
+            extractor(soup, max_items)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
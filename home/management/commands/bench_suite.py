@@ -0,0 +1,144 @@
+import time
+import tracemalloc
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from home import service
+from home.bench import load_results, save_results, summarize_ms
+from home.parsers import available_backends, get_parser_backend, make_soup
+
+PAGES_DIR = Path(__file__).resolve().parents[2] / "testdata" / "pages"
+
+
+def _ml_anchors(soup, max_items: int) -> list[dict]:
+    return service._collect_items_from_anchors(service._select_basic_title_anchors(soup), max_items)
+
+
+def _fb_generic(soup, max_items: int) -> list[dict]:
+    return service.parse_generic_by_regex_domain(soup, domain_substring="falabella.com.co", max_items=max_items)
+
+
+# Extractores que se miden sobre cada página, según el prefijo del archivo
+PARSERS = {
+    "mercadolibre": {
+        "_collect_items_from_anchors": _ml_anchors,
+        "parse_mercadolibre_results": service.parse_mercadolibre_results,
+        "parse_json_ld": service.parse_json_ld,
+        "parse_generic_by_regex": service.parse_generic_by_regex,
+    },
+    "falabella": {
+        "parse_falabella_cards": service.parse_falabella_cards,
+        "parse_next_data_products": service.parse_next_data_products,
+        "parse_json_ld": service.parse_json_ld,
+        "parse_generic_by_regex_domain": _fb_generic,
+    },
+}
+
+
+def _peak_bytes(fn, *args) -> int:
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = (
+        "Suite de benchmarks offline de los extractores sobre las páginas grabadas en testdata: "
+        "percentiles de latencia, items extraídos y pico de memoria. Guarda los resultados para comparar corridas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backend", default=None, help="Backend HTML (por defecto, el de settings).")
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--max-items", type=int, default=48)
+        parser.add_argument("--pages", default=str(PAGES_DIR), help="Directorio con las páginas .html")
+        parser.add_argument("--parser", action="append", dest="parsers", help="Limitar a estos extractores (repetible).")
+        parser.add_argument("--compare", default=None,
+                            help='JSON de una corrida anterior, o "latest", para mostrar diferencias.')
+        parser.add_argument("--threshold", type=float, default=0.25,
+                            help="Aumento relativo del p50 que se marca como regresión (0.25 = 25%%).")
+        parser.add_argument("--results-dir", default=None)
+        parser.add_argument("--no-save", action="store_true")
+
+    def handle(self, *args, **options):
+        backend = options["backend"] or get_parser_backend()
+        if backend not in available_backends():
+            raise CommandError(f"Backend no disponible: {backend}")
+        pages = sorted(Path(options["pages"]).glob("*.html"))
+        if not pages:
+            raise CommandError(f"No hay páginas en {options['pages']}")
+        # Se lee antes de guardar para que "latest" no apunte a la corrida actual
+        previous = None
+        if options["compare"]:
+            previous = load_results("parsers", options["compare"], options["results_dir"])
+            if previous is None:
+                raise CommandError(f"No se encontró la corrida {options['compare']}")
+
+        rows = []
+        for page in pages:
+            parsers = PARSERS.get(page.stem.split("_")[0])
+            if not parsers:
+                continue
+            html = page.read_text(encoding="utf-8")
+            rows.append(self._measure(page.name, "make_soup", lambda: make_soup(html, backend),
+                                      options["iterations"], counts_items=False))
+            soup = make_soup(html, backend)
+            for name, fn in parsers.items():
+                if options["parsers"] and name not in options["parsers"]:
+                    continue
+                rows.append(self._measure(page.name, name, lambda: fn(soup, options["max_items"]),
+                                          options["iterations"]))
+
+        self._print(rows, previous, options["threshold"])
+        if not options["no_save"]:
+            path = save_results("parsers", {
+                "backend": backend, "iterations": options["iterations"],
+                "max_items": options["max_items"], "rows": rows,
+            }, options["results_dir"])
+            self.stdout.write(f"\nResultados guardados en {path}")
+
+    @staticmethod
+    def _measure(page: str, parser: str, call, iterations: int, counts_items: bool = True) -> dict:
+        times = []
+        result = None
+        for _ in range(iterations):
+            started = time.perf_counter()
+            result = call()
+            times.append(time.perf_counter() - started)
+        return {
+            "page": page,
+            "parser": parser,
+            **summarize_ms(times),
+            "items": len(result) if counts_items else None,
+            "peak_kb": round(_peak_bytes(call) / 1024, 1),
+        }
+
+    def _print(self, rows: list[dict], previous: dict | None, threshold: float) -> None:
+        before = {(r["page"], r["parser"]): r for r in (previous or {}).get("rows", [])}
+        header = (f"{'página':<28} {'extractor':<30} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                  f"{'items':>6} {'pico KB':>8}")
+        if previous:
+            header += f" {'Δp50':>8} {'Δitems':>7}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        regressions = []
+        for row in rows:
+            items = "-" if row["items"] is None else row["items"]
+            line = (f"{row['page']:<28} {row['parser']:<30} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                    f"{row['p99_ms']:>8.2f} {items:>6} {row['peak_kb']:>8.0f}")
+            old = before.get((row["page"], row["parser"]))
+            if previous and old:
+                delta = (row["p50_ms"] - old["p50_ms"]) / old["p50_ms"] if old["p50_ms"] else 0.0
+                items_delta = (row["items"] or 0) - (old["items"] or 0)
+                line += f" {delta:>+8.0%} {items_delta:>+7d}"
+                if delta > threshold or items_delta:
+                    regressions.append((row, delta, items_delta))
+            self.stdout.write(line)
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"\nCambios respecto a la corrida anterior ({len(regressions)}):"))
+            for row, delta, items_delta in regressions:
+                self.stdout.write(f"  {row['page']} / {row['parser']}: p50 {delta:+.0%}, items {items_delta:+d}")
@@ -0,0 +1,179 @@
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from home.bench import save_results
+from home.history import HISTORY
+from home.loadtest import (
+    StandInMarketplace,
+    base_url_overrides,
+    make_queries,
+    run_against_target,
+    run_in_process,
+    saturation_point,
+    summarize_level,
+)
+from home.prewarm import PREWARMER, get_prewarm_config
+
+DEFAULT_QUERIES = ["celular samsung", "iphone 15", "portatil lenovo", "televisor 55", "audifonos sony", "motorola g84"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de la vista home contra un servidor local que imita a los marketplaces "
+        "con las páginas de testdata. Reporta throughput, p50/p95/p99 y el punto de saturación."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,2,4,8,16",
+                            help="Usuarios simultáneos por nivel, separados por comas.")
+        parser.add_argument("--requests", type=int, default=40, help="POST por nivel de concurrencia.")
+        parser.add_argument("--target", default=None,
+                            help="URL de un servidor ya arrancado (p. ej. gunicorn). Sin esto se prueba en proceso.")
+        parser.add_argument("--queries", default=",".join(DEFAULT_QUERIES))
+        parser.add_argument("--warm-cache", action="store_true",
+                            help="Repetir consultas (caché de resultados caliente). Por defecto cada POST es único.")
+        # Servidor local
+        parser.add_argument("--stub-host", default="127.0.0.1")
+        parser.add_argument("--stub-port", type=int, default=0)
+        parser.add_argument("--latency", type=float, default=0.3, help="Latencia media del marketplace (s).")
+        parser.add_argument("--jitter", type=float, default=0.1, help="Desviación de la latencia (s).")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 5xx.")
+        parser.add_argument("--captcha-rate", type=float, default=0.0, help="Fracción de páginas de captcha.")
+        parser.add_argument("--serve-only", action="store_true",
+                            help="Solo arrancar el servidor local (para apuntar un gunicorn externo).")
+        parser.add_argument("--max-error-rate", type=float, default=0.0,
+                            help="Fracción de respuestas con error (4xx/5xx o sin respuesta) tolerada por nivel; "
+                                 "por encima el comando termina con error.")
+        parser.add_argument("--results-dir", default=None)
+        parser.add_argument("--no-save", action="store_true")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(c) for c in options["concurrency"].split(",") if c.strip()]
+        except ValueError:
+            raise CommandError("--concurrency debe ser una lista de enteros, p. ej. 1,4,16")
+        queries = [q.strip() for q in options["queries"].split(",") if q.strip()]
+
+        stand_in = StandInMarketplace(
+            host=options["stub_host"], port=options["stub_port"], latency=options["latency"],
+            jitter=options["jitter"], error_rate=options["error_rate"], captcha_rate=options["captcha_rate"],
+        ).start()
+        self.stdout.write(f"Servidor local en {stand_in.url}")
+        try:
+            if options["serve_only"]:
+                self._serve_forever(stand_in)
+                return
+            results = self._run_levels(stand_in, levels, queries, options)
+        finally:
+            stand_in.stop()
+
+        self._print(results)
+        if not options["no_save"]:
+            path = save_results("loadtest", {
+                "target": options["target"] or "in-process",
+                "stand_in": {k: options[k] for k in ("latency", "jitter", "error_rate", "captcha_rate")},
+                "warm_cache": options["warm_cache"],
+                **results,
+            }, options["results_dir"])
+            self.stdout.write(f"\nResultados guardados en {path}")
+        self._check_errors(results, options["max_error_rate"])
+
+    def _serve_forever(self, stand_in: StandInMarketplace) -> None:
+        url = stand_in.url
+        self.stdout.write("Arranca el servidor a probar con estas variables y lanza `loadtest --target ...`:")
+        for var in ("SCRAPER_ML_BASE_URL", "SCRAPER_ML_LISTADO_URL", "SCRAPER_ML_API_URL", "SCRAPER_FALABELLA_BASE_URL"):
+            self.stdout.write(f"  export {var}={url}")
+        self.stdout.write("  export GLOBAL_RATELIMIT_RATE=100000/m")
+        self.stdout.write("  export RATELIMIT_SEARCH_CACHED=100000/m RATELIMIT_SEARCH_COLD=100000/m")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+    def _run_levels(self, stand_in: StandInMarketplace, levels: list[int], queries: list[str], options) -> dict:
+        results = []
+        data_dir = tempfile.TemporaryDirectory(prefix="loadtest-")
+        path = Path(data_dir.name)
+        # En proceso: las fuentes apuntan al servidor local y los rate limits no intervienen.
+        # El histórico (y con él el índice local, que vive en la misma base), el registro de
+        # precalentamiento y la caché compartida van a un directorio temporal: lo scrapeado
+        # del servidor de prueba no debe quedar en los datos reales
+        overrides = override_settings(
+            SCRAPER_BASE_URLS=base_url_overrides(stand_in.url),
+            GLOBAL_RATELIMIT_RATE="1000000/m",
+            RATELIMIT_RULES={"search_cached": "1000000/m", "search_cold": "1000000/m"},
+            ALLOWED_HOSTS=["testserver", "localhost", "127.0.0.1"],
+            PRICE_HISTORY={**settings.PRICE_HISTORY, "PATH": path / "price_history.sqlite3"},
+            PREWARM={**settings.PREWARM, "PATH": path / "search_log.sqlite3"},
+            CACHES={**settings.CACHES, "search": {**settings.CACHES["search"], "LOCATION": str(path / "search-cache")}},
+        )
+        with data_dir, overrides:
+            try:
+                for concurrency in levels:
+                    batch = make_queries(queries, options["requests"], cold=not options["warm_cache"])
+                    stand_in.reset_peak()
+                    before = stand_in.stats()
+                    if options["target"]:
+                        samples, elapsed = run_against_target(options["target"], batch, concurrency)
+                    else:
+                        samples, elapsed = asyncio.run(run_in_process(batch, concurrency))
+                    after = stand_in.stats()
+                    level = summarize_level(concurrency, samples, elapsed, {
+                        "upstream_requests": after["requests"] - before["requests"],
+                        # Peticiones simultáneas que llegaron al marketplace: si no crece con los
+                        # usuarios, los workers/hilos de scraping son el cuello de botella
+                        "upstream_max_in_flight": after["max_in_flight"],
+                    })
+                    results.append(level)
+                    self.stdout.write(
+                        f"  c={concurrency}: {level['throughput_rps']} req/s, p95 {level['p95_ms']:.0f} ms"
+                        + (f", {level['errors']} errores" if level["errors"] else "")
+                    )
+            finally:
+                # Lo encolado se escribe mientras las rutas siguen en el directorio temporal
+                HISTORY.flush()
+                if get_prewarm_config()["ENABLED"]:
+                    PREWARMER.flush()
+        return {"levels": results, "saturation": saturation_point(results)}
+
+    def _print(self, results: dict) -> None:
+        header = (f"{'usuarios':>8} {'req':>5} {'errores':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+                  f"{'upstream':>9} {'en vuelo':>9}  estados")
+        self.stdout.write("")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for level in results["levels"]:
+            statuses = " ".join(f"{k}:{v}" for k, v in level["statuses"].items())
+            self.stdout.write(
+                f"{level['concurrency']:>8} {level['requests']:>5} {level['errors']:>8} {level['throughput_rps']:>8.2f} "
+                f"{level['p50_ms']:>9.0f} {level['p95_ms']:>9.0f} {level['p99_ms']:>9.0f} "
+                f"{level['upstream_requests']:>9} {level['upstream_max_in_flight']:>9}  {statuses}"
+            )
+        saturation = results["saturation"]
+        if saturation:
+            self.stdout.write(self.style.WARNING(
+                f"\nSaturación desde ~{saturation['concurrency']} usuarios simultáneos "
+                f"({saturation['throughput_rps']} req/s; el siguiente nivel solo sumó {saturation['next_gain']:+.0%})."
+            ))
+        else:
+            self.stdout.write("\nSin saturación en los niveles probados: el throughput siguió creciendo.")
+        self.stdout.write("Throughput y latencias cuentan solo las respuestas correctas (2xx/3xx).")
+
+    def _check_errors(self, results: dict, max_error_rate: float) -> None:
+        failing = [level for level in results["levels"] if level["error_rate"] > max_error_rate]
+        if not failing:
+            return
+        for level in failing:
+            self.stderr.write(self.style.ERROR(
+                f"c={level['concurrency']}: {level['errors']}/{level['requests']} respuestas con error "
+                f"({level['error_rate']:.1%}); estados {level['statuses']}"
+            ))
+        raise CommandError(f"Tasa de errores por encima de --max-error-rate={max_error_rate:g}: "
+                           "los números de throughput no son comparables.")
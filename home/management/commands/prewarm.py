@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from home.prewarm import PREWARMER, get_prewarm_config
+
+
+class Command(BaseCommand):
+    help = ("Muestra las consultas más populares del registro de búsquedas (PREWARM) y, con --run, "
+            "ejecuta ahora una ronda de precalentamiento en este proceso.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=20, help="Consultas a listar.")
+        parser.add_argument("--run", action="store_true", help="Ejecuta una ronda aunque PREWARM esté desactivado.")
+
+    def handle(self, *args, **options):
+        config = get_prewarm_config()
+        if not config["ENABLED"]:
+            self.stderr.write(self.style.WARNING("PREWARM está desactivado: las búsquedas no se están registrando."))
+        for entry in PREWARMER.top_queries(config, limit=options["top"]):
+            self.stdout.write(f"{entry['score']:>8.2f}  {entry['searches']:>6}  {entry['query']}")
+        if options["run"]:
+            outcomes = PREWARMER.run_round(config)
+            summary = ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items())) or "nada que precalentar"
+            self.stdout.write(self.style.SUCCESS(f"Ronda terminada: {summary}"))
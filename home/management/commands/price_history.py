@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from home.history import HISTORY, lowest_price, price_history
+from home.service import format_price_cop
+
+
+class Command(BaseCommand):
+    help = "Muestra el histórico de precios guardado de un producto y su precio más bajo en los últimos N días."
+
+    def add_arguments(self, parser):
+        parser.add_argument("link", help="URL del producto tal como la devolvió el scraper.")
+        parser.add_argument("--days", type=float, default=30)
+
+    def handle(self, *args, **options):
+        HISTORY.flush()
+        points = price_history(options["link"], options["days"])
+        lowest = lowest_price(options["link"], options["days"])
+        if lowest is None:
+            self.stdout.write("Sin datos para ese link en el periodo.")
+            return
+        self.stdout.write(f"{lowest['title']} ({lowest['source']})")
+        for point in points:
+            when = datetime.fromtimestamp(point["seen_at"]).strftime("%Y-%m-%d %H:%M")
+            self.stdout.write(f"  {when}  {format_price_cop(point['price_cop'])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Más bajo en {options['days']:g} días: {format_price_cop(lowest['price_cop'])}"
+        ))
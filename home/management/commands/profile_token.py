@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from home.profiling import get_profiling_config, make_token
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un token firmado para perfilar una búsqueda concreta (REQUEST_PROFILING). "
+        "Envíalo en la cabecera configurada o en el parámetro de consulta."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("label", help="Quién pide el perfil (queda en el manifest).")
+
+    def handle(self, *args, **options):
+        config = get_profiling_config()
+        token = make_token(options["label"])
+        if not config["ENABLED"]:
+            self.stderr.write(self.style.WARNING(
+                "REQUEST_PROFILING está desactivado: el token no tendrá efecto hasta activarlo."
+            ))
+        self.stdout.write(token)
+        self.stdout.write(
+            f"\nVálido {config['MAX_AGE']} s. Ejemplo:\n"
+            f"  curl -H '{config['HEADER']}: {token}' -d search_item=... <url>/\n"
+            f"  o bien POST a <url>/?{config['QUERY_PARAM']}={token}\n"
+            f"Resultados en {config['DIR']}"
+        )
@@ -0,0 +1,242 @@
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# Límites (s) de los histogramas de tiempo y de cantidad de items
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+ITEMS_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+BYTES_BUCKETS = (10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000, 5_000_000)
+
+# Ejecución de scraper en curso en este hilo / tarea (ver scraper_run)
+_current_run: contextvars.ContextVar[dict | None] = contextvars.ContextVar("scraper_run", default=None)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    # Percentil con interpolación lineal (pct entre 0 y 100)
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    if low == high:
+        return ordered[low]
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _label_key(labels: dict | None) -> tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: tuple, extra: tuple = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Contadores e histogramas del proceso, agregados por etiquetas y exportables en
+    el formato de texto de Prometheus. Cada worker expone solo lo suyo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, dict]] = {}
+        self._buckets: dict[str, tuple] = {}
+        self._help: dict[str, str] = {}
+        self._collectors: list = []
+
+    def describe(self, name: str, help_text: str, buckets: tuple | None = None) -> None:
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = buckets
+
+    def inc(self, name: str, labels: dict | None = None, value: float = 1) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: dict | None = None) -> None:
+        key = _label_key(labels)
+        buckets = self._buckets.get(name, SECONDS_BUCKETS)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {"counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist["counts"][i] += 1
+                    break
+            hist["sum"] += value
+            hist["count"] += 1
+
+    def register_collector(self, collector) -> None:
+        # `collector()` devuelve [(nombre, tipo, etiquetas, valor)] calculados al exportar
+        self._collectors.append(collector)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": {n: {k: v for k, v in s.items()} for n, s in self._counters.items()},
+                "histograms": {
+                    n: {k: {"count": h["count"], "sum": h["sum"]} for k, h in s.items()}
+                    for n, s in self._histograms.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        lines: list[str] = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            histograms = {n: {k: {**h, "counts": list(h["counts"])} for k, h in s.items()}
+                          for n, s in self._histograms.items()}
+        for name in sorted(counters):
+            self._header(lines, name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for name in sorted(histograms):
+            self._header(lines, name, "histogram")
+            buckets = self._buckets.get(name, SECONDS_BUCKETS)
+            for key, hist in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, count in zip(buckets, hist["counts"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {hist['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {hist['sum']:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {hist['count']}")
+        seen: set[str] = set()
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception:
+                continue
+            for name, kind, labels, value in samples:
+                if name not in seen:
+                    self._header(lines, name, kind)
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: list[str], name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+METRICS = MetricsRegistry()
+METRICS.describe("scraper_runs_total", "Ejecuciones de scraper por fuente y resultado (ok, empty, error).")
+METRICS.describe("scraper_duration_seconds", "Duración total de una ejecución de scraper.")
+METRICS.describe("scraper_phase_seconds", "Tiempo por fase: politeness, fetch, decompress, parse, extract.")
+METRICS.describe("scraper_bytes", "Bytes descargados por ejecución.", BYTES_BUCKETS)
+METRICS.describe("scraper_items", "Items devueltos por ejecución.", ITEMS_BUCKETS)
+METRICS.describe("scraper_parser_total", "Backend HTML y extractor que produjeron los items.")
+METRICS.describe("scraper_errors_total", "Errores por fuente y clase.")
+METRICS.describe("search_cache_total", "Consultas a la caché de resultados por fuente y estado.")
+METRICS.describe("search_duration_seconds", "Latencia de una búsqueda agregada completa.")
+
+
+@contextlib.contextmanager
+def scraper_run(source: str):
+    """
+    Mide una ejecución de scraper. Las fases, bytes, parser y errores que se
+    registren dentro (también desde otros módulos) se asocian a `source`.
+    """
+    run = {"phases": {}, "bytes": 0, "backend": None, "extractor": None, "error_class": None}
+    token = _current_run.set(run)
+    started = time.perf_counter()
+    try:
+        yield run
+    except BaseException as exc:
+        run["error_class"] = run["error_class"] or type(exc).__name__
+        raise
+    finally:
+        _current_run.reset(token)
+        _finish_run(source, run, time.perf_counter() - started)
+
+
+def _finish_run(source: str, run: dict, elapsed: float) -> None:
+    labels = {"source": source}
+    METRICS.observe("scraper_duration_seconds", elapsed, labels)
+    for phase_name, seconds in run["phases"].items():
+        METRICS.observe("scraper_phase_seconds", seconds, {"source": source, "phase": phase_name})
+    if run["bytes"]:
+        METRICS.observe("scraper_bytes", run["bytes"], labels)
+    items = run.get("items")
+    if items is not None:
+        METRICS.observe("scraper_items", items, labels)
+    if run["backend"] or run["extractor"]:
+        METRICS.inc("scraper_parser_total", {
+            "source": source, "backend": run["backend"] or "", "extractor": run["extractor"] or "",
+        })
+    if run["error_class"]:
+        METRICS.inc("scraper_errors_total", {"source": source, "error_class": run["error_class"]})
+        outcome = "error"
+    else:
+        outcome = "ok" if items else "empty"
+    METRICS.inc("scraper_runs_total", {"source": source, "outcome": outcome})
+
+
+@contextlib.contextmanager
+def phase(name: str):
+    # Suma el tiempo del bloque a la fase `name` de la ejecución en curso (si la hay)
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        run["phases"][name] = run["phases"].get(name, 0.0) + time.perf_counter() - started
+
+
+def add_phase(name: str, seconds: float) -> None:
+    run = _current_run.get()
+    if run is not None and seconds:
+        run["phases"][name] = run["phases"].get(name, 0.0) + seconds
+
+
+def add_bytes(count: int) -> None:
+    run = _current_run.get()
+    if run is not None:
+        run["bytes"] += count
+
+
+def record_parser(backend: str | None = None, extractor: str | None = None) -> None:
+    # Backend HTML con el que se construyó el árbol y extractor (o fallback) que dio los items
+    run = _current_run.get()
+    if run is None:
+        return
+    if backend:
+        run["backend"] = backend
+    if extractor:
+        run["extractor"] = extractor
+
+
+def record_error(error) -> None:
+    # Acepta una excepción o un nombre de clase ("Blocked", "HTTPError"...)
+    run = _current_run.get()
+    if run is not None and run["error_class"] is None:
+        run["error_class"] = error if isinstance(error, str) else type(error).__name__
+
+
+def record_items(count: int) -> None:
+    run = _current_run.get()
+    if run is not None:
+        run["items"] = count
@@ -0,0 +1,283 @@
+import logging
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+try:
+    from selectolax.lexbor import LexborHTMLParser  # type: ignore
+except Exception:  # pragma: no cover - dependencia opcional
+    LexborHTMLParser = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARSER_BACKEND = "html.parser"
+# Backends de BeautifulSoup más el motor CSS nativo de selectolax (lexbor)
+PARSER_BACKENDS = ("html.parser", "lxml", "html5lib", "selectolax")
+# Backends que aceptan parse_only (SoupStrainer) para construir solo una región
+RESTRICTED_BACKENDS = ("html.parser", "lxml")
+
+
+def get_parser_backend() -> str:
+    try:
+        from django.conf import settings
+        return getattr(settings, "SCRAPER_HTML_PARSER", DEFAULT_PARSER_BACKEND) or DEFAULT_PARSER_BACKEND
+    except Exception:
+        return DEFAULT_PARSER_BACKEND
+
+
+def available_backends() -> list[str]:
+    available = ["html.parser"]
+    for backend, module in (("lxml", "lxml"), ("html5lib", "html5lib")):
+        try:
+            __import__(module)
+            available.append(backend)
+        except Exception:
+            pass
+    if LexborHTMLParser is not None:
+        available.append("selectolax")
+    return available
+
+
+def restricted_parse_enabled() -> bool:
+    try:
+        from django.conf import settings
+        return bool(getattr(settings, "SCRAPER_RESTRICTED_PARSE", True))
+    except Exception:
+        return True
+
+
+def region_strainer(region: dict) -> SoupStrainer:
+    """
+    Convierte la definición de región de una fuente en un SoupStrainer. Solo se
+    construye el árbol de las etiquetas que cumplan alguno de estos criterios:
+      ids:     valor exacto del atributo id
+      classes: alguna clase exacta del elemento
+      attrs:   presencia del atributo (p. ej. data-pod)
+      scripts: <script> con ese type, o con id __NEXT_DATA__
+    """
+    ids = set(region.get("ids", ()))
+    classes = set(region.get("classes", ()))
+    attrs = tuple(region.get("attrs", ()))
+    script_types = set(region.get("scripts", ()))
+
+    def match(name, tag_attrs) -> bool:
+        tag_attrs = tag_attrs or {}
+        if name == "script":
+            return tag_attrs.get("id") == "__NEXT_DATA__" or tag_attrs.get("type") in script_types
+        if ids and tag_attrs.get("id") in ids:
+            return True
+        if classes:
+            value = tag_attrs.get("class") or ""
+            tokens = value.split() if isinstance(value, str) else value
+            if classes.intersection(tokens):
+                return True
+        return any(a in tag_attrs for a in attrs)
+
+    return SoupStrainer(match)
+
+
+def make_soup(html: str, backend: str | None = None, region: dict | None = None):
+    """
+    Construye el árbol del documento con el backend pedido (o el de settings).
+    Todos los backends exponen la API de BeautifulSoup que usan los selectores
+    (select, select_one, find, find_all, find_parent, get, get_text...).
+    Con `region` solo se construye el árbol de la zona de productos y de los
+    scripts de datos (html.parser y lxml; html5lib y selectolax parsean todo).
+    """
+    backend = backend or get_parser_backend()
+    if backend == "selectolax":
+        if LexborHTMLParser is None:
+            raise ValueError("selectolax no está instalado")
+        return SelectolaxNode.document(html)
+    if region and backend in RESTRICTED_BACKENDS:
+        return BeautifulSoup(html, backend, parse_only=region_strainer(region))
+    return BeautifulSoup(html, backend)
+
+
+def make_soup_with_fallback(html: str, backend: str | None = None, region: dict | None = None):
+    # Prueba el backend configurado y, si falla, el resto en orden
+    preferred = backend or get_parser_backend()
+    order = [preferred] + [b for b in ("html.parser", "lxml", "html5lib") if b != preferred]
+    last_exc: Exception | None = None
+    for name in order:
+        try:
+            return make_soup(html, name, region=region)
+        except Exception as exc:
+            last_exc = exc
+    raise last_exc
+
+
+def soup_backend(soup) -> str:
+    # Nombre del backend que construyó el árbol (para métricas)
+    if isinstance(soup, SelectolaxNode):
+        return "selectolax"
+    builder = getattr(soup, "builder", None)
+    return getattr(builder, "NAME", None) or "unknown"
+
+
+def node_identity(node) -> int:
+    # Identidad del nodo para deduplicar: las Tag de bs4 se comparan y hashean por contenido
+    if isinstance(node, SelectolaxNode):
+        return node._node.mem_id
+    return id(node)
+
+
+def _css_attr_value(value: str) -> str:
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+class SelectolaxNode:
+    """
+    Adaptador mínimo de un nodo de selectolax a la API de BeautifulSoup que usan
+    los extractores de home.service. Solo cubre lo que esos extractores necesitan.
+    """
+
+    __slots__ = ("_node",)
+
+    def __init__(self, node):
+        self._node = node
+
+    @classmethod
+    def document(cls, html: str) -> "SelectolaxNode":
+        return cls(LexborHTMLParser(html).root)
+
+    @staticmethod
+    def _wrap(node) -> "SelectolaxNode | None":
+        if node is None or not node.is_element_node:
+            return None
+        return SelectolaxNode(node)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SelectolaxNode) and self._node.mem_id == other._node.mem_id
+
+    def __hash__(self) -> int:
+        return self._node.mem_id
+
+    def __repr__(self) -> str:
+        return f"<SelectolaxNode {self._node.tag}>"
+
+    # Atributos
+    @property
+    def name(self) -> str:
+        return self._node.tag
+
+    @property
+    def attrs(self) -> dict:
+        attrs = dict(self._node.attributes)
+        if "class" in attrs:
+            # BeautifulSoup trata class como atributo multivalor
+            attrs["class"] = (attrs["class"] or "").split()
+        return attrs
+
+    def get(self, key: str, default=None):
+        value = self._node.attributes.get(key, default)
+        if key == "class" and isinstance(value, str):
+            return value.split()
+        return value
+
+    def has_attr(self, key: str) -> bool:
+        return key in self._node.attributes
+
+    # Texto
+    def get_text(self, separator: str = "", strip: bool = False) -> str:
+        parts = []
+        for node in self._node.traverse(include_text=True):
+            if not node.is_text_node:
+                continue
+            text = node.text_content or ""
+            if strip:
+                text = text.strip()
+                if not text:
+                    continue
+            parts.append(text)
+        return separator.join(parts)
+
+    @property
+    def string(self) -> str | None:
+        child = self._node.child
+        if child is not None and child.is_text_node and child.next is None:
+            return child.text_content
+        return None
+
+    # Navegación
+    @property
+    def parent(self) -> "SelectolaxNode | None":
+        return self._wrap(self._node.parent)
+
+    def select(self, selector: str) -> list["SelectolaxNode"]:
+        return [SelectolaxNode(n) for n in self._node.css(selector)]
+
+    def select_one(self, selector: str) -> "SelectolaxNode | None":
+        return self._wrap(self._node.css_first(selector))
+
+    @staticmethod
+    def _build_selector(name, attrs: dict | None, kwargs: dict) -> str | None:
+        # Traduce los filtros estilo find()/find_all() a un selector CSS cuando es posible
+        if name is not None and not isinstance(name, str):
+            return None
+        selector = name or "*"
+        merged = dict(attrs or {})
+        merged.update(kwargs)
+        for key, value in merged.items():
+            if value is True:
+                selector += f"[{key}]"
+            elif isinstance(value, str):
+                selector += f"[{key}={_css_attr_value(value)}]"
+            else:
+                return None
+        return selector
+
+    def _matches_name(self, name) -> bool:
+        if name is None:
+            return True
+        if callable(name):
+            return bool(name(self))
+        if isinstance(name, (list, tuple, set)):
+            return self.name in name
+        return self.name == name
+
+    def find_all(self, name=None, attrs: dict | None = None, limit: int | None = None, **kwargs) -> list["SelectolaxNode"]:
+        selector = self._build_selector(name, attrs, kwargs)
+        if selector is not None:
+            found = [SelectolaxNode(n) for n in self._node.css(selector)]
+        else:
+            found = []
+            for node in self._node.traverse(include_text=False):
+                if node.mem_id == self._node.mem_id:
+                    continue
+                wrapped = SelectolaxNode(node)
+                if wrapped._matches_name(name):
+                    found.append(wrapped)
+                    if limit and len(found) >= limit:
+                        break
+        return found[:limit] if limit else found
+
+    def find(self, name=None, attrs: dict | None = None, **kwargs) -> "SelectolaxNode | None":
+        selector = self._build_selector(name, attrs, kwargs)
+        if selector is not None:
+            return self._wrap(self._node.css_first(selector))
+        found = self.find_all(name, attrs, limit=1, **kwargs)
+        return found[0] if found else None
+
+    def find_parent(self, name=None) -> "SelectolaxNode | None":
+        node = self.parent
+        while node is not None:
+            if node._matches_name(name):
+                return node
+            node = node.parent
+        return None
+
+    def find_next(self, string=None) -> str | None:
+        # Solo se usa con `string=`: primer texto posterior al nodo que cumpla el predicado
+        if string is None:
+            return None
+        root = self._node
+        while root.parent is not None and root.parent.is_element_node:
+            root = root.parent
+        seen = False
+        for node in root.traverse(include_text=True):
+            if not seen:
+                seen = node.mem_id == self._node.mem_id
+                continue
+            if node.is_text_node and string(node.text_content or ""):
+                return node.text_content
+        return None
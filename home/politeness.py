@@ -0,0 +1,129 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+# Valores por defecto; se pueden sobrescribir por host con settings.SCRAPER_POLITENESS
+# RATE: peticiones por segundo sostenidas, BURST: peticiones seguidas sin espera,
+# JITTER: rango (s) que se suma a cada espera para no golpear con un ritmo exacto.
+# MAX_WAIT: espera máxima (s); si el turno queda más lejos, o después del plazo de la
+# búsqueda, se devuelve y la petición falla al instante con PolitenessTimeout
+DEFAULT_POLITENESS = {
+    "default": {"RATE": 0.5, "BURST": 4, "JITTER": (0.2, 1.0), "MAX_WAIT": 10.0},
+}
+
+
+class PolitenessTimeout(TimeoutError):
+    """El turno de cortesía para el host llega después de lo que se puede esperar."""
+
+
+def get_politeness_config() -> dict:
+    config = {k: dict(v) for k, v in DEFAULT_POLITENESS.items()}
+    try:
+        from django.conf import settings
+        for host, values in (getattr(settings, "SCRAPER_POLITENESS", {}) or {}).items():
+            config.setdefault(host, dict(config["default"])).update(values)
+    except Exception:
+        pass
+    return config
+
+
+class PolitenessScheduler:
+    """
+    Token bucket por host compartido por todos los hilos del proceso. Solo hace
+    esperar cuando el ritmo reciente de peticiones a un host supera su presupuesto.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: dict[str, dict] = {}
+
+    def _limits(self, host: str) -> dict:
+        config = get_politeness_config()
+        return {**config["default"], **config.get(host, {})}
+
+    def reserve(self, host: str) -> float:
+        """Reserva un turno para `host` y devuelve cuántos segundos hay que esperar (sin jitter)."""
+        limits = self._limits(host)
+        rate = float(limits["RATE"])
+        burst = float(limits["BURST"])
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = {"tokens": burst, "updated": now, "waits": 0, "requests": 0, "timeouts": 0}
+                self._buckets[host] = bucket
+            bucket["tokens"] = min(burst, bucket["tokens"] + (now - bucket["updated"]) * rate)
+            bucket["updated"] = now
+            # Los tokens pueden quedar negativos: cada llamada reserva su lugar en la cola
+            bucket["tokens"] -= 1
+            bucket["requests"] += 1
+            if bucket["tokens"] >= 0 or rate <= 0:
+                return 0.0
+            bucket["waits"] += 1
+            return -bucket["tokens"] / rate
+
+    def release(self, host: str) -> None:
+        # Devuelve un turno reservado que no se va a usar
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is not None:
+                bucket["tokens"] += 1
+                bucket["requests"] -= 1
+                bucket["timeouts"] += 1
+
+    def headroom(self, url_or_host: str) -> float:
+        """Tokens disponibles ahora para el host, sin reservar (negativo si ya hay cola)."""
+        host = urlparse(url_or_host).hostname or url_or_host
+        limits = self._limits(host)
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                return float(limits["BURST"])
+            elapsed = time.monotonic() - bucket["updated"]
+            return min(float(limits["BURST"]), bucket["tokens"] + elapsed * float(limits["RATE"]))
+
+    def _delay(self, url_or_host: str, deadline: float | None) -> float:
+        host = urlparse(url_or_host).hostname or url_or_host
+        delay = self.reserve(host)
+        if delay <= 0:
+            return 0.0
+        limits = self._limits(host)
+        low, high = limits["JITTER"]
+        delay += random.uniform(low, high)
+        allowed = float(limits["MAX_WAIT"])
+        if deadline is not None:
+            allowed = min(allowed, deadline - time.monotonic())
+        if delay > allowed:
+            # Sin dormir: el turno vuelve al bucket para quien sí alcance a usarlo
+            self.release(host)
+            raise PolitenessTimeout(f"{host}: turno de cortesía en {delay:.1f} s, se pueden esperar {max(0.0, allowed):.1f} s")
+        return delay
+
+    def wait(self, url_or_host: str, deadline: float | None = None) -> float:
+        """
+        Duerme lo necesario antes de pedir `url_or_host`; devuelve los segundos esperados.
+        Lanza PolitenessTimeout si la espera pasa de MAX_WAIT o del `deadline` (monotónico).
+        """
+        delay = self._delay(url_or_host, deadline)
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    async def wait_async(self, url_or_host: str, deadline: float | None = None) -> float:
+        delay = self._delay(url_or_host, deadline)
+        if delay:
+            await asyncio.sleep(delay)
+        return delay
+
+    def stats(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                host: {"tokens": round(b["tokens"], 2), "requests": b["requests"], "waits": b["waits"],
+                       "timeouts": b["timeouts"]}
+                for host, b in self._buckets.items()
+            }
+
+
+POLITENESS = PolitenessScheduler()
@@ -0,0 +1,339 @@
+import concurrent.futures
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from .breaker import BREAKER
+from .cache import RESULT_CACHE
+from .canonical import canonical_key, clean_query
+from .metrics import METRICS
+from .politeness import POLITENESS
+from .service import base_url, get_available_sources, warm_source
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.PREWARM.
+# Cada búsqueda de los usuarios suma 1 a la popularidad de su consulta, que pierde la mitad
+# de su peso cada HALF_LIFE s. Cada INTERVAL s un único worker del host vuelve a scrapear
+# las TOP_N consultas con popularidad >= MIN_SCORE cuya entrada en caché vencería antes de
+# la siguiente ronda, con CONCURRENCY hilos y como mucho MAX_REQUESTS_PER_MINUTE scrapes.
+# Una fuente se salta si su host tiene menos de POLITENESS_RESERVE tokens de cortesía libres:
+# ese margen queda para las búsquedas de los usuarios
+DEFAULT_PREWARM = {
+    "ENABLED": False,
+    "PATH": None,  # por defecto BASE_DIR/data/search_log.sqlite3
+    "TOP_N": 100,
+    "MIN_SCORE": 2.0,
+    "HALF_LIFE": 3600.0,
+    "INTERVAL": 120.0,
+    "CONCURRENCY": 2,
+    "MAX_REQUESTS_PER_MINUTE": 30,
+    "POLITENESS_RESERVE": 2,
+    "FLUSH_INTERVAL": 5.0,
+    # Clave de SCRAPER_BASE_URLS a la que pega cada fuente, para consultar su cortesía
+    "HOSTS": {"mercadolibre": "mercadolibre_listado", "falabella": "falabella"},
+}
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS queries ("
+    " key TEXT PRIMARY KEY, query TEXT NOT NULL, max_items INTEGER NOT NULL, score REAL NOT NULL,"
+    " searches INTEGER NOT NULL, last_search REAL NOT NULL) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS queries_score ON queries (score)",
+    # Turno de la ronda (un solo worker del host) y momento del último decaimiento
+    "CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, holder TEXT, value REAL NOT NULL) WITHOUT ROWID",
+)
+
+# Por debajo de este peso una consulta se olvida
+FORGET_SCORE = 0.05
+
+METRICS.describe("prewarm_rounds_total", "Rondas de precalentamiento ejecutadas por este worker.")
+METRICS.describe("prewarm_jobs_total",
+                 "Pares (consulta, fuente) de cada ronda por fuente y resultado "
+                 "(warmed, fresh, politeness, circuit, budget, failed, error).")
+METRICS.describe("prewarm_round_seconds", "Duración de las rondas de precalentamiento.",
+                 buckets=(1, 5, 15, 30, 60, 120, 300))
+METRICS.describe("prewarm_cache_hits_total", "Búsquedas servidas desde una entrada precalentada, por fuente.")
+METRICS.describe("prewarm_saved_seconds_total",
+                 "Latencia ahorrada a los usuarios (estimada con la duración del scraping de precalentamiento).")
+
+
+def get_prewarm_config() -> dict:
+    config = dict(DEFAULT_PREWARM)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "PREWARM", {}) or {})
+        if not config["PATH"]:
+            config["PATH"] = Path(settings.BASE_DIR) / "data" / "search_log.sqlite3"
+    except Exception:
+        config["PATH"] = config["PATH"] or "search_log.sqlite3"
+    return config
+
+
+def connect(path) -> sqlite3.Connection:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=5.0, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        conn.execute(statement)
+    return conn
+
+
+class Pacer:
+    # Reparte los scrapes de una ronda a intervalos regulares: como mucho `per_minute` por minuto
+    def __init__(self, per_minute: float):
+        self._lock = threading.Lock()
+        self._spacing = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._spacing
+        if start > now:
+            time.sleep(start - now)
+
+
+class Prewarmer:
+    """
+    Registro de popularidad de las consultas y planificador del precalentamiento.
+    `record` solo suma en memoria; un hilo por proceso vuelca los contadores a la
+    base SQLite compartida y, en el worker que gana el turno, ejecuta las rondas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[str, dict] = {}
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._conn: sqlite3.Connection | None = None
+        self._conn_key: tuple | None = None
+        self._stats = {"recorded": 0, "flushes": 0, "rounds": 0, "warmed": 0, "skipped": 0, "errors": 0,
+                       "last_round_seconds": 0.0, "last_round_queries": 0}
+
+    # Registro
+
+    def record(self, query: str, max_items: int) -> None:
+        config = get_prewarm_config()
+        key = canonical_key(query)
+        if not config["ENABLED"] or not key:
+            return
+        self._ensure_started()
+        with self._lock:
+            entry = self._pending.get(key)
+            if entry is None:
+                entry = self._pending[key] = {"query": clean_query(query), "max_items": max_items, "count": 0}
+            entry["count"] += 1
+            entry["last_search"] = time.time()
+            self._stats["recorded"] += 1
+
+    def _db(self, config: dict) -> sqlite3.Connection:
+        # Solo la usa el hilo del planificador (o el comando prewarm); se reabre tras un fork
+        key = (os.getpid(), str(config["PATH"]))
+        if self._conn is None or self._conn_key != key:
+            self._conn, self._conn_key = connect(config["PATH"]), key
+        return self._conn
+
+    def flush(self, config: dict | None = None) -> int:
+        config = config or get_prewarm_config()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        conn = self._db(config)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO queries (key, query, max_items, score, searches, last_search) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET query = excluded.query, max_items = excluded.max_items, "
+                "score = score + excluded.score, searches = searches + excluded.searches, "
+                "last_search = MAX(last_search, excluded.last_search)",
+                [(key, e["query"], e["max_items"], e["count"], e["count"], e["last_search"])
+                 for key, e in pending.items()],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self._stats["flushes"] += 1
+        return len(pending)
+
+    # Ronda
+
+    def _take_turn(self, conn: sqlite3.Connection, ttl: float) -> bool:
+        # Turno de la ronda con vencimiento: si el worker que lo tenía muere, otro lo toma
+        holder = f"{socket.gethostname()}:{os.getpid()}"
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT holder, value FROM state WHERE name = 'turn'").fetchone()
+            if row and row[0] != holder and row[1] > now:
+                conn.execute("COMMIT")
+                return False
+            conn.execute(
+                "INSERT INTO state (name, holder, value) VALUES ('turn', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET holder = excluded.holder, value = excluded.value",
+                (holder, now + ttl),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def top_queries(self, config: dict | None = None, limit: int | None = None) -> list[dict]:
+        """
+        Aplica el decaimiento pendiente a toda la tabla, olvida las consultas sin peso
+        y devuelve las más populares: [{"query", "max_items", "score", "searches"}].
+        """
+        config = config or get_prewarm_config()
+        conn = self._db(config)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM state WHERE name = 'decayed_at'").fetchone()
+            if row:
+                factor = 0.5 ** ((now - row[0]) / config["HALF_LIFE"])
+                conn.execute("UPDATE queries SET score = score * ?", (factor,))
+                conn.execute("DELETE FROM queries WHERE score < ?", (FORGET_SCORE,))
+            conn.execute(
+                "INSERT INTO state (name, value) VALUES ('decayed_at', ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                (now,),
+            )
+            rows = conn.execute(
+                "SELECT query, max_items, score, searches FROM queries WHERE score >= ? ORDER BY score DESC LIMIT ?",
+                (config["MIN_SCORE"], limit or config["TOP_N"]),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return [{"query": q, "max_items": m, "score": round(s, 2), "searches": n} for q, m, s, n in rows]
+
+    def _skip_reason(self, config: dict, source: str, query: str, max_items: int) -> str | None:
+        # Motivo para no scrapear ahora (query, source); None si hay que hacerlo
+        if not BREAKER.available(source):
+            return "circuit"
+        age = RESULT_CACHE.age(query, source, max_items)
+        if age is not None and age + config["INTERVAL"] < RESULT_CACHE.ttl_for(source):
+            # Sigue fresca hasta la próxima ronda
+            return "fresh"
+        host_key = config["HOSTS"].get(source)
+        if host_key and POLITENESS.headroom(base_url(host_key)) < config["POLITENESS_RESERVE"]:
+            return "politeness"
+        return None
+
+    def _warm(self, config: dict, pacer: Pacer, source: str, query: str, max_items: int) -> str:
+        # Se vuelve a mirar justo antes: la espera del pacer pudo cambiar la caché o el circuito
+        pacer.wait()
+        reason = self._skip_reason(config, source, query, max_items)
+        if reason is not None:
+            return reason
+        try:
+            data = warm_source(source, query, max_items)
+        except Exception:
+            logger.exception("Precalentamiento: error al scrapear %r en %s", query, source)
+            return "error"
+        return "warmed" if isinstance(data, dict) and data.get("results") and not data.get("error") else "failed"
+
+    def run_round(self, config: dict | None = None) -> dict:
+        """
+        Una ronda completa: decaimiento, selección de las consultas populares y
+        scraping de las fuentes cuya caché no llega viva a la siguiente ronda.
+        Devuelve el conteo de resultados por tipo.
+        """
+        config = config or get_prewarm_config()
+        started = time.monotonic()
+        queries = self.top_queries(config)
+        sources = [s["key"] for s in get_available_sources()]
+        outcomes: dict[str, int] = {}
+
+        def count(source: str, outcome: str) -> None:
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            METRICS.inc("prewarm_jobs_total", {"source": source, "outcome": outcome})
+
+        jobs = []
+        for entry in queries:
+            for source in sources:
+                reason = self._skip_reason(config, source, entry["query"], entry["max_items"])
+                if reason is None:
+                    jobs.append((source, entry["query"], entry["max_items"]))
+                else:
+                    count(source, reason)
+        # Lo que no cabe en el ritmo máximo antes de la próxima ronda se deja (las menos populares)
+        capacity = int(config["INTERVAL"] * config["MAX_REQUESTS_PER_MINUTE"] / 60)
+        for source, _, _ in jobs[capacity:]:
+            count(source, "budget")
+        jobs = jobs[:capacity]
+
+        pacer = Pacer(config["MAX_REQUESTS_PER_MINUTE"])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, config["CONCURRENCY"]),
+                                                   thread_name_prefix="prewarm") as executor:
+            futures = {executor.submit(self._warm, config, pacer, *job): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                count(futures[future][0], future.result())
+
+        elapsed = time.monotonic() - started
+        METRICS.inc("prewarm_rounds_total")
+        METRICS.observe("prewarm_round_seconds", elapsed)
+        with self._lock:
+            self._stats["rounds"] += 1
+            self._stats["warmed"] += outcomes.get("warmed", 0)
+            self._stats["skipped"] += sum(n for k, n in outcomes.items() if k != "warmed")
+            self._stats["last_round_seconds"] = round(elapsed, 2)
+            self._stats["last_round_queries"] = len(queries)
+        return outcomes
+
+    # Hilo planificador
+
+    def _ensure_started(self) -> None:
+        # Un hilo por proceso, arrancado en el primer uso (después del fork de gunicorn)
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pending.clear()
+            self._thread = threading.Thread(target=self._run, name="prewarm", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self) -> None:
+        next_round = time.monotonic() + get_prewarm_config()["INTERVAL"]
+        while True:
+            config = get_prewarm_config()
+            time.sleep(config["FLUSH_INTERVAL"])
+            if not config["ENABLED"]:
+                continue
+            try:
+                self.flush(config)
+                if time.monotonic() < next_round:
+                    continue
+                next_round = time.monotonic() + config["INTERVAL"]
+                if self._take_turn(self._db(config), config["INTERVAL"] * 1.5):
+                    self.run_round(config)
+            except Exception:
+                logger.exception("Precalentamiento: error en la ronda")
+                with self._lock:
+                    self._stats["errors"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending_queries"] = len(self._pending)
+        return stats
+
+
+PREWARMER = Prewarmer()
+
+
+def _prewarm_gauges() -> list[tuple]:
+    return [("prewarm_state", "gauge", {"stat": key}, value) for key, value in PREWARMER.stats().items()]
+
+
+METRICS.register_collector(_prewarm_gauges)
@@ -0,0 +1,176 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import cProfile
+import io
+import json
+import pstats
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.core import signing
+
+DEFAULT_PROFILING = {
+    "ENABLED": False,
+    "DIR": None,  # por defecto BASE_DIR/profiles
+    "HEADER": "X-Profile-Token",
+    "QUERY_PARAM": "profile",
+    "MAX_AGE": 3600,  # validez del token en segundos
+    "TOP": 40,  # funciones en el resumen de texto
+}
+
+SALT = "home.profiling"
+
+# Sesión de perfilado de la petición en curso; None en el tráfico normal
+_current_session: contextvars.ContextVar["ProfileSession | None"] = contextvars.ContextVar(
+    "profile_session", default=None
+)
+
+
+def get_profiling_config() -> dict:
+    config = dict(DEFAULT_PROFILING)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "REQUEST_PROFILING", {}) or {})
+        if not config["DIR"]:
+            config["DIR"] = Path(settings.BASE_DIR) / "profiles"
+    except Exception:
+        config["DIR"] = config["DIR"] or "profiles"
+    return config
+
+
+def make_token(label: str) -> str:
+    # Token firmado con SECRET_KEY que habilita el perfilado; `label` identifica a quien lo pidió
+    return signing.TimestampSigner(salt=SALT).sign(label)
+
+
+def verify_token(token: str, max_age: float) -> str | None:
+    try:
+        return signing.TimestampSigner(salt=SALT).unsign(token, max_age=max_age)
+    except signing.BadSignature:
+        return None
+
+
+def active() -> bool:
+    return _current_session.get() is not None
+
+
+def _slug(text: str, limit: int = 40) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", (text or "").lower()).strip("-")[:limit] or "request"
+
+
+class ProfileSession:
+    """
+    Perfila una petición con un único cProfile y guarda las páginas que descargan
+    los scrapers. La petición completa corre en un hilo propio (con su propio event
+    loop si la vista es async) y, mientras la sesión está activa, los scrapers se
+    ejecutan en ese mismo hilo en vez de en el pool: el perfil no mezcla otras
+    peticiones ni depende de varios perfiladores a la vez. Si el intérprete no deja
+    activar el perfilador (en 3.12+ hay uno solo por proceso), la petición se
+    atiende igual y el manifest lo indica.
+    """
+
+    def __init__(self, label: str, query: str, config: dict):
+        self.label = label
+        self.query = query
+        self.config = config
+        self.started = time.time()
+        self.unavailable: str | None = None
+        self._lock = threading.Lock()
+        self._profile: cProfile.Profile | None = None
+        self._pages: list[dict] = []
+
+    def _execute(self, future: concurrent.futures.Future, fn, args: tuple) -> None:
+        token = _current_session.set(self)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as exc:
+            # "Another profiling tool is already active": se sigue sin perfil
+            self.unavailable = str(exc)
+            profile = None
+        try:
+            result, error = fn(*args), None
+        except BaseException as exc:
+            result, error = None, exc
+        finally:
+            if profile is not None:
+                profile.disable()
+                self._profile = profile
+            _current_session.reset(token)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _start(self, fn, *args) -> concurrent.futures.Future:
+        future = concurrent.futures.Future()
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(self._execute, future, fn, args),
+                         name="profiled-request", daemon=True).start()
+        return future
+
+    def run(self, fn, *args):
+        # Ejecuta `fn(*args)` en el hilo perfilado y espera su resultado
+        return self._start(fn, *args).result()
+
+    async def arun(self, fn, *args):
+        # Como run para una función async: el hilo perfilado tiene su propio event loop y este no se bloquea
+        return await asyncio.wrap_future(self._start(asyncio.run, fn(*args)))
+
+    def add_page(self, source: str, url: str, html: str) -> None:
+        with self._lock:
+            self._pages.append({"source": source, "url": url, "html": html})
+
+    def save(self, extra: dict | None = None) -> Path:
+        """
+        Escribe en DIR/<fecha>-<consulta>/ el perfil combinado (request.prof), un
+        resumen por tiempo acumulado (summary.txt), las páginas en pages/ con el
+        prefijo de la fuente y un manifest.json. Las páginas se pueden reproducir
+        offline con `manage.py bench_suite --pages <dir>/pages`.
+        """
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        directory = Path(self.config["DIR"]) / f"{stamp}-{_slug(self.query)}"
+        pages_dir = directory / "pages"
+        pages_dir.mkdir(parents=True, exist_ok=True)
+
+        stats = None
+        if self._profile is not None:
+            try:
+                stats = pstats.Stats(self._profile)
+            except TypeError:
+                # Perfilador que no llegó a registrar nada
+                stats = None
+        if stats is not None:
+            stats.dump_stats(directory / "request.prof")
+            summary = io.StringIO()
+            stats.stream = summary
+            stats.sort_stats("cumulative").print_stats(self.config["TOP"])
+            (directory / "summary.txt").write_text(summary.getvalue(), encoding="utf-8")
+
+        pages = []
+        for index, page in enumerate(self._pages):
+            name = f"{page['source']}_{index:02d}.html"
+            (pages_dir / name).write_text(page["html"], encoding="utf-8")
+            pages.append({"file": f"pages/{name}", "source": page["source"], "url": page["url"],
+                          "bytes": len(page["html"])})
+        manifest = {
+            "label": self.label,
+            "query": self.query,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "profile": "request.prof" if stats is not None else None,
+            "profile_unavailable": self.unavailable,
+            "pages": pages,
+            **(extra or {}),
+        }
+        (directory / "manifest.json").write_text(json.dumps(manifest, indent=2, ensure_ascii=False), encoding="utf-8")
+        return directory
+
+
+def capture_page(source: str, url: str, html: str) -> None:
+    session = _current_session.get()
+    if session is not None:
+        session.add_page(source, url, html)
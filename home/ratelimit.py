@@ -0,0 +1,366 @@
+import atexit
+import functools
+import ipaddress
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.RATELIMIT_ENGINE.
+# PATH: base SQLite compartida por los workers del host ("" = solo en memoria del proceso).
+# Al consultar la base, el worker reserva LEASE_FRACTION del margen que le queda al cliente
+# (como mucho LEASE_MAX peticiones) y las siguientes se deciden en memoria. Un hilo por
+# proceso devuelve en lote cada FLUSH_INTERVAL s las reservas sin usar durante LEASE_TTL s
+# y las que quedaron de una ventana ya cerrada; al salir se devuelven todas
+DEFAULT_ENGINE = {
+    "PATH": "/tmp/preciosfacil-ratelimit.sqlite3",
+    "LEASE_FRACTION": 0.25,
+    "LEASE_MAX": 10,
+    "LEASE_TTL": 1.0,
+    "FLUSH_INTERVAL": 0.5,
+}
+
+# Reglas por defecto (settings.RATELIMIT_RULES); "global" usa GLOBAL_RATELIMIT_RATE
+DEFAULT_RULES = {
+    "global": "50/m",
+    "search_cached": "40/m",
+    "search_cold": "12/m",
+}
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+RATELIMITED_MESSAGE = "Demasiadas solicitudes. Por favor, espera un momento antes de volver a intentar."
+
+
+def get_engine_config() -> dict:
+    config = dict(DEFAULT_ENGINE)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "RATELIMIT_ENGINE", {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def get_rules() -> dict:
+    rules = dict(DEFAULT_RULES)
+    try:
+        from django.conf import settings
+        rules.update(getattr(settings, "RATELIMIT_RULES", {}) or {})
+        rules["global"] = getattr(settings, "GLOBAL_RATELIMIT_RATE", None) or rules["global"]
+    except Exception:
+        pass
+    return rules
+
+
+@functools.lru_cache(maxsize=32)
+def parse_rate(rate: str) -> tuple[int, int]:
+    # "50/m" -> (50, 60); también "100/5m"
+    count, _, period = rate.partition("/")
+    multiplier = int(period[:-1]) if len(period) > 1 else 1
+    return int(count), multiplier * PERIODS[period[-1]]
+
+
+def client_ip(request) -> str:
+    """
+    Clave del cliente: REMOTE_ADDR o, detrás de un proxy, la primera dirección de la
+    cabecera de META indicada en settings.RATELIMIT_IP_META_KEY (p. ej.
+    "HTTP_X_FORWARDED_FOR"). Las IPv6 se agrupan por /64, que es lo que suele tener
+    un mismo cliente.
+    """
+    from django.conf import settings
+    meta_key = getattr(settings, "RATELIMIT_IP_META_KEY", None) or "REMOTE_ADDR"
+    ip = (request.META.get(meta_key) or request.META.get("REMOTE_ADDR") or "").split(",")[0].strip()
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip or "unknown"
+    if address.version == 6:
+        return str(ipaddress.ip_network(f"{ip}/64", strict=False).network_address)
+    return str(address)
+
+
+class SlidingWindowLimiter:
+    """
+    Ventana deslizante aproximada (ventana actual + la anterior ponderada) por regla
+    y cliente. Los contadores viven en una base SQLite compartida por todos los
+    workers del host. Para no ir a la base en cada petición, cada worker reserva de
+    una vez un tramo del margen del cliente y lo gasta en memoria: el total admitido
+    entre todos los workers nunca supera el límite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._entries: dict[tuple[str, str], dict] = {}
+        self._conn: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        # Reservas de ventanas ya cerradas, pendientes de devolver: [(regla, clave, ventana, n)]
+        self._pending: list[tuple] = []
+        self._thread: threading.Thread | None = None
+        self._pid: int | None = None
+        self._last_cleanup = 0.0
+        self._stats = {"fast": 0, "synced": 0, "denied": 0, "refunded": 0, "flushes": 0, "db_errors": 0}
+
+    # Base compartida
+
+    def _db(self, config: dict) -> sqlite3.Connection:
+        # Tras un fork (gunicorn) la conexión heredada no se puede usar
+        if self._conn is None or self._conn_pid != os.getpid():
+            conn = sqlite3.connect(str(config["PATH"]), timeout=1.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ratelimit ("
+                " rule TEXT NOT NULL, key TEXT NOT NULL, window INTEGER NOT NULL,"
+                " count INTEGER NOT NULL, expires REAL NOT NULL,"
+                " PRIMARY KEY (rule, key, window)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ratelimit_expires ON ratelimit (expires)")
+            self._conn, self._conn_pid = conn, os.getpid()
+        return self._conn
+
+    def _reserve(self, config: dict, rule: str, key: str, limit: int, period: int, window: int,
+                 weight: float) -> tuple[int, float, float]:
+        """
+        En una transacción: lee la ventana actual y la anterior, y suma la petición más
+        la reserva. Devuelve (peticiones concedidas, contador anterior, contador actual);
+        0 concedidas si el cliente ya superó el límite (la petición cuenta igual).
+        """
+        with self._db_lock:
+            conn = self._db(config)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                found = dict(conn.execute(
+                    "SELECT window, count FROM ratelimit WHERE rule = ? AND key = ? AND window >= ?",
+                    (rule, key, window - 1),
+                ).fetchall())
+                prev, curr = found.get(window - 1, 0), found.get(window, 0)
+                headroom = limit - (prev * weight + curr)
+                if headroom < 1:
+                    granted = 0
+                else:
+                    granted = max(1, min(config["LEASE_MAX"], int(headroom * config["LEASE_FRACTION"])))
+                conn.execute(
+                    "INSERT INTO ratelimit (rule, key, window, count, expires) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT (rule, key, window) DO UPDATE SET count = count + excluded.count",
+                    (rule, key, window, granted or 1, (window + 2) * period),
+                )
+                now = time.time()
+                if now - self._last_cleanup > 60:
+                    conn.execute("DELETE FROM ratelimit WHERE expires < ?", (now,))
+                    self._last_cleanup = now
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return granted, prev, curr + (granted or 1)
+
+    def _refund(self, config: dict, rows: list[tuple]) -> None:
+        # Devuelve en lote las reservas que nadie usó: [(regla, clave, ventana, n)]
+        with self._db_lock:
+            conn = self._db(config)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "UPDATE ratelimit SET count = MAX(0, count - ?) WHERE rule = ? AND key = ? AND window = ?",
+                    [(n, rule, key, window) for rule, key, window, n in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    # Decisión
+
+    def _entry(self, rule: str, key: str, window: int) -> dict:
+        entry = self._entries.get((rule, key))
+        if entry is None:
+            entry = self._entries[(rule, key)] = {"window": window, "lease": 0, "leased_at": 0.0, "prev": 0, "curr": 0}
+        elif entry["window"] != window:
+            # Cambio de ventana: la reserva ya no sirve y se devuelve a la ventana en la que se
+            # contó, que sigue pesando como "anterior" en la nueva
+            if entry["lease"]:
+                self._pending.append((rule, key, entry["window"], entry["lease"]))
+            entry["prev"] = entry["curr"] if entry["window"] == window - 1 else 0
+            entry.update(window=window, lease=0, curr=0)
+        return entry
+
+    def hit(self, rule: str, key: str, rate: str | None = None) -> tuple[bool, int]:
+        """
+        Registra una petición de `key` bajo la regla `rule` y devuelve (permitida,
+        segundos para reintentar). Las peticiones rechazadas también cuentan.
+        """
+        config = get_engine_config()
+        limit, period = parse_rate(rate or get_rules()[rule])
+        now = time.time()
+        window = int(now // period)
+        weight = 1 - (now % period) / period
+        with self._lock:
+            entry = self._entry(rule, key, window)
+            if not config["PATH"]:
+                # Sin base compartida: contador exacto del proceso
+                entry["curr"] += 1
+                allowed = entry["prev"] * weight + entry["curr"] <= limit
+                self._stats["fast" if allowed else "denied"] += 1
+                return (True, 0) if allowed else (False, self._retry_after(limit, period, entry, weight, now))
+            if entry["lease"] > 0:
+                entry["lease"] -= 1
+                self._stats["fast"] += 1
+                return True, 0
+        self._ensure_started()
+        try:
+            granted, prev, curr = self._reserve(config, rule, key, limit, period, window, weight)
+        except sqlite3.Error:
+            # Base no disponible: mejor dejar pasar que tumbar el sitio
+            logger.warning("Rate limit: base compartida no disponible, se deja pasar la petición")
+            with self._lock:
+                self._stats["db_errors"] += 1
+            return True, 0
+        with self._lock:
+            entry = self._entry(rule, key, window)
+            entry.update(prev=prev, curr=curr, lease=entry["lease"] + max(0, granted - 1), leased_at=now)
+            self._stats["synced"] += 1
+            if granted:
+                return True, 0
+            self._stats["denied"] += 1
+            return False, self._retry_after(limit, period, entry, weight, now)
+
+    @staticmethod
+    def _retry_after(limit: int, period: int, entry: dict, weight: float, now: float) -> int:
+        # Hasta que la parte ponderada de la ventana anterior baje lo suficiente, como mucho el fin de esta
+        prev, curr = entry["prev"], entry["curr"]
+        remaining = period - now % period
+        if prev and curr < limit:
+            remaining = min(remaining, (prev * weight + curr - limit) / prev * period)
+        return max(1, math.ceil(remaining))
+
+    # Devolución de reservas
+
+    def _ensure_started(self) -> None:
+        # Un hilo por proceso, arrancado en el primer uso (después del fork de gunicorn)
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Las reservas heredadas del fork son del proceso padre
+                self._entries.clear()
+                self._pending.clear()
+            self._thread = threading.Thread(target=self._run, name="ratelimit-flush", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(get_engine_config()["FLUSH_INTERVAL"])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Rate limit: error al devolver las reservas")
+
+    def flush(self, everything: bool = False) -> int:
+        """
+        Devuelve a la base las reservas sin usar durante LEASE_TTL s y las de ventanas
+        ya cerradas (con `everything`, todas: al salir del proceso). Devuelve cuántas
+        peticiones se devolvieron.
+        """
+        config = get_engine_config()
+        if not config["PATH"]:
+            return 0
+        now = time.time()
+        with self._lock:
+            rows, self._pending = self._pending, []
+            for (rule, key), entry in list(self._entries.items()):
+                if entry["lease"] and (everything or now - entry["leased_at"] > config["LEASE_TTL"]):
+                    rows.append((rule, key, entry["window"], entry["lease"]))
+                    entry["lease"] = 0
+                elif not entry["lease"] and now - entry["leased_at"] > 2 * config["LEASE_TTL"]:
+                    # Cliente inactivo: la próxima petición vuelve a consultar la base
+                    del self._entries[(rule, key)]
+        if not rows:
+            return 0
+        try:
+            self._refund(config, rows)
+        except sqlite3.Error:
+            logger.warning("Rate limit: no se pudieron devolver las reservas sin usar")
+            with self._lock:
+                self._stats["db_errors"] += 1
+            return 0
+        refunded = sum(n for *_, n in rows)
+        with self._lock:
+            self._stats["flushes"] += 1
+            self._stats["refunded"] += refunded
+        return refunded
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+        config = get_engine_config()
+        if config["PATH"]:
+            with self._db_lock:
+                self._db(config).execute("DELETE FROM ratelimit")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked_clients"] = len(self._entries)
+        return stats
+
+
+LIMITER = SlidingWindowLimiter()
+atexit.register(LIMITER.flush, True)
+
+
+def ratelimited_response(retry_after: int) -> HttpResponse:
+    response = HttpResponse(RATELIMITED_MESSAGE, status=429, content_type="text/plain; charset=utf-8")
+    response["Retry-After"] = str(retry_after)
+    return response
+
+
+def check(request, rule: str) -> HttpResponse | None:
+    # Respuesta 429 si `request` superó la regla; None si puede seguir
+    allowed, retry_after = LIMITER.hit(rule, client_ip(request))
+    return None if allowed else ratelimited_response(retry_after)
+
+
+# Para código async: cuando se acaba la reserva, hit consulta la base SQLite
+acheck = sync_to_async(check, thread_sensitive=False)
+
+
+def rate_limit(rule):
+    """
+    Decorador de vistas (síncronas o async) con una regla de RATELIMIT_RULES. `rule`
+    puede ser el nombre o una función request -> nombre (None = no limitar), para
+    cobrar distinto según el coste de la petición. Se construye una sola vez.
+    """
+    resolve = rule if callable(rule) else (lambda request: rule)
+    # La función de coste puede consultar la caché en disco: en vistas async corre en un hilo
+    resolve_async = sync_to_async(resolve, thread_sensitive=False)
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                name = await resolve_async(request)
+                denied = await acheck(request, name) if name else None
+                return denied or await view(request, *args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            name = resolve(request)
+            denied = check(request, name) if name else None
+            return denied or view(request, *args, **kwargs)
+        return wrapper
+
+    return decorator
@@ -0,0 +1,283 @@
+import collections
+import concurrent.futures
+import contextvars
+import email.utils
+import random
+import threading
+import time
+
+import requests
+
+from .metrics import METRICS, add_phase, percentile
+
+# Valores por defecto; se pueden sobrescribir por fuente con settings.SCRAPER_RETRY
+# MAX_ATTEMPTS: intentos totales (1 = sin reintentos). La espera entre intentos es
+# aleatoria entre 0 y BACKOFF_BASE * 2^(intento-1), con tope BACKOFF_MAX (full jitter).
+# Un Retry-After mayor que MAX_RETRY_AFTER no se espera: se devuelve la respuesta.
+# HEDGE: si el intento supera el p95 reciente de la fuente se lanza un segundo en paralelo
+DEFAULT_RETRY = {
+    "default": {
+        "MAX_ATTEMPTS": 3,
+        "BACKOFF_BASE": 0.5,
+        "BACKOFF_MAX": 8.0,
+        "RETRY_STATUSES": (429, 500, 502, 503, 504),
+        "MAX_RETRY_AFTER": 30.0,
+        "MIN_ATTEMPT_SECONDS": 1.0,
+        "HEDGE": False,
+        "HEDGE_MIN_SAMPLES": 20,
+        "HEDGE_MIN_DELAY": 0.25,
+    },
+}
+
+# Presupuesto de reintentos del proceso (settings.SCRAPER_RETRY_BUDGET): en la ventana de
+# WINDOW s los reintentos y peticiones duplicadas no pueden superar MIN_RETRIES + RATIO * peticiones
+DEFAULT_RETRY_BUDGET = {"RATIO": 0.2, "MIN_RETRIES": 5, "WINDOW": 10.0}
+
+# Errores de red que se reintentan (los de conexión ya los reintenta el HTTPAdapter)
+RETRYABLE_EXCEPTIONS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+METRICS.describe("scraper_retries_total", "Reintentos hechos por fuente y motivo (status_503, ReadTimeout...).")
+METRICS.describe("scraper_retry_denied_total",
+                 "Reintentos descartados por fuente y causa (budget, deadline, retry_after, exhausted).")
+METRICS.describe("scraper_hedges_total", "Peticiones duplicadas (hedging) por fuente y resultado.")
+
+
+def get_retry_config() -> dict:
+    config = {k: dict(v) for k, v in DEFAULT_RETRY.items()}
+    try:
+        from django.conf import settings
+        for source, values in (getattr(settings, "SCRAPER_RETRY", {}) or {}).items():
+            config.setdefault(source, dict(config["default"])).update(values)
+    except Exception:
+        pass
+    return config
+
+
+def get_budget_config() -> dict:
+    config = dict(DEFAULT_RETRY_BUDGET)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "SCRAPER_RETRY_BUDGET", {}) or {})
+    except Exception:
+        pass
+    return config
+
+
+def _policy(source: str) -> dict:
+    config = get_retry_config()
+    return {**config["default"], **config.get(source, {})}
+
+
+class RetryBudget:
+    """
+    Límite de reintentos del proceso proporcional al tráfico reciente. Durante una
+    caída casi todo falla y sin este tope cada búsqueda multiplicaría las peticiones.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: collections.deque = collections.deque()
+        self._retries: collections.deque = collections.deque()
+        self._stats = {"requests": 0, "retries": 0, "denied": 0}
+
+    @staticmethod
+    def _prune(events: collections.deque, since: float) -> None:
+        while events and events[0] < since:
+            events.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._requests.append(now)
+            self._stats["requests"] += 1
+
+    def try_spend(self) -> bool:
+        config = get_budget_config()
+        now = time.monotonic()
+        with self._lock:
+            self._prune(self._requests, now - config["WINDOW"])
+            self._prune(self._retries, now - config["WINDOW"])
+            if len(self._retries) >= config["MIN_RETRIES"] + config["RATIO"] * len(self._requests):
+                self._stats["denied"] += 1
+                return False
+            self._retries.append(now)
+            self._stats["retries"] += 1
+            return True
+
+    def reset(self) -> None:
+        with self._lock:
+            self._requests.clear()
+            self._retries.clear()
+            for key in self._stats:
+                self._stats[key] = 0
+
+    def stats(self) -> dict:
+        config = get_budget_config()
+        now = time.monotonic()
+        with self._lock:
+            self._prune(self._requests, now - config["WINDOW"])
+            self._prune(self._retries, now - config["WINDOW"])
+            stats = dict(self._stats)
+            stats["window_requests"] = len(self._requests)
+            stats["window_retries"] = len(self._retries)
+        stats["window_allowance"] = round(config["MIN_RETRIES"] + config["RATIO"] * stats["window_requests"], 1)
+        return stats
+
+
+class LatencyTracker:
+    # Duraciones de los últimos intentos correctos por fuente, para el umbral de hedging
+    def __init__(self, size: int = 200):
+        self._lock = threading.Lock()
+        self._samples: dict[str, collections.deque] = {}
+        self._size = size
+
+    def record(self, source: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(source)
+            if samples is None:
+                samples = self._samples[source] = collections.deque(maxlen=self._size)
+            samples.append(seconds)
+
+    def p95(self, source: str, min_samples: int) -> float | None:
+        with self._lock:
+            samples = list(self._samples.get(source) or ())
+        if len(samples) < min_samples:
+            return None
+        return percentile(samples, 95)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+BUDGET = RetryBudget()
+LATENCY = LatencyTracker()
+
+_hedge_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_hedge_executor_lock = threading.Lock()
+
+
+def _get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _hedge_executor
+    with _hedge_executor_lock:
+        if _hedge_executor is None:
+            _hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+        return _hedge_executor
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    # Retry-After admite segundos o una fecha HTTP
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(policy: dict, attempt: int) -> float:
+    return random.uniform(0, min(policy["BACKOFF_MAX"], policy["BACKOFF_BASE"] * 2 ** (attempt - 1)))
+
+
+def _timed_send(source: str, send, policy: dict):
+    started = time.monotonic()
+    response = send()
+    if response.status_code not in policy["RETRY_STATUSES"]:
+        LATENCY.record(source, time.monotonic() - started)
+    return response
+
+
+def _close_quietly(future: concurrent.futures.Future) -> None:
+    try:
+        future.result().close()
+    except Exception:
+        pass
+
+
+def _send_hedged(source: str, send, policy: dict):
+    """
+    Lanza el intento y, si tarda más que el p95 reciente de la fuente, un segundo
+    idéntico en paralelo (a cuenta del presupuesto de reintentos). Gana el primero
+    que responde bien; el otro se descarta al terminar.
+    """
+    threshold = LATENCY.p95(source, policy["HEDGE_MIN_SAMPLES"]) if policy["HEDGE"] else None
+    if threshold is None:
+        return _timed_send(source, send, policy)
+    executor = _get_hedge_executor()
+    primary = executor.submit(contextvars.copy_context().run, _timed_send, source, send, policy)
+    try:
+        return primary.result(timeout=max(threshold, policy["HEDGE_MIN_DELAY"]))
+    except concurrent.futures.TimeoutError:
+        pass
+    if not BUDGET.try_spend():
+        METRICS.inc("scraper_retry_denied_total", {"source": source, "reason": "hedge_budget"})
+        return primary.result()
+    hedge = executor.submit(contextvars.copy_context().run, _timed_send, source, send, policy)
+    done, _ = concurrent.futures.wait((primary, hedge), return_when=concurrent.futures.FIRST_COMPLETED)
+    winner = primary if primary in done else hedge
+    if winner.exception() is not None:
+        # El primero en terminar falló: queda la otra petición
+        winner = hedge if winner is primary else primary
+    loser = hedge if winner is primary else primary
+    loser.add_done_callback(_close_quietly)
+    METRICS.inc("scraper_hedges_total", {"source": source, "outcome": "hedge_won" if winner is hedge else "primary_won"})
+    return winner.result()
+
+
+def _retry_delay(source: str, policy: dict, attempt: int, response, deadline: float | None,
+                 reason: str) -> float | None:
+    # Espera antes del siguiente intento, o None si no se debe reintentar
+    denied = None
+    delay = backoff_delay(policy, attempt)
+    if attempt >= policy["MAX_ATTEMPTS"]:
+        denied = "exhausted"
+    elif response is not None:
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            if retry_after > policy["MAX_RETRY_AFTER"]:
+                denied = "retry_after"
+            delay = max(delay, retry_after)
+    if denied is None and deadline is not None and time.monotonic() + delay + policy["MIN_ATTEMPT_SECONDS"] > deadline:
+        denied = "deadline"
+    if denied is None and not BUDGET.try_spend():
+        denied = "budget"
+    if denied is not None:
+        METRICS.inc("scraper_retry_denied_total", {"source": source, "reason": denied})
+        return None
+    METRICS.inc("scraper_retries_total", {"source": source, "reason": reason})
+    return delay
+
+
+def fetch_with_retry(source: str, send, deadline: float | None = None) -> requests.Response:
+    """
+    Ejecuta `send()` (un intento HTTP que devuelve la respuesta) con la política de
+    reintentos de la fuente: backoff exponencial con jitter, reintentos ante 429/5xx
+    respetando Retry-After, errores de red y hedging opcional. `deadline` (monotónico)
+    evita esperas que no caben en el presupuesto de la búsqueda. Si se agotan los
+    intentos se devuelve la última respuesta o se relanza el último error.
+    """
+    policy = _policy(source)
+    BUDGET.record_request()
+    attempt = 1
+    while True:
+        response = None
+        try:
+            response = _send_hedged(source, send, policy)
+        except RETRYABLE_EXCEPTIONS as exc:
+            delay = _retry_delay(source, policy, attempt, None, deadline, type(exc).__name__)
+            if delay is None:
+                raise
+        else:
+            if response.status_code not in policy["RETRY_STATUSES"]:
+                return response
+            delay = _retry_delay(source, policy, attempt, response, deadline, f"status_{response.status_code}")
+            if delay is None:
+                return response
+            response.close()
+        add_phase("backoff", delay)
+        time.sleep(delay)
+        attempt += 1
@@ -1,37 +1,142 @@
 from bs4 import BeautifulSoup
 import requests
-from requests.adapters import HTTPAdapter
 import random
 import re
-from urllib.parse import quote_plus
+from urllib.parse import quote, quote_plus
 from urllib.parse import urljoin
 import logging
 import time
 import json
 from typing import List, Dict, Optional
+import asyncio
 import concurrent.futures
+import contextvars
+import functools
+import inspect
+import threading
+
+from .breaker import BREAKER, failure_reason
+from .cache import MISS, RESULT_CACHE, STALE, copy_result
+from .canonical import clean_query, source_words
+from .filters import filter_accessories
+from .history import HISTORY
+from .index import INDEX, get_index_config
+from .metrics import (
+    METRICS, add_bytes, add_phase, phase, record_error, record_items, record_parser, scraper_run,
+)
+from .parsers import make_soup_with_fallback, node_identity, restricted_parse_enabled, soup_backend
+from .politeness import POLITENESS, PolitenessTimeout
+from .profiling import active as profiling_active
+from .profiling import capture_page
+from .retry import BUDGET as RETRY_BUDGET
+from .retry import fetch_with_retry
+from .sessions import SESSIONS, build_session, get_pool_config, get_session
+from .singleflight import SINGLE_FLIGHT
 
 logger = logging.getLogger(__name__)
 
 PROBABILIDAD_DNT_ACTIVADO = 0.6  # 60% de probabilidad de que DNT sea '1'
 
-# Palabras clave comunes de accesorios para filtrar resultados irrelevantes
-ACCESSORY_BLACKLIST = [
-    "funda", "fundas", "estuche", "case", "protector", "vidrio", "templado", "mica",
-    "audifono", "audífono", "audifonos", "audífonos", "auricular", "auriculares", "earbud",
-    "cable", "cargador", "adaptador", "soporte", "holder", "trípode", "tripode", "montura",
-    "parlante", "altavoz", "bocina", "speaker", "power bank", "batería", "bateria", "punta",
-    "malla", "correa", "tempered", "glass", "protección", "proteccion", "protector de pantalla",
-]
-
+# Solo se anuncia brotli si urllib3 puede descomprimirlo (paquete opcional brotli/brotlicffi);
+# si el servidor lo elige sin decodificador, requests entrega bytes ilegibles y el scraper 0 items
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        ACCEPT_ENCODING = "gzip, deflate"
+
+# Señales de anti-bot / captcha en el HTML de una respuesta
+BLOCK_MARKERS = ["captcha", "no eres un robot", "verifica que no eres", "robot check", "access denied", "awswaf"]
+
+
+# URLs base de cada marketplace. settings.SCRAPER_BASE_URLS permite apuntarlas a
+# otro servidor, p. ej. el servidor local de `manage.py loadtest`
+DEFAULT_BASE_URLS = {
+    "mercadolibre": "https://www.mercadolibre.com.co",
+    "mercadolibre_listado": "https://listado.mercadolibre.com.co",
+    "mercadolibre_api": "https://api.mercadolibre.com",
+    "falabella": "https://www.falabella.com.co",
+}
+
+# Zona de cada página de resultados que contiene los productos. Con parseo
+# restringido solo se construye el árbol de estas etiquetas y de los scripts
+# de datos (ver home.parsers.region_strainer)
+PARSE_REGIONS: dict[str, dict] = {
+    "mercadolibre": {
+        "classes": ["ui-search-results", "ui-search-layout"],
+        "scripts": ["application/ld+json"],
+    },
+    "falabella": {
+        "ids": ["testId-searchResults-products"],
+        "attrs": ["data-pod"],
+        "scripts": ["application/json", "application/ld+json"],
+    },
+}
 
 # Registro de scrapers disponibles. Para añadir uno nuevo, usa
 # register_scraper('clave', 'Etiqueta', funcion_scraper)
+# La función puede ser síncrona o `async def`; ambas reciben
+# (search_query, max_items=...) y devuelven {"results": [...], "error": ...}
 SCRAPERS: dict[str, dict] = {}
 
+# Hilos para ejecutar scrapers síncronos desde el pipeline async
+SYNC_SCRAPER_WORKERS = 64
+_sync_executor: concurrent.futures.ThreadPoolExecutor | None = None
+_sync_executor_lock = threading.Lock()
+
+# Presupuesto total de latencia de una búsqueda (segundos); settings.SEARCH_BUDGET_SECONDS
+DEFAULT_SEARCH_BUDGET = 12.0
+# Timeout mínimo por petición aunque el presupuesto esté casi agotado
+MIN_REQUEST_TIMEOUT = 1.0
+# Instante (time.monotonic) en que vence el presupuesto de la búsqueda en curso
+SEARCH_DEADLINE: contextvars.ContextVar[float | None] = contextvars.ContextVar("search_deadline", default=None)
+# Tareas async que siguieron corriendo tras vencer el presupuesto
+_detached_tasks: set = set()
+
 
-def register_scraper(key: str, label: str, function) -> None:
-    SCRAPERS[key] = {"label": label, "function": function}
+def base_url(key: str) -> str:
+    try:
+        from django.conf import settings
+        url = (getattr(settings, "SCRAPER_BASE_URLS", {}) or {}).get(key)
+    except Exception:
+        url = None
+    return (url or DEFAULT_BASE_URLS[key]).rstrip("/")
+
+
+def register_scraper(key: str, label: str, function, parse_region: dict | None = None) -> None:
+    SCRAPERS[key] = {
+        "label": label,
+        "function": function,
+        "is_async": inspect.iscoroutinefunction(function),
+    }
+    if parse_region is not None:
+        PARSE_REGIONS[key] = parse_region
+
+
+def parse_page(source: str, html: str, extract) -> list[dict]:
+    """
+    Parsea `html` y aplica `extract(soup)`. Si la fuente define una región, primero
+    se parsea solo esa zona; si ahí no aparece nada se repite con la página completa.
+    """
+    region = PARSE_REGIONS.get(source) if restricted_parse_enabled() else None
+    if region:
+        items = _parse_and_extract(html, extract, region)
+        if items:
+            return items
+    return _parse_and_extract(html, extract)
+
+
+def _parse_and_extract(html: str, extract, region: dict | None = None) -> list[dict]:
+    with phase("parse"):
+        soup = make_soup_with_fallback(html, region=region)
+    with phase("extract"):
+        items = extract(soup)
+    record_parser(backend=soup_backend(soup))
+    return items
 
 
 def ensure_default_scrapers() -> None:
@@ -48,50 +153,46 @@ def get_available_sources() -> list[dict]:
 def process_search_mercadolibre(search_query: str, max_retries: int = 3, max_items: int = 20):
     if not search_query:
         return {"results": []}
-    delay = random.uniform(1.5, 4.0)  # Entre 2 y 5 segundos
-    time.sleep(delay)
-    base_url = "https://listado.mercadolibre.com.co"
     formatted_query = slugify_query(search_query)
-    full_url = f"{base_url}/{formatted_query}"
-    session = create_http_session(max_retries=max_retries)
-    headers = get_realistic_headers()
-    session.headers.update(headers)
-    warm_up_ml_session(session)
-    basic = basic_ml_scraper(formatted_query, max_items=max_items)
+    if not formatted_query:
+        return {"results": []}
+    full_url = f"{base_url('mercadolibre_listado')}/{formatted_query}"
+    # Sesión compartida del proceso; max_retries se configura en SCRAPER_HTTP_POOL
+    session = get_session("mercadolibre")
+    ensure_ml_session_warm(session)
+    basic = basic_ml_scraper(formatted_query, max_items=max_items, session=session)
     results_html = basic.get('results', [])
     combined = deduplicate_items(results_html, max_items)
-    return {
+    result = {
         "results": combined,
         "source": "mercadolibre",
         "source_label": "Mercado Libre",
         "query": search_query,
         "url": full_url,
     }
+    if basic.get("error"):
+        result["error"] = basic["error"]
+    if basic.get("blocked"):
+        result["blocked"] = True
+    return result
 
 
 def process_search_falabella(search_query: str, max_retries: int = 3, max_items: int = 5):
     if not search_query:
         return {"results": []}
 
-    delay = random.uniform(2.0, 5.0) 
-    time.sleep(delay)
-
-    base_url = "https://www.falabella.com.co/falabella-co/"
-    full_url = f"{base_url}search?Ntt={quote_plus(search_query)}"
+    site = base_url("falabella")
+    full_url = f"{site}/falabella-co/search?Ntt={quote_plus(clean_query(search_query))}"
 
-    session = create_http_session(max_retries=max_retries)
-    headers = get_realistic_headers()
-    headers.update({
-        "Referer": "https://www.falabella.com.co/",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-    })
-    session.headers.update(headers)
-    session.headers["Accept-Encoding"] = "gzip, deflate"
     try:
-        response = session.get(full_url, timeout=15)
+        response = session_get("falabella", full_url, extra_headers={
+            "Referer": f"{site}/",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
+        }, timeout=15)
         response.raise_for_status()
     except Exception as exc:
         logger.exception("Falabella: error al solicitar la página")
+        record_error(exc)
         return {
             "results": [],
             "error": str(exc),
@@ -100,71 +201,193 @@ def process_search_falabella(search_query: str, max_retries: int = 3, max_items:
             "query": search_query,
             "url": full_url,
         }
-    cencoding = (response.headers or {}).get("Content-Encoding", "")
     html = ""
     try:
-        if "br" in cencoding.lower():
-            try:
-                import brotli  # type: ignore
-                html = brotli.decompress(response.content).decode("utf-8", "replace")
-            except Exception:
-                # requests no decodifica br por defecto
-                response.encoding = response.encoding or "utf-8"
-                html = response.text or ""
-        else:
-            # gzip/deflate los maneja requests
-            response.encoding = response.encoding or response.apparent_encoding or "utf-8"
-            html = response.text or ""
+        with phase("decompress"):
+            html = _decode_falabella(response)
     except Exception:
         try:
             html = (response.content or b"").decode("utf-8", "replace")
         except Exception:
             html = response.text or ""
-    # Señales de anti-bot / captcha
-    text_lower = html.lower()
-    if any(k in text_lower for k in ["captcha", "no eres un robot", "robot check", "access denied", "awswaf"]):
-        pass  # Posible bloqueo detectado
+    capture_page("falabella", full_url, html)
 
-    # Construcción de soup con fallbacks de parser
+    # Construcción de soup con el backend de settings.SCRAPER_HTML_PARSER y fallbacks
+    card_stats: dict = {}
+    extraction: dict = {}
     try:
-        soup = BeautifulSoup(html, "html.parser")
-    except Exception:
-        try:
-            soup = BeautifulSoup(html, "lxml")  # type: ignore
-        except Exception:
-            try:
-                soup = BeautifulSoup(html, "html5lib")  # type: ignore
-            except Exception as exc2:
-                logger.exception("FB soup: all parsers failed")
-                return {
-                    "results": [],
-                    "error": f"BeautifulSoup failed: {exc2}",
-                    "source": "falabella",
-                    "source_label": "Falabella",
-                    "query": search_query,
-                    "url": full_url,
-                }
-
-    items_cards = parse_falabella_cards(soup, max_items=max_items)
-    if not items_cards:
-        items_cards = parse_next_data_products(soup, max_items=max_items)
-    if not items_cards:
-        items_cards = parse_json_ld(soup, max_items=max_items)
-    if not items_cards:
-        items_cards = parse_generic_by_regex_domain(soup, domain_substring="falabella.com.co", max_items=max_items)
+        items_cards = parse_page(
+            "falabella", html,
+            lambda soup: extract_falabella_items(soup, max_items, stats=card_stats, meta=extraction),
+        )
+    except Exception as exc2:
+        logger.exception("FB soup: all parsers failed")
+        record_error(exc2)
+        return {
+            "results": [],
+            "error": f"BeautifulSoup failed: {exc2}",
+            "source": "falabella",
+            "source_label": "Falabella",
+            "query": search_query,
+            "url": full_url,
+        }
+    record_parser(extractor=extraction.get("extractor"))
+    blocked = not items_cards and looks_blocked(html)
+    if blocked:
+        # Señales de anti-bot / captcha
+        record_error("Blocked")
 
     items_dedup = deduplicate_items(items_cards, max_items)
+    record_card_stats(card_stats)
 
-    return {
+    result = {
         "results": items_dedup,
         "source": "falabella",
         "source_label": "Falabella",
         "query": search_query,
         "url": full_url,
+        "card_stats": card_stats,
+        "extraction": extraction,
     }
-
-
-def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict]:
+    if blocked:
+        result["blocked"] = True
+    return result
+
+
+def _decode_falabella(response: requests.Response) -> str:
+    # urllib3 descomprime gzip/deflate y, si está instalado el decodificador, br
+    # (solo entonces se anuncia en ACCEPT_ENCODING)
+    response.encoding = response.encoding or response.apparent_encoding or "utf-8"
+    return response.text or ""
+
+
+def extract_falabella_items(soup: BeautifulSoup, max_items: int = 20, stats: dict | None = None,
+                            meta: dict | None = None) -> list[dict]:
+    """
+    Tarjetas y, si no hay, los fallbacks en orden de fiabilidad. En `meta` queda qué
+    extractor dio los items ("extractor") y, para el JSON embebido, la ruta usada.
+    """
+    if meta is not None:
+        meta.clear()
+    extractor = "cards"
+    items_cards = parse_falabella_cards(soup, max_items=max_items, stats=stats)
+    if not items_cards:
+        extractor = "next_data"
+        items_cards = parse_next_data_products(soup, max_items=max_items, source="falabella", meta=meta)
+    if not items_cards:
+        extractor = "json_ld"
+        items_cards = parse_json_ld(soup, max_items=max_items)
+    if not items_cards:
+        extractor = "generic"
+        items_cards = parse_generic_by_regex_domain(soup, domain_substring="falabella.com.co", max_items=max_items)
+    if meta is not None and items_cards:
+        meta["extractor"] = extractor
+    return items_cards
+
+
+# Motivos por los que parse_falabella_cards descarta una tarjeta
+CARD_DISCARD_REASONS = ("no_link", "duplicate", "no_title", "no_price", "error")
+
+_card_stats_lock = threading.Lock()
+_card_stats_totals: dict[str, int] = {"cards": 0, "items": 0, **{r: 0 for r in CARD_DISCARD_REASONS}}
+
+
+def record_card_stats(stats: dict) -> None:
+    # Acumula en el proceso las estadísticas de una búsqueda de Falabella
+    with _card_stats_lock:
+        for key, value in stats.items():
+            if key in _card_stats_totals:
+                _card_stats_totals[key] += value
+
+
+def card_stats() -> dict:
+    with _card_stats_lock:
+        return dict(_card_stats_totals)
+
+
+def _runtime_gauges() -> list[tuple]:
+    # Estado de caché, coalescencia y tarjetas de Falabella leído al exportar /metrics
+    samples = []
+    for key, value in RESULT_CACHE.stats().items():
+        samples.append(("search_cache_state", "gauge", {"stat": key}, value))
+    for key, value in SINGLE_FLIGHT.stats().items():
+        samples.append(("search_coalescing_state", "gauge", {"stat": key}, value))
+    for key, value in card_stats().items():
+        samples.append(("falabella_cards_total", "counter", {"outcome": key}, value))
+    for key, value in HISTORY.stats().items():
+        samples.append(("price_history_state", "gauge", {"stat": key}, value))
+    for key, value in INDEX.stats().items():
+        samples.append(("search_index_state", "gauge", {"stat": key}, value))
+    for key, value in RETRY_BUDGET.stats().items():
+        samples.append(("scraper_retry_budget", "gauge", {"stat": key}, value))
+    for source, circuit in BREAKER.stats().items():
+        samples.append(("circuit_breaker_open", "gauge", {"source": source}, int(circuit["state"] != "closed")))
+        samples.append(("circuit_breaker_short_circuits_total", "counter", {"source": source},
+                        circuit["short_circuits"]))
+    return samples
+
+
+METRICS.register_collector(_runtime_gauges)
+
+
+# Claves de _scan_card en orden de preferencia para el precio de una tarjeta
+_FB_PRICE_ATTRS = ("data-event-price", "data-internet-price", "data-cmr-price", "data-normal-price")
+_FB_PRICE_NODES = ("price:pod-prices__price", "price:fb-price", "price:data-qa", "price:class")
+
+
+def _scan_card(container) -> dict:
+    """
+    Recorre una sola vez los descendientes de una tarjeta y guarda el primer nodo de
+    cada tipo que necesitan los extractores: título, subtítulo, enlace, imagen y los
+    candidatos a precio. Sustituye a un select_one por selector y tarjeta.
+    """
+    card: dict = {}
+    if container is None:
+        return card
+    for node in container.find_all():
+        name = node.name
+        classes = node.get("class") or []
+        if name == "b":
+            if "pod-title" in classes:
+                card.setdefault("title", node)
+            elif "pod-subTitle" in classes:
+                card.setdefault("subtitle", node)
+        elif name == "a":
+            if node.has_attr("href"):
+                card.setdefault("link", node)
+        elif name == "img":
+            card.setdefault("img", node)
+            parent = node.parent
+            if parent is not None and parent.name == "picture":
+                card.setdefault("picture_img", node)
+        for attr in _FB_PRICE_ATTRS:
+            if node.has_attr(attr):
+                card.setdefault(attr, node)
+        if classes:
+            if "pod-prices__price" in classes:
+                card.setdefault("price:pod-prices__price", node)
+            if "fb-price" in classes:
+                card.setdefault("price:fb-price", node)
+            if any("price" in cls for cls in classes):
+                card.setdefault("price:class", node)
+        if node.get("data-qa") == "price":
+            card.setdefault("price:data-qa", node)
+    return card
+
+
+def _card_thumbnail(card: dict) -> Optional[str]:
+    img_tag = card.get("picture_img") or card.get("img")
+    if img_tag:
+        return img_tag.get("data-src") or img_tag.get("src")
+    return None
+
+
+def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20, stats: dict | None = None) -> list[dict]:
+    """
+    Extrae productos de las tarjetas (pods) de Falabella en una sola pasada: cada
+    contenedor se visita una vez aunque tenga varias anclas. Si se pasa `stats`, se
+    rellena con las tarjetas vistas, los items y un contador por motivo de descarte.
+    """
     items: list[dict] = []
 
     # Anclas típicas que apuntan a la página de producto
@@ -202,7 +425,7 @@ def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict
             ))
         )) or node.parent
 
-    def resolve_link(a_tag, container_tag) -> Optional[str]:
+    def resolve_link(a_tag, container_tag, card: dict) -> Optional[str]:
         candidates: list[str] = []
         # 1) href directo del anchor
         if a_tag:
@@ -210,10 +433,9 @@ def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict
             if href:
                 candidates.append(href)
         # 2) anchor descendiente con /product/
-        if container_tag:
-            inner_a = container_tag.find("a", href=True)
-            if inner_a and "/product/" in (inner_a.get("href") or ""):
-                candidates.append(inner_a.get("href"))
+        inner_a = card.get("link")
+        if inner_a and "/product/" in (inner_a.get("href") or ""):
+            candidates.append(inner_a.get("href"))
         # 3) mirar padres cercanos por anchors
         parent = container_tag
         hop = 0
@@ -244,36 +466,20 @@ def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict
                 return link
         return None
 
-    def extract_title(a_tag, container_tag):
+    def extract_title(a_tag, card: dict):
         # Priorizar estructura pod-title + pod-subTitle
-        parts: list[str] = []
-        if container_tag:
-            t1 = container_tag.select_one("b.pod-title")
-            t2 = container_tag.select_one("b.pod-subTitle")
-            if t1:
-                parts.append(t1.get_text(strip=True))
-            if t2:
-                parts.append(t2.get_text(strip=True))
+        parts = [card[k].get_text(strip=True) for k in ("title", "subtitle") if card.get(k)]
         text = " ".join([p for p in parts if p])
         if text:
             return text
         # Fallback: texto del propio anchor
         return a_tag.get_text(strip=True)
 
-    def extract_price(container_tag, around_tag) -> tuple[Optional[int], Optional[str]]:
+    def extract_price(card: dict, container_tag, around_tag) -> tuple[Optional[int], Optional[str]]:
         if not container_tag and not around_tag:
             return None, None
         # 1) Atributos frecuentes en Falabella
-        attr_node = None
-        if container_tag:
-            attr_node = (
-                container_tag.select_one("[data-event-price]")
-                or container_tag.select_one("[data-internet-price]")
-                or container_tag.select_one("li[data-event-price]")
-                or container_tag.select_one("li[data-internet-price]")
-                or container_tag.select_one("li[data-cmr-price]")
-                or container_tag.select_one("li[data-normal-price]")
-            )
+        attr_node = next((card[k] for k in _FB_PRICE_ATTRS if k in card), None)
         if attr_node:
             val = (
                 attr_node.get("data-internet-price")
@@ -285,14 +491,7 @@ def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict
                 return extract_price_cop(val), "attr"
 
         # 2) Nodos de precio comunes por clases/atributos de QA
-        price_node = None
-        if container_tag:
-            price_node = (
-                container_tag.select_one(".pod-prices__price")
-                or container_tag.select_one(".fb-price")
-                or container_tag.select_one("[data-qa='price']")
-                or container_tag.select_one("[class*='price']")
-            )
+        price_node = next((card[k] for k in _FB_PRICE_NODES if k in card), None)
         price_text = price_node.get_text(" ", strip=True) if price_node else None
         if price_text:
             return extract_price_cop(price_text), "node"
@@ -310,86 +509,180 @@ def parse_falabella_cards(soup: BeautifulSoup, max_items: int = 20) -> list[dict
             return extract_price_cop(price_text), "regex"
         return None, None
 
-    def extract_thumb(container_tag):
-        if not container_tag:
-            return None
-        img_tag = (
-            container_tag.select_one("picture img") or
-            container_tag.select_one("img")
-        )
-        if img_tag:
-            return img_tag.get("data-src") or img_tag.get("src")
-        return None
-
-    discards_duplicate = 0
-    discards_no_title_or_link = 0
-    discards_no_price = 0
-    sample_logged = 0
-    derived_link_count = 0
+    counts = {"cards": 0, "items": 0, **{r: 0 for r in CARD_DISCARD_REASONS}}
+    seen_cards: set[int] = set()
 
     for a in anchors:
+        if len(items) >= max_items:
+            break
         try:
             container = find_container(a)
-            href = resolve_link(a, container) or ""
-            if not href:
-                discards_no_title_or_link += 1
+            # Imagen y título suelen ser anclas distintas de la misma tarjeta
+            card_id = node_identity(container if container is not None else a)
+            if card_id in seen_cards:
                 continue
-            else:
-                derived_link_count += 1
+            seen_cards.add(card_id)
+            counts["cards"] += 1
 
+            card = _scan_card(container)
+            href = resolve_link(a, container, card)
+            if not href:
+                counts["no_link"] += 1
+                continue
             if href in seen_links:
-                discards_duplicate += 1
+                counts["duplicate"] += 1
                 continue
             seen_links.add(href)
 
-            title = extract_title(a, container)
-            price_cop, price_method = extract_price(container, a)
-            thumbnail = extract_thumb(container)
-
-            if title and href and price_cop is not None:
-                # Filtrar accesorios irrelevantes para consultas de celulares
-                lower_title = title.lower()
-                if any(w in lower_title for w in ACCESSORY_BLACKLIST):
-                    continue
-                items.append(
-                    {
-                        "title": title,
-                        "link": href,
-                        "price_cop": price_cop,
-                        "price_str": format_price_cop(price_cop),
-                        "thumbnail": thumbnail,
-                    }
-                )
-                sample_logged += 1
-            if len(items) >= max_items:
-                break
-        except Exception:
-            continue
-
-    # Contabilizar descartes por precio
-    for a in anchors:
-        # Nota: segunda pasada para contar no_precio si no estaba en seen_links
-        try:
-            href = a.get("href") or ""
-            if not href:
+            title = extract_title(a, card)
+            if not title:
+                counts["no_title"] += 1
                 continue
-            if not href.startswith("http"):
-                href = f"https://www.falabella.com.co{href}"
-            if href in {it["link"] for it in items}:
+            price_cop, _ = extract_price(card, container, a)
+            if not price_cop:
+                # "Agotado" y similares dan 0: no es un precio y ganaría siempre como el más barato
+                counts["no_price"] += 1
                 continue
-            container = find_container(a)
-            price_val, _ = extract_price(container, a)
-            if price_val is None:
-                discards_no_price += 1
+
+            items.append(
+                {
+                    "title": title,
+                    "link": href,
+                    "price_cop": price_cop,
+                    "price_str": format_price_cop(price_cop),
+                    "thumbnail": _card_thumbnail(card),
+                }
+            )
         except Exception:
-            pass
+            counts["error"] += 1
 
+    counts["items"] = len(items)
+    if stats is not None:
+        stats.clear()
+        stats.update(counts)
+    return items
 
 
-    return items
+# Rutas conocidas de la lista de productos dentro de __NEXT_DATA__ por fuente.
+# Si ninguna existe se recorre todo el JSON buscando dicts con pinta de producto.
+NEXT_DATA_PRODUCT_PATHS: dict[str, list[tuple[str, ...]]] = {
+    "falabella": [
+        ("props", "pageProps", "results"),
+    ],
+}
+
+_JSON_PRICE_KEYS = ('price', 'salePrice', 'internetPrice', 'eventPrice', 'cmrPrice', 'displayPrice')
+_JSON_TITLE_KEYS = ('name', 'displayName', 'title')
+_JSON_URL_KEYS = ('url', 'link', 'pdpUrl', 'productUrl')
+_JSON_IMAGE_KEYS = ('image', 'thumbnail', 'img', 'imageUrl', 'images', 'mediaUrls')
+# Preferencia entre los precios de la lista `prices` de Falabella
+_JSON_PRICE_TYPES = ('eventPrice', 'internetPrice', 'cmrPrice', 'normalPrice')
+
+
+def _pick_first(d: dict, keys: tuple[str, ...]):
+    for k in keys:
+        if k in d and d[k]:
+            return d[k]
+    return None
+
+
+def _json_prices_value(prices: list):
+    # [{"type": "internetPrice", "price": ["599.900"], "crossed": false}, ...]
+    entries = [p for p in prices if isinstance(p, dict) and p.get('price')]
+    if not entries:
+        return None
+    by_type = {p.get('type'): p for p in entries}
+    entry = next((by_type[t] for t in _JSON_PRICE_TYPES if t in by_type), None)
+    entry = entry or next((p for p in entries if not p.get('crossed')), entries[0])
+    value = entry['price']
+    return value[0] if isinstance(value, list) and value else value
+
+
+def _json_product(d: dict) -> dict | None:
+    # Convierte un dict del JSON embebido en item si tiene título, URL de Falabella y precio
+    possible_title = _pick_first(d, _JSON_TITLE_KEYS)
+    possible_url = _pick_first(d, _JSON_URL_KEYS)
+    if not possible_title or not possible_url:
+        return None
+    possible_price = _pick_first(d, _JSON_PRICE_KEYS)
+    if possible_price is None and isinstance(d.get('prices'), list):
+        possible_price = _json_prices_value(d['prices'])
+    if possible_price is None:
+        return None
+
+    url_val = str(possible_url)
+    if url_val.startswith('/'):
+        url_val = f"https://www.falabella.com.co{url_val}"
+    if 'falabella.com' not in url_val:
+        return None
 
+    if isinstance(possible_price, (int, float)):
+        price_cop = int(float(possible_price))
+    else:
+        price_cop = extract_price_cop(str(possible_price))
+    if not price_cop:
+        return None
 
-def parse_next_data_products(soup: BeautifulSoup, max_items: int = 20) -> list[dict]:
+    possible_image = _pick_first(d, _JSON_IMAGE_KEYS)
+    # Si images es lista, tomar la primera cadena
+    if isinstance(possible_image, list) and possible_image:
+        possible_image = next((x for x in possible_image if isinstance(x, str) and x.startswith('http')), None)
+    return {
+        'title': str(possible_title),
+        'link': url_val,
+        'price_cop': price_cop,
+        'price_str': format_price_cop(price_cop),
+        'thumbnail': possible_image if isinstance(possible_image, str) else None,
+    }
+
+
+def _load_script_json(raw: str):
+    try:
+        return json.loads(raw)
+    except Exception:
+        pass
+    # A veces hay JS con asignaciones: decodificar el primer objeto JSON desde la primera llave
+    start = raw.find('{')
+    if start < 0:
+        return None
+    try:
+        return json.JSONDecoder().raw_decode(raw, start)[0]
+    except Exception:
+        return None
+
+
+def _follow_path(data, path: tuple[str, ...]):
+    for key in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def _walk_json_products(data, results: list[dict], max_items: int) -> None:
+    # Recorrido iterativo en preorden (mismo orden que la versión recursiva) con salida temprana
+    stack = [data]
+    while stack and len(results) < max_items:
+        node = stack.pop()
+        if isinstance(node, dict):
+            item = _json_product(node)
+            if item:
+                results.append(item)
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            continue
+        stack.extend(c for c in reversed(list(children)) if isinstance(c, (dict, list)))
+
+
+def parse_next_data_products(soup: BeautifulSoup, max_items: int = 20, source: str = "falabella",
+                             meta: dict | None = None) -> list[dict]:
+    """
+    Productos del JSON embebido (__NEXT_DATA__ y scripts application/json). Primero se
+    prueban las rutas conocidas de la fuente; solo si no aparecen se recorre el JSON
+    completo. En `meta["next_data_path"]` queda la ruta usada ("walk" si fue el recorrido).
+    """
     results: list[dict] = []
     try:
         scripts: list = []
@@ -397,91 +690,38 @@ def parse_next_data_products(soup: BeautifulSoup, max_items: int = 20) -> list[d
         if by_id:
             scripts.append(by_id)
         # Algunos sitios embeben JSON en scripts type application/json
-        scripts.extend(soup.find_all('script', {'type': 'application/json'}))
-
-        def iter_dicts(obj):
-            if isinstance(obj, dict):
-                yield obj
-                for v in obj.values():
-                    yield from iter_dicts(v)
-            elif isinstance(obj, list):
-                for it in obj:
-                    yield from iter_dicts(it)
-
-        price_keys = {'price', 'salePrice', 'internetPrice', 'eventPrice', 'cmrPrice', 'displayPrice'}
-        title_keys = {'name', 'displayName', 'title'}
-        url_keys = {'url', 'link', 'pdpUrl', 'productUrl'}
-        image_keys = {'image', 'thumbnail', 'img', 'imageUrl', 'images'}
-
-        def pick_first(d: dict, keys: set[str]):
-            for k in keys:
-                if k in d and d[k]:
-                    return d[k]
-            return None
+        # (__NEXT_DATA__ también es application/json: no parsearlo dos veces)
+        skip = node_identity(by_id) if by_id else None
+        scripts.extend(sc for sc in soup.find_all('script', {'type': 'application/json'}) if node_identity(sc) != skip)
 
+        payloads = []
         for sc in scripts:
             raw = sc.string or sc.get_text(strip=True) or ''
-            if not raw:
+            data = _load_script_json(raw) if raw else None
+            if data is None:
                 continue
-            # Intentar parsear como JSON completo
-            try:
-                data = json.loads(raw)
-            except Exception:
-                # A veces hay JS con asignaciones; intentar extraer bloque JSON entre llaves
-                m = re.search(r"\{[\s\S]*\}", raw)
-                if not m:
+            payloads.append(data)
+            for path in NEXT_DATA_PRODUCT_PATHS.get(source, []):
+                products = _follow_path(data, path)
+                if not isinstance(products, list):
                     continue
-                try:
-                    data = json.loads(m.group(0))
-                except Exception:
-                    continue
-
-            count_before = len(results)
-            for d in iter_dicts(data):
-                if not isinstance(d, dict):
-                    continue
-                # Detectar estructura de producto básica
-                possible_title = pick_first(d, title_keys)
-                possible_url = pick_first(d, url_keys)
-                possible_price = pick_first(d, price_keys)
-                possible_image = pick_first(d, image_keys)
-
-                # Si images es lista, tomar la primera cadena
-                if isinstance(possible_image, list) and possible_image:
-                    possible_image = next((x for x in possible_image if isinstance(x, str) and x.startswith('http')), None)
-
-                if not possible_title or not possible_url or possible_price is None:
-                    continue
-
-                # Filtrar por dominio de falabella y por ruta de producto si es posible
-                url_val = str(possible_url)
-                if url_val.startswith('/'):
-                    url_val = f"https://www.falabella.com.co{url_val}"
-                if 'falabella.com' not in url_val:
-                    continue
-
-                # Normalizar precio
-                if isinstance(possible_price, (int, float)):
-                    price_cop = int(float(possible_price))
-                else:
-                    price_cop = extract_price_cop(str(possible_price))
-
-                if not price_cop:
-                    continue
-
-                results.append({
-                    'title': str(possible_title),
-                    'link': url_val,
-                    'price_cop': price_cop,
-                    'price_str': format_price_cop(price_cop),
-                    'thumbnail': possible_image if isinstance(possible_image, str) else None,
-                })
-
-                if len(results) >= max_items:
-                    break
-
+                for product in products:
+                    item = _json_product(product) if isinstance(product, dict) else None
+                    if item:
+                        results.append(item)
+                        if len(results) >= max_items:
+                            break
+                if results:
+                    if meta is not None:
+                        meta["next_data_path"] = ".".join(path)
+                    return results
+
+        for data in payloads:
+            _walk_json_products(data, results, max_items)
             if len(results) >= max_items:
                 break
+        if results and meta is not None:
+            meta["next_data_path"] = "walk"
     except Exception:
         pass
     return results
@@ -514,7 +754,7 @@ def get_realistic_headers():
         'User-Agent': random.choice(user_agents),
         'Accept-Language': 'es-CO,es;q=0.9,en-US;q=0.8',
         'Referer': random.choice(referers),
-        'Accept-Encoding': 'gzip, deflate, br',
+        'Accept-Encoding': ACCEPT_ENCODING,
         'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
         'DNT': '1' if random.random() < PROBABILIDAD_DNT_ACTIVADO else '0',
         'Connection': 'keep-alive',
@@ -531,44 +771,102 @@ def get_realistic_headers():
     return hdrs
 
 
-def warm_up_ml_session(session: requests.Session) -> None:
+def remaining_timeout(default: float) -> float:
+    # Timeout de una petición acotado por lo que queda del presupuesto de la búsqueda
+    deadline = SEARCH_DEADLINE.get()
+    if deadline is None:
+        return default
+    return max(MIN_REQUEST_TIMEOUT, min(default, deadline - time.monotonic()))
+
+
+def session_get(source: str, url: str, extra_headers: dict | None = None, timeout: float = 15,
+                session: requests.Session | None = None) -> requests.Response:
+    # Reutiliza la sesión persistente de la fuente; las cabeceras rotan en cada petición
+    session = session or get_session(source)
+    headers = get_realistic_headers()
+    if extra_headers:
+        headers.update(extra_headers)
+
+    def send() -> requests.Response:
+        # Espera solo si el ritmo reciente hacia este host supera su presupuesto de cortesía
+        add_phase("politeness", POLITENESS.wait(url, deadline=SEARCH_DEADLINE.get()))
+        with phase("fetch"):
+            response = session.get(url, headers=headers, timeout=remaining_timeout(timeout))
+        add_bytes(_response_bytes(response))
+        return response
+
+    # Backoff, 429/5xx con Retry-After, presupuesto de reintentos y hedging (home.retry)
+    return fetch_with_retry(source, send, deadline=SEARCH_DEADLINE.get())
+
+
+def _response_bytes(response: requests.Response) -> int:
+    # Bytes recibidos por la red (comprimidos si el servidor envió Content-Length)
+    length = (response.headers or {}).get("Content-Length")
+    if length and length.isdigit():
+        return int(length)
+    return len(response.content or b"")
+
+
+def looks_blocked(html: str | None) -> bool:
+    text_lower = (html or "").lower()
+    return any(k in text_lower for k in BLOCK_MARKERS)
+
+
+def warm_up_ml_session(session: requests.Session) -> bool:
+    # Visita portada y ofertas para obtener las cookies de un navegador real
     try:
-        base = "https://www.mercadolibre.com.co/"
-        r1 = session.get(base, timeout=10)
-        # Delay más realista entre páginas
-        delay = random.uniform(1.0, 3.0)
-        time.sleep(delay)
-        offers = "https://www.mercadolibre.com.co/ofertas"
-        r2 = session.get(offers, timeout=10)
+        base = f"{base_url('mercadolibre')}/"
+        r1 = session_get("mercadolibre", base, timeout=10, session=session)
+        offers = f"{base_url('mercadolibre')}/ofertas"
+        r2 = session_get("mercadolibre", offers, timeout=10, session=session)
+        return r1.ok and r2.ok
     except Exception:
-        pass
+        return False
+
+
+def ensure_ml_session_warm(session: requests.Session) -> None:
+    # Calienta la sesión compartida solo la primera vez, al vencer WARMUP_TTL o tras un bloqueo
+    if not SESSIONS.claim_warmup("mercadolibre"):
+        return
+    ok = False
+    try:
+        ok = warm_up_ml_session(session)
+    finally:
+        SESSIONS.finish_warmup("mercadolibre", ok)
 
 
 def slugify_query(query: str) -> str:
-    # Normaliza a minúsculas, reemplaza espacios por guiones y elimina caracteres no alfanuméricos ni guiones
-    q = (query or "").strip().lower()
-    q = re.sub(r"\s+", "-", q)
-    q = re.sub(r"[^a-z0-9\-]", "", q)
-    q = re.sub(r"-+", "-", q).strip('-')
-    return q or ""
+    # Ruta de búsqueda de Mercado Libre: palabras de source_words unidas por guiones, con tildes
+    # y eñes codificadas en UTF-8 ("Cámara Sony" -> "c%C3%A1mara-sony", no "cmara-sony")
+    return quote("-".join(source_words(query)))
 
 
-def basic_ml_scraper(search_slug: str, max_items: int = 5) -> dict:
-    url = f"https://listado.mercadolibre.com.co/{search_slug}"
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; Scraper/1.0)"}
+def basic_ml_scraper(search_slug: str, max_items: int = 5, session: requests.Session | None = None) -> dict:
+    url = f"{base_url('mercadolibre_listado')}/{search_slug}"
     try:
-        response = requests.get(url, headers=headers, timeout=15)
+        response = session_get("mercadolibre", url, timeout=15, session=session)
+        if response.status_code in (403, 429):
+            SESSIONS.invalidate_warmup("mercadolibre", clear_cookies=True)
         response.raise_for_status()
     except Exception as exc:
         logger.exception("BASIC ML: error al solicitar la página")
+        record_error(exc)
         return {"results": [], "url": url, "preview": "", "error": str(exc)}
 
-    html = response.text or ""
+    with phase("decompress"):
+        html = response.text or ""
+    capture_page("mercadolibre", url, html)
     preview = html[:1000]
-    soup = BeautifulSoup(html, 'html.parser')
-
-    anchors = _select_basic_title_anchors(soup)
-    items = _collect_items_from_anchors(anchors, max_items)
+    items = parse_page(
+        "mercadolibre", html,
+        lambda soup: _collect_items_from_anchors(_select_basic_title_anchors(soup), max_items),
+    )
+    record_parser(extractor="anchors")
+    if not items and looks_blocked(html):
+        # Página de verificación: las cookies actuales ya no sirven
+        SESSIONS.invalidate_warmup("mercadolibre", clear_cookies=True)
+        record_error("Blocked")
+        return {"results": [], "url": url, "preview": preview, "blocked": True}
     return {"results": items, "url": url, "preview": preview}
 
 
@@ -634,29 +932,10 @@ def _extract_thumbnail(container) -> Optional[str]:
 
 
 def create_http_session(max_retries: int = 3) -> requests.Session:
-    try:
-        import cloudscraper  # type: ignore
-        scraper = cloudscraper.create_scraper(
-            browser={
-                'browser': 'chrome',
-                'platform': 'windows',
-                'desktop': True,
-            },
-            delay=random.uniform(0.3, 0.8),
-        )
-        # cloudscraper ya hereda de requests.Session
-        return scraper
-    except Exception:
-        session = requests.Session()
-        adapter = HTTPAdapter(
-            max_retries=max_retries,
-            pool_connections=10,
-            pool_maxsize=30,
-        )
-        session.mount("https://", adapter)
-        session.mount("http://", adapter)
-        session.headers.update({"Accept-Encoding": "gzip"})
-        return session
+    # Sesión nueva e independiente; los scrapers usan get_session() para reutilizar conexiones
+    config = get_pool_config()
+    config["MAX_RETRIES"] = max_retries
+    return build_session(config)
 
 def parse_mercadolibre_results(soup: BeautifulSoup, max_items: int = 20):
     items = []
@@ -1000,9 +1279,17 @@ def format_price_cop(value: int) -> str:
 
 def fallback_ml_api(search_query: str, limit: int = 20) -> list[dict]:
     try:
-        api_url = f"https://api.mercadolibre.com/sites/MCO/search?q={quote_plus(search_query)}&limit={limit}"
+        api_url = f"{base_url('mercadolibre_api')}/sites/MCO/search?q={quote_plus(clean_query(search_query))}&limit={limit}"
         headers = {'Accept': 'application/json', 'Accept-Language': 'es-CO'}
-        response = requests.get(api_url, headers=headers, timeout=10)
+
+        def send() -> requests.Response:
+            add_phase("politeness", POLITENESS.wait(api_url, deadline=SEARCH_DEADLINE.get()))
+            with phase("fetch"):
+                response = get_session("mercadolibre-api").get(api_url, headers=headers, timeout=remaining_timeout(10))
+            add_bytes(_response_bytes(response))
+            return response
+
+        response = fetch_with_retry("mercadolibre-api", send, deadline=SEARCH_DEADLINE.get())
         response.raise_for_status()
         data = response.json()
         items = []
@@ -1039,56 +1326,483 @@ def deduplicate_items(items: list[dict], max_items: int) -> list[dict]:
     unique.sort(key=lambda x: x.get('price_cop', 0))
     return unique
 
-def search_aggregated(search_query: str, sources: list[str] | None = None, max_items_per_source: int = 10):
-    if not search_query:
-        return {"results": [], "errors": []}
+def call_scraper(source: str, search_query: str, max_items: int) -> dict:
+    entry = SCRAPERS[source]
+    # Con el circuito abierto falla al instante con CircuitOpen, sin tocar el marketplace
+    with BREAKER.guard(source) as outcome, scraper_run(source) as run:
+        if entry["is_async"]:
+            # Scraper async invocado desde un hilo del pipeline síncrono
+            data = asyncio.run(entry["function"](search_query, max_items=max_items))
+        else:
+            data = entry["function"](search_query, max_items=max_items)
+        _record_outcome(outcome, run, data)
+        return _finish_scrape(source, data, search_query)
+
+
+def _record_outcome(outcome: dict, run: dict, data) -> None:
+    outcome["failure"] = failure_reason(data)
+    # Sin turno de cortesía a tiempo no se llegó a pedir nada: no cuenta para el circuito
+    outcome["inconclusive"] = bool(outcome["failure"]) and run["error_class"] == PolitenessTimeout.__name__
+
+
+def _finish_scrape(source: str, data: dict, search_query: str) -> dict:
+    # Filtro de relevancia, conteo final de items y envío al histórico de precios (en segundo plano)
+    data = apply_relevance_filter(data, search_query)
+    if isinstance(data, dict):
+        record_items(len(data.get("results") or []))
+        HISTORY.record(source, data.get("results") or [])
+    return data
+
+
+def apply_relevance_filter(data: dict, search_query: str) -> dict:
+    # Mismo filtro de accesorios para todas las fuentes, antes de guardar en caché
+    if not isinstance(data, dict) or not data.get("results"):
+        return data
+    data["results"], removed = filter_accessories(data["results"], search_query)
+    if removed:
+        data["filtered_accessories"] = removed
+    return data
+
+
+def _get_sync_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _sync_executor
+    with _sync_executor_lock:
+        if _sync_executor is None:
+            _sync_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=SYNC_SCRAPER_WORKERS, thread_name_prefix="scraper"
+            )
+        return _sync_executor
+
+
+async def call_scraper_async(source: str, search_query: str, max_items: int) -> dict:
+    entry = SCRAPERS[source]
+    with BREAKER.guard(source) as outcome, scraper_run(source) as run:
+        if entry["is_async"]:
+            data = await entry["function"](search_query, max_items=max_items)
+        elif profiling_active():
+            # Petición perfilada (home.profiling): su event loop es propio y el perfilador solo ve este hilo
+            data = entry["function"](search_query, max_items=max_items)
+        else:
+            # Adaptador: los scrapers síncronos corren en un pool de hilos sin bloquear el event loop.
+            # El contexto copiado lleva la ejecución en curso, así las fases se registran desde el hilo
+            loop = asyncio.get_running_loop()
+            ctx = contextvars.copy_context()
+            call = functools.partial(entry["function"], search_query, max_items=max_items)
+            data = await loop.run_in_executor(_get_sync_executor(), ctx.run, call)
+        _record_outcome(outcome, run, data)
+        return _finish_scrape(source, data, search_query)
+
+
+def _cached_result(source: str, search_query: str, max_items: int) -> dict | None:
+    # Consulta la caché; una entrada vencida (stale) se sirve y se refresca en segundo plano
+    cached, state, meta = RESULT_CACHE.lookup_entry(search_query, source, max_items)
+    if state == MISS:
+        return None
+    METRICS.inc("search_cache_total", {"source": source, "state": state})
+    # Entrada guardada por el precalentamiento (home.prewarm): sin él habría sido un scraping en frío
+    warmed_in = meta.get("prewarm_seconds")
+    if warmed_in is not None and state != STALE:
+        METRICS.inc("prewarm_cache_hits_total", {"source": source})
+        METRICS.inc("prewarm_saved_seconds_total", {"source": source}, warmed_in)
+    if state == STALE and BREAKER.available(source):
+        # Con el circuito abierto se sigue sirviendo lo guardado sin intentar refrescarlo
+        RESULT_CACHE.schedule_refresh(
+            search_query, source, max_items,
+            functools.partial(call_scraper, source, search_query, max_items),
+        )
+    cached["cached"] = True
+    return cached
+
+
+def _indexed_result(source: str, search_query: str, max_items: int) -> dict | None:
+    """
+    Respuesta armada desde el índice local si tiene suficientes items recientes de la
+    fuente que pasen el filtro de relevancia. Cada item lleva su antigüedad y, si está
+    configurado, se programa el scraping real en segundo plano para la caché.
+    """
+    config = get_index_config()
+    now = time.time()
+    # Se piden de más: el filtro de accesorios puede descartar algunos
+    rows = INDEX.search(source, search_query, max_items * 2)
+    data = apply_relevance_filter({
+        "results": [
+            {
+                "title": row["title"],
+                "link": row["link"],
+                "price_cop": row["price_cop"],
+                "price_str": format_price_cop(row["price_cop"]),
+                "thumbnail": row["thumbnail"],
+                "cache_age": int(now - row["seen_at"]),
+            }
+            for row in rows
+        ],
+    }, search_query)
+    items = data["results"][:max_items]
+    if len(items) < max(1, min(config["MIN_RESULTS"], max_items)):
+        METRICS.inc("search_index_total", {"source": source, "outcome": "miss"})
+        return None
+    METRICS.inc("search_index_total", {"source": source, "outcome": "hit"})
+    if config["REFRESH"] and BREAKER.available(source):
+        RESULT_CACHE.schedule_refresh(
+            search_query, source, max_items,
+            functools.partial(call_scraper, source, search_query, max_items),
+        )
+    data["results"] = items
+    data.update(cached=True, indexed=True, age_seconds=max(it["cache_age"] for it in items))
+    return data
+
+
+def index_first_enabled() -> bool:
+    return bool(get_index_config()["INDEX_FIRST"])
+
+
+def fetch_source(source: str, search_query: str, max_items: int, index_first: bool = False) -> dict:
+    # Consulta una fuente pasando por la caché de resultados y, en modo index-first, por el índice local
+    if profiling_active():
+        # Petición perfilada: siempre contra el marketplace, para medir y capturar la página
+        return call_scraper(source, search_query, max_items)
+    cached = _cached_result(source, search_query, max_items)
+    if cached is not None:
+        return cached
+    if index_first:
+        indexed = _indexed_result(source, search_query, max_items)
+        if indexed is not None:
+            return indexed
+
+    def scrape():
+        data = call_scraper(source, search_query, max_items)
+        RESULT_CACHE.set(search_query, source, max_items, data)
+        return data
+
+    # Búsquedas idénticas simultáneas esperan a la que ya está en curso
+    data, shared = SINGLE_FLIGHT.do(RESULT_CACHE.make_key(search_query, source, max_items), scrape)
+    METRICS.inc("search_cache_total", {"source": source, "state": "coalesced" if shared else MISS})
+    return copy_result(data) if shared else data
+
+
+async def _off_loop(fn, *args):
+    # E/S bloqueante (caché en disco, SQLite) en el pool de hilos, sin frenar el event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_sync_executor(), contextvars.copy_context().run, fn, *args)
+
+
+async def fetch_source_async(source: str, search_query: str, max_items: int, index_first: bool = False) -> dict:
+    if profiling_active():
+        return await call_scraper_async(source, search_query, max_items)
+    # El nivel compartido de la caché es un FileBasedCache: leer y deserializar no va en el loop
+    cached = await _off_loop(_cached_result, source, search_query, max_items)
+    if cached is not None:
+        return cached
+    if index_first:
+        # INDEX.search es una consulta SQLite síncrona
+        indexed = await _off_loop(_indexed_result, source, search_query, max_items)
+        if indexed is not None:
+            return indexed
+
+    async def scrape():
+        data = await call_scraper_async(source, search_query, max_items)
+        await _off_loop(RESULT_CACHE.set, search_query, source, max_items, data)
+        return data
+
+    data, shared = await SINGLE_FLIGHT.do_async(RESULT_CACHE.make_key(search_query, source, max_items), scrape)
+    METRICS.inc("search_cache_total", {"source": source, "state": "coalesced" if shared else MISS})
+    return copy_result(data) if shared else data
+
+
+def warm_source(source: str, search_query: str, max_items: int) -> dict:
+    """
+    Scrapea la fuente y guarda el resultado en la caché aunque la entrada siga
+    vigente (home.prewarm). Los metadatos de la entrada (no la respuesta) anotan
+    cuánto tardó el scraping: es la latencia que se ahorra el usuario que luego la
+    encuentre en caché.
+    """
+    def scrape():
+        started = time.perf_counter()
+        data = _run_with_deadline(time.monotonic() + get_search_budget(),
+                                  call_scraper, source, search_query, max_items)
+        if isinstance(data, dict):
+            RESULT_CACHE.set(search_query, source, max_items, data,
+                             meta={"prewarm_seconds": round(time.perf_counter() - started, 3)})
+        return data
+
+    # Si un usuario ya está buscando lo mismo, se comparte su scraping
+    data, _ = SINGLE_FLIGHT.do(RESULT_CACHE.make_key(search_query, source, max_items), scrape)
+    return data
+
+
+class SourceTimeout(Exception):
+    """La fuente no respondió dentro del presupuesto de la búsqueda."""
+
+
+def _new_accumulator() -> dict:
+    return {
+        "results": [],
+        "errors": [],
+        "cache": {"hits": [], "misses": [], "stale": [], "indexed": []},
+        "timed_out": [],
+        "started": time.perf_counter(),
+    }
+
 
+def _merge_source_result(acc: dict, source: str, data: dict | None, exc: BaseException | None) -> dict:
+    # Acumula la respuesta de una fuente y devuelve lo que aportó (items y avisos nuevos)
+    added = {"results": [], "errors": []}
+    entry = SCRAPERS.get(source)
+    if not entry:
+        return added
+    label = entry.get("label", source)
+    if exc is not None:
+        if isinstance(exc, SourceTimeout):
+            # Las demás excepciones ya se contaron dentro de scraper_run
+            acc["timed_out"].append(source)
+            METRICS.inc("scraper_errors_total", {"source": source, "error_class": "SourceTimeout"})
+        added["errors"].append(f"{label}: {exc}")
+        acc["errors"].extend(added["errors"])
+        return added
+    acc["cache"]["hits" if data.get("cached") else "misses"].append(label)
+    if data.get("stale"):
+        acc["cache"]["stale"].append({"source": label, "age_seconds": data.get("age_seconds", 0)})
+    if data.get("indexed"):
+        acc["cache"]["indexed"].append({"source": label, "age_seconds": data.get("age_seconds", 0)})
+    if data.get("results"):
+        for item in data["results"]:
+            # Etiquetar con el nombre amigable de la fuente
+            item["source"] = label
+        added["results"] = data["results"]
+        acc["results"].extend(data["results"])
+    if data.get("error"):
+        added["errors"].append(f"{label}: {data['error']}")
+        acc["errors"].extend(added["errors"])
+    return added
+
+
+def _best_item(items: list[dict]) -> dict | None:
+    return min(items, key=lambda x: x.get("price_cop", 0)) if items else None
+
+
+def _build_aggregated(search_query: str, sources: list[str], acc: dict) -> dict:
+    aggregated_items = acc["results"]
+    aggregated_items.sort(key=lambda x: x.get("price_cop", 0))
+
+    best_item = aggregated_items[0] if aggregated_items else None
+    METRICS.observe("search_duration_seconds", time.perf_counter() - acc["started"])
+
+    return {
+        "results": aggregated_items,
+        "errors": acc["errors"],
+        "query": search_query,
+        "sources": sources,
+        "best_item": best_item,
+        "cache": acc["cache"],
+        "timed_out": acc["timed_out"],
+    }
+
+
+def get_search_budget() -> float:
+    try:
+        from django.conf import settings
+        return float(getattr(settings, "SEARCH_BUDGET_SECONDS", DEFAULT_SEARCH_BUDGET))
+    except Exception:
+        return DEFAULT_SEARCH_BUDGET
+
+
+def _run_with_deadline(deadline: float, fn, *args):
+    # Cada hilo del executor fija su propio plazo para que remaining_timeout() lo vea
+    token = SEARCH_DEADLINE.set(deadline)
+    try:
+        return fn(*args)
+    finally:
+        SEARCH_DEADLINE.reset(token)
+
+
+def _resolve_sources(sources: list[str] | None) -> list[str]:
     # Inicializar registro por defecto si está vacío
     ensure_default_scrapers()
+    return sources or list(SCRAPERS.keys())
 
-    if not sources:
-        sources = list(SCRAPERS.keys())
 
-    aggregated_items: list[dict] = []
-    errors: list[str] = []
+def search_is_cached(search_query: str, sources: list[str] | None = None, max_items_per_source: int = 10) -> bool:
+    # True si todas las fuentes pueden responder desde la caché (sin scraping en frío)
+    return all(
+        RESULT_CACHE.has(search_query, source, max_items_per_source)
+        for source in _resolve_sources(sources) if source in SCRAPERS
+    )
+
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=len(sources) or 2) as executor:
+def iter_source_results(search_query: str, sources: list[str], max_items_per_source: int, budget: float,
+                        index_first: bool = False):
+    """
+    Genera (fuente, datos, excepción) a medida que cada fuente termina. Al vencer el
+    presupuesto, las fuentes pendientes salen con SourceTimeout.
+    """
+    deadline = time.monotonic() + budget
+    if profiling_active():
+        yield from _iter_inline(search_query, sources, max_items_per_source, budget, deadline, index_first)
+        return
+    # Sin `with`: al vencer el presupuesto no se espera a las fuentes rezagadas
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(sources) or 2)
+    try:
         # Mapear futuros a la fuente para poder identificar los resultados
         future_to_source = {
             executor.submit(
-                SCRAPERS[source]["function"], search_query, max_items=max_items_per_source
+                contextvars.copy_context().run, _run_with_deadline,
+                deadline, fetch_source, source, search_query, max_items_per_source, index_first,
             ): source
             for source in sources if source in SCRAPERS
         }
 
-        for future in concurrent.futures.as_completed(future_to_source):
-            source = future_to_source[future]
-            entry = SCRAPERS.get(source)
-            if not entry:
-                continue
-            
-            try:
-                data = future.result()
-                if data.get("results"):
-                    for item in data["results"]:
-                        # Etiquetar con el nombre amigable de la fuente
-                        item["source"] = entry.get("label", source)
-                    aggregated_items.extend(data["results"])
-                if data.get("error"):
-                    errors.append(f"{entry.get('label', source)}: {data['error']}")
-            except Exception as exc:
-                errors.append(f"{entry.get('label', source)}: {exc}")
+        try:
+            for future in concurrent.futures.as_completed(future_to_source, timeout=max(0.0, deadline - time.monotonic())):
+                source = future_to_source[future]
+                try:
+                    data = future.result()
+                except Exception as exc:
+                    yield source, None, exc
+                    continue
+                yield source, data, None
+        except concurrent.futures.TimeoutError:
+            for future, source in future_to_source.items():
+                if not future.done():
+                    yield source, None, SourceTimeout(f"tiempo de espera agotado ({budget:g} s)")
+    finally:
+        # Las rezagadas terminan en segundo plano y, si responden, alimentan la caché
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _iter_inline(search_query: str, sources: list[str], max_items_per_source: int, budget: float,
+                 deadline: float, index_first: bool):
+    # Petición perfilada (home.profiling): una fuente tras otra en el hilo del perfilador
+    for source in sources:
+        if source not in SCRAPERS:
+            continue
+        if time.monotonic() >= deadline:
+            yield source, None, SourceTimeout(f"tiempo de espera agotado ({budget:g} s)")
+            continue
+        try:
+            data = _run_with_deadline(deadline, fetch_source, source, search_query, max_items_per_source, index_first)
+        except Exception as exc:
+            yield source, None, exc
+            continue
+        yield source, data, None
 
-    aggregated_items.sort(key=lambda x: x.get("price_cop", 0))
 
-    best_item = aggregated_items[0] if aggregated_items else None
+def _detach_task(task: asyncio.Task) -> None:
+    _detached_tasks.add(task)
 
-    return {
-        "results": aggregated_items,
-        "errors": errors,
+    def done(t):
+        _detached_tasks.discard(t)
+        if not t.cancelled():
+            t.exception()  # evita el aviso de excepción no recuperada
+
+    task.add_done_callback(done)
+
+
+async def aiter_source_results(search_query: str, sources: list[str], max_items_per_source: int, budget: float,
+                               index_first: bool = False):
+    deadline = time.monotonic() + budget
+
+    # Las tareas copian el contexto al crearse, así heredan el plazo
+    token = SEARCH_DEADLINE.set(deadline)
+    try:
+        task_to_source = {
+            asyncio.ensure_future(
+                fetch_source_async(source, search_query, max_items_per_source, index_first)
+            ): source
+            for source in sources if source in SCRAPERS
+        }
+    finally:
+        SEARCH_DEADLINE.reset(token)
+
+    pending = set(task_to_source)
+    try:
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                source = task_to_source[task]
+                exc = task.exception()
+                if exc is not None:
+                    yield source, None, exc
+                    continue
+                yield source, task.result(), None
+        for task in pending:
+            yield task_to_source[task], None, SourceTimeout(f"tiempo de espera agotado ({budget:g} s)")
+    finally:
+        # No se cancelan: otras búsquedas pueden estar esperando el mismo resultado (single-flight)
+        for task in pending:
+            _detach_task(task)
+
+
+def search_aggregated(search_query: str, sources: list[str] | None = None, max_items_per_source: int = 10,
+                      budget: float | None = None, index_first: bool | None = None):
+    """
+    Busca en todas las fuentes en paralelo. Con `index_first` (por defecto
+    SEARCH_INDEX["INDEX_FIRST"]) las fuentes sin caché responden desde el índice
+    local cuando tiene suficientes coincidencias recientes.
+    """
+    if not search_query:
+        return {"results": [], "errors": []}
+
+    sources = _resolve_sources(sources)
+    budget = get_search_budget() if budget is None else budget
+    index_first = index_first_enabled() if index_first is None else index_first
+    acc = _new_accumulator()
+    for source, data, exc in iter_source_results(search_query, sources, max_items_per_source, budget, index_first):
+        _merge_source_result(acc, source, data, exc)
+    return _build_aggregated(search_query, sources, acc)
+
+
+async def search_aggregated_async(search_query: str, sources: list[str] | None = None, max_items_per_source: int = 10,
+                                  budget: float | None = None, index_first: bool | None = None):
+    if not search_query:
+        return {"results": [], "errors": []}
+
+    sources = _resolve_sources(sources)
+    budget = get_search_budget() if budget is None else budget
+    index_first = index_first_enabled() if index_first is None else index_first
+    acc = _new_accumulator()
+    async for source, data, exc in aiter_source_results(search_query, sources, max_items_per_source, budget,
+                                                        index_first):
+        _merge_source_result(acc, source, data, exc)
+    return _build_aggregated(search_query, sources, acc)
+
+
+async def stream_search_events(search_query: str, sources: list[str] | None = None, max_items_per_source: int = 10,
+                               budget: float | None = None, index_first: bool | None = None):
+    """
+    Versión incremental de search_aggregated_async: emite un evento por fuente en cuanto
+    termina, con sus items y el mejor precio acumulado, y un evento final "done".
+    """
+    sources = _resolve_sources(sources)
+    budget = get_search_budget() if budget is None else budget
+    index_first = index_first_enabled() if index_first is None else index_first
+    acc = _new_accumulator()
+    if search_query:
+        async for source, data, exc in aiter_source_results(search_query, sources, max_items_per_source, budget,
+                                                            index_first):
+            added = _merge_source_result(acc, source, data, exc)
+            entry = SCRAPERS.get(source) or {}
+            yield {
+                "type": "source",
+                "source": source,
+                "label": entry.get("label", source),
+                "results": sorted(added["results"], key=lambda x: x.get("price_cop", 0)),
+                "errors": added["errors"],
+                "cached": bool(data and data.get("cached")),
+                "indexed": bool(data and data.get("indexed")),
+                "age_seconds": (data or {}).get("age_seconds"),
+                "best_item": _best_item(acc["results"]),
+            }
+    final = _build_aggregated(search_query, sources, acc)
+    yield {
+        "type": "done",
         "query": search_query,
-        "sources": sources,
-        "best_item": best_item,
+        "total": len(final["results"]),
+        "best_item": final["best_item"],
+        "timed_out": final["timed_out"],
+        "cache": final["cache"],
     }
 
 def process_search(search_query: str, max_retries: int = 3, max_items: int = 20):
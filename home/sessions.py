@@ -0,0 +1,214 @@
+import logging
+import random
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import cloudscraper  # type: ignore
+except Exception:  # pragma: no cover - dependencia opcional
+    cloudscraper = None
+
+logger = logging.getLogger(__name__)
+
+# Valores por defecto; se pueden sobrescribir con settings.SCRAPER_HTTP_POOL
+DEFAULT_POOL_CONFIG = {
+    "POOL_CONNECTIONS": 10,   # número de hosts distintos con pool propio
+    "POOL_MAXSIZE": 30,       # conexiones abiertas por host
+    "MAX_RETRIES": 3,         # reintentos de conexión del HTTPAdapter (el resto, home.retry)
+    "CONNECT_BACKOFF": 0.2,   # backoff_factor de urllib3 entre esos reintentos
+    "KEEPALIVE_SECONDS": 300, # tras este tiempo sin uso se recicla la sesión
+    "TCP_KEEPALIVE": True,    # activa SO_KEEPALIVE en los sockets del pool
+    "WARMUP_TTL": 1800,       # segundos que dura el calentamiento (cookies) de una sesión
+}
+
+
+def get_pool_config() -> dict:
+    config = dict(DEFAULT_POOL_CONFIG)
+    try:
+        from django.conf import settings
+        config.update(getattr(settings, "SCRAPER_HTTP_POOL", {}) or {})
+    except Exception:
+        # Fuera de Django (scripts, shell sin settings) usamos los valores por defecto
+        pass
+    return config
+
+
+def _connect_retries(config: dict) -> Retry:
+    # Solo fallos al conectar; timeouts de lectura y 429/5xx los decide home.retry,
+    # que aplica backoff, Retry-After y el presupuesto de reintentos del proceso
+    return Retry(
+        total=config["MAX_RETRIES"], connect=config["MAX_RETRIES"], read=0, status=0, other=0,
+        redirect=None, backoff_factor=config["CONNECT_BACKOFF"], raise_on_status=False,
+    )
+
+
+def _keepalive_socket_options() -> list:
+    from urllib3.connection import HTTPConnection
+    options = list(HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    return options
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter que mantiene vivas las conexiones TCP del pool."""
+
+    def __init__(self, *args, tcp_keepalive: bool = True, **kwargs):
+        self.tcp_keepalive = tcp_keepalive
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        if self.tcp_keepalive:
+            kwargs["socket_options"] = _keepalive_socket_options()
+        super().init_poolmanager(*args, **kwargs)
+
+
+def _tune_adapter(adapter: HTTPAdapter, config: dict) -> None:
+    """
+    Aplica a un adapter ya montado el mismo pool, reintentos de conexión y keep-alive
+    que KeepAliveHTTPAdapter. Se usa con cloudscraper: reemplazar su adapter TLS
+    cambiaría la huella del navegador que imita.
+    """
+    adapter.max_retries = _connect_retries(config)
+    adapter._pool_connections = config["POOL_CONNECTIONS"]
+    adapter._pool_maxsize = config["POOL_MAXSIZE"]
+    adapter._pool_block = False
+    kwargs = {"socket_options": _keepalive_socket_options()} if config["TCP_KEEPALIVE"] else {}
+    adapter.poolmanager.clear()
+    adapter.init_poolmanager(config["POOL_CONNECTIONS"], config["POOL_MAXSIZE"], **kwargs)
+
+
+def build_session(config: dict | None = None) -> requests.Session:
+    config = config or get_pool_config()
+    if cloudscraper is not None:
+        try:
+            # cloudscraper ya hereda de requests.Session y monta su propio adapter TLS
+            session = cloudscraper.create_scraper(
+                browser={
+                    "browser": "chrome",
+                    "platform": "windows",
+                    "desktop": True,
+                },
+                delay=random.uniform(0.3, 0.8),
+            )
+            for adapter in session.adapters.values():
+                _tune_adapter(adapter, config)
+            return session
+        except Exception:
+            logger.exception("cloudscraper: no se pudo crear la sesión, usando requests")
+    session = requests.Session()
+    adapter = KeepAliveHTTPAdapter(
+        max_retries=_connect_retries(config),
+        pool_connections=config["POOL_CONNECTIONS"],
+        pool_maxsize=config["POOL_MAXSIZE"],
+        tcp_keepalive=config["TCP_KEEPALIVE"],
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    return session
+
+
+class SessionRegistry:
+    """
+    Sesiones HTTP de larga duración, una por fuente, compartidas por todos los
+    hilos del proceso. Conservan las conexiones TLS y las cookies entre búsquedas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: dict[str, dict] = {}
+
+    def get(self, source: str) -> requests.Session:
+        now = time.monotonic()
+        config = get_pool_config()
+        with self._lock:
+            entry = self._sessions.get(source)
+            if entry and now - entry["last_used"] > config["KEEPALIVE_SECONDS"]:
+                # Sesión inactiva demasiado tiempo: el servidor ya habrá cerrado las conexiones
+                self._close(entry)
+                entry = None
+            if entry is None:
+                entry = {
+                    "session": build_session(config), "created": now, "last_used": now, "requests": 0,
+                    "warmed_at": None, "warming": False,
+                }
+                self._sessions[source] = entry
+            entry["last_used"] = now
+            entry["requests"] += 1
+            return entry["session"]
+
+    def claim_warmup(self, source: str) -> bool:
+        """
+        True si el llamador debe calentar la sesión de `source`: nunca se calentó, el
+        calentamiento venció o se invalidó. Solo un hilo a la vez recibe True; el resto
+        sigue con la sesión tal como está en vez de esperar.
+        """
+        ttl = get_pool_config()["WARMUP_TTL"]
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(source)
+            if entry is None or entry["warming"]:
+                return False
+            if entry["warmed_at"] is not None and now - entry["warmed_at"] < ttl:
+                return False
+            entry["warming"] = True
+            return True
+
+    def finish_warmup(self, source: str, ok: bool) -> None:
+        with self._lock:
+            entry = self._sessions.get(source)
+            if entry is None:
+                return
+            entry["warming"] = False
+            if ok:
+                entry["warmed_at"] = time.monotonic()
+
+    def invalidate_warmup(self, source: str, clear_cookies: bool = False) -> None:
+        # Una respuesta con pinta de bloqueo fuerza a recalentar en la próxima búsqueda
+        with self._lock:
+            entry = self._sessions.get(source)
+            if entry is None:
+                return
+            entry["warmed_at"] = None
+            if clear_cookies:
+                entry["session"].cookies.clear()
+
+    def reset(self, source: str | None = None) -> None:
+        with self._lock:
+            keys = [source] if source else list(self._sessions)
+            for key in keys:
+                entry = self._sessions.pop(key, None)
+                if entry:
+                    self._close(entry)
+
+    def stats(self) -> dict[str, dict]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "age_seconds": round(now - entry["created"], 1),
+                    "idle_seconds": round(now - entry["last_used"], 1),
+                    "requests": entry["requests"],
+                    "warm": entry["warmed_at"] is not None,
+                }
+                for key, entry in self._sessions.items()
+            }
+
+    @staticmethod
+    def _close(entry: dict) -> None:
+        try:
+            entry["session"].close()
+        except Exception:
+            pass
+
+
+SESSIONS = SessionRegistry()
+
+
+def get_session(source: str) -> requests.Session:
+    return SESSIONS.get(source)
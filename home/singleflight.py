@@ -0,0 +1,73 @@
+import asyncio
+import concurrent.futures
+import threading
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas idénticas concurrentes dentro del proceso: la primera (líder)
+    ejecuta la función y las demás (seguidoras) esperan su resultado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, concurrent.futures.Future] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def _join(self, key: str) -> tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._stats["followers"] += 1
+                return future, False
+            future = concurrent.futures.Future()
+            self._calls[key] = future
+            self._stats["leaders"] += 1
+            return future, True
+
+    def _finish(self, key: str) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def do(self, key: str, fn) -> tuple[object, bool]:
+        """Devuelve (resultado, compartido). `compartido` es True para las seguidoras."""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(), True
+        try:
+            result = fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._finish(key)
+        return result, False
+
+    async def do_async(self, key: str, coro_fn) -> tuple[object, bool]:
+        # El mismo registro sirve a hilos y a corrutinas: un líder async puede tener seguidoras síncronas
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future), True
+        try:
+            result = await coro_fn()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            self._finish(key)
+        return result, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        # Cada seguidora es una llamada al marketplace que no se hizo
+        stats["upstream_calls_saved"] = stats["followers"]
+        return stats
+
+
+SINGLE_FLIGHT = SingleFlight()
@@ -1,3 +1,970 @@
-from django.test import TestCase
+import asyncio
+import json
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, override_settings
+from requests.adapters import HTTPAdapter
+
+from . import history, service
+from .breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from .cache import FRESH, MISS, STALE, ResultCache
+from .canonical import canonical_key, query_tokens
+from .filters import detect_category, filter_accessories
+from .history import DAY, connect, lowest_price, price_history, write_batch
+from .index import ProductIndex, match_expression
+from .parsers import available_backends, make_soup
+from .politeness import PolitenessScheduler, PolitenessTimeout
+from .ratelimit import SlidingWindowLimiter, client_ip
+from .retry import BUDGET, LATENCY, fetch_with_retry
+from .service import (
+    SourceTimeout, _cached_result, _json_prices_value, parse_falabella_cards, parse_next_data_products,
+    register_scraper, search_aggregated, search_aggregated_async, slugify_query,
+)
+from .sessions import KeepAliveHTTPAdapter, SessionRegistry, build_session
+from .singleflight import SingleFlight
+
+
+class SingleFlightTests(SimpleTestCase):
+    def _concurrent(self, flight: SingleFlight, fn, callers: int = 8) -> list:
+        # Lanza `callers` hilos con la misma clave; el líder espera a que todos se unan
+        outcomes = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                outcome = flight.do("k", fn)
+            except Exception as exc:
+                outcome = exc
+            with lock:
+                outcomes.append(outcome)
+
+        threads = [threading.Thread(target=call) for _ in range(callers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return outcomes
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {"results": [1]}
+
+        threading.Timer(0.2, release.set).start()
+        outcomes = self._concurrent(flight, fetch)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 8)
+        self.assertTrue(all(data == {"results": [1]} for data, _ in outcomes))
+        self.assertEqual(sorted(shared for _, shared in outcomes), [False] + [True] * 7)
+        self.assertEqual(flight.stats()["in_flight"], 0)
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError("boom")
+
+        outcomes = self._concurrent(flight, fetch, callers=5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 5)
+        self.assertTrue(all(isinstance(o, ValueError) for o in outcomes))
+        # Tras el error la clave queda libre: la siguiente llamada vuelve a ejecutar
+        self.assertEqual(flight.do("k", lambda: 1), (1, False))
+
+    def test_async_followers_share_the_leader(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "data"
+
+        async def main():
+            return await asyncio.gather(*(flight.do_async("k", fetch) for _ in range(6)))
+
+        outcomes = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([data for data, _ in outcomes], ["data"] * 6)
+        self.assertEqual(sum(shared for _, shared in outcomes), 5)
+
+
+@override_settings(SCRAPER_CIRCUIT_BREAKER={
+    "default": {"FAILURE_THRESHOLD": 2, "COOLDOWN": 0.2, "MAX_COOLDOWN": 1, "HALF_OPEN_PROBES": 1},
+})
+class CircuitBreakerTests(SimpleTestCase):
+    def _fail(self, breaker: CircuitBreaker, source: str = "src") -> None:
+        with self.assertRaises(RuntimeError):
+            with breaker.guard(source):
+                raise RuntimeError("caída")
+
+    def _state(self, breaker: CircuitBreaker, source: str = "src") -> str:
+        return breaker.stats()[source]["state"]
+
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self.assertEqual(self._state(breaker), CLOSED)
+        self._fail(breaker)
+        self.assertEqual(self._state(breaker), OPEN)
+        self.assertFalse(breaker.available("src"))
+        with self.assertRaises(CircuitOpen):
+            with breaker.guard("src"):
+                self.fail("con el circuito abierto no se llama a la fuente")
+        self.assertEqual(breaker.stats()["src"]["short_circuits"], 1)
+
+    def test_reported_failure_counts_and_success_resets(self):
+        breaker = CircuitBreaker()
+        with breaker.guard("src") as outcome:
+            outcome["failure"] = "Blocked"
+        with breaker.guard("src"):
+            pass
+        self._fail(breaker)
+        self.assertEqual(self._state(breaker), CLOSED)
+        self.assertEqual(breaker.stats()["src"]["failures"], 1)
+
+    def test_half_open_probe_closes_the_circuit(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self._fail(breaker)
+        time.sleep(0.25)
+        self.assertTrue(breaker.available("src"))
+        with breaker.guard("src"):
+            self.assertEqual(self._state(breaker), HALF_OPEN)
+            # Una sola sonda a la vez: las demás fallan al instante
+            with self.assertRaises(CircuitOpen):
+                with breaker.guard("src"):
+                    pass
+        self.assertEqual(self._state(breaker), CLOSED)
+
+    def test_failed_probe_reopens_with_longer_cooldown(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        self._fail(breaker)
+        time.sleep(0.25)
+        self._fail(breaker)
+        self.assertEqual(self._state(breaker), OPEN)
+        self.assertGreater(breaker.stats()["src"]["retry_in"], 0.2)
+        self.assertEqual(breaker.stats()["src"]["opened"], 2)
+
+    def test_inconclusive_call_is_not_counted(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker)
+        with breaker.guard("src") as outcome:
+            outcome.update(failure="Error", inconclusive=True)
+        self.assertEqual(self._state(breaker), CLOSED)
+        self.assertEqual(breaker.stats()["src"]["failures"], 1)
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.engine = {"PATH": Path(tmp.name) / "ratelimit.sqlite3", "LEASE_TTL": 0.05, "FLUSH_INTERVAL": 60}
+
+    def _hits(self, limiter: SlidingWindowLimiter, count: int, rate: str = "20/m") -> int:
+        return sum(limiter.hit("rule", "1.2.3.4", rate)[0] for _ in range(count))
+
+    def test_two_workers_never_admit_more_than_the_limit(self):
+        with override_settings(RATELIMIT_ENGINE=self.engine):
+            first, second = SlidingWindowLimiter(), SlidingWindowLimiter()
+            admitted = sum(self._hits(worker, 1) for _ in range(20) for worker in (first, second))
+            self.assertEqual(admitted, 20)
+            self.assertEqual(self._hits(first, 5) + self._hits(second, 5), 0)
+            allowed, retry_after = second.hit("rule", "1.2.3.4", "20/m")
+            self.assertFalse(allowed)
+            self.assertGreaterEqual(retry_after, 1)
+
+    def test_unused_lease_is_refunded_to_the_other_worker(self):
+        with override_settings(RATELIMIT_ENGINE=self.engine):
+            first, second = SlidingWindowLimiter(), SlidingWindowLimiter()
+            self.assertEqual(self._hits(first, 1), 1)
+            # first reservó un tramo del margen (LEASE_FRACTION) que second no puede usar
+            stranded = first._entries[("rule", "1.2.3.4")]["lease"]
+            self.assertGreater(stranded, 0)
+            self.assertEqual(self._hits(second, 19 - stranded), 19 - stranded)
+            time.sleep(0.1)
+            self.assertEqual(first.flush(), stranded)
+            self.assertEqual(self._hits(second, stranded), stranded)
+            self.assertEqual(self._hits(second, 1), 0)
+            self.assertEqual(first.stats()["refunded"], stranded)
+
+    def test_flush_everything_ignores_the_lease_ttl(self):
+        engine = {**self.engine, "LEASE_TTL": 60}
+        with override_settings(RATELIMIT_ENGINE=engine):
+            first = SlidingWindowLimiter()
+            self._hits(first, 1)
+            self.assertEqual(first.flush(), 0)
+            self.assertGreater(first.flush(everything=True), 0)
+
+    def test_in_memory_mode_counts_exactly(self):
+        with override_settings(RATELIMIT_ENGINE={"PATH": ""}):
+            limiter = SlidingWindowLimiter()
+            self.assertEqual(self._hits(limiter, 8, "5/m"), 5)
+
+    def test_client_ip(self):
+        factory = RequestFactory()
+        self.assertEqual(client_ip(factory.get("/", REMOTE_ADDR="2001:db8::1:2")), "2001:db8::")
+        request = factory.get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="203.0.113.9, 10.0.0.1")
+        self.assertEqual(client_ip(request), "10.0.0.1")
+        with override_settings(RATELIMIT_IP_META_KEY="HTTP_X_FORWARDED_FOR"):
+            self.assertEqual(client_ip(request), "203.0.113.9")
+
+
+@override_settings(SEARCH_CACHE={
+    "ENABLED": True, "SHARED_ALIAS": None, "TTL": {"default": 10}, "STALE_TTL": {"default": 60},
+})
+class ResultCacheTests(SimpleTestCase):
+    DATA = {"results": [{"title": "Celular", "price_cop": 100}]}
+
+    def test_fresh_stale_and_miss(self):
+        cache = ResultCache()
+        with mock.patch("home.cache.time.time", return_value=1000.0) as clock:
+            self.assertEqual(cache.lookup("celular", "src", 5), (None, MISS))
+            cache.set("celular", "src", 5, self.DATA)
+            data, state = cache.lookup("celular", "src", 5)
+            self.assertEqual((data["results"], state), (self.DATA["results"], FRESH))
+            clock.return_value = 1015.0
+            data, state = cache.lookup("celular", "src", 5)
+            self.assertEqual(state, STALE)
+            self.assertEqual((data["stale"], data["age_seconds"], data["results"][0]["cache_age"]), (True, 15, 15))
+            self.assertIsNone(cache.get("celular", "src", 5))
+            clock.return_value = 1061.0
+            self.assertEqual(cache.lookup("celular", "src", 5), (None, MISS))
+        self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_served_copies_do_not_touch_the_entry(self):
+        cache = ResultCache()
+        cache.set("celular", "src", 5, self.DATA)
+        data, _ = cache.lookup("celular", "src", 5)
+        data["results"][0]["source"] = "etiquetado"
+        self.assertNotIn("source", cache.lookup("celular", "src", 5)[0]["results"][0])
+
+    def test_errors_and_empty_results_are_not_stored(self):
+        cache = ResultCache()
+        cache.set("celular", "src", 5, {"results": [], "error": "HTTP 503"})
+        cache.set("celular", "src", 5, {"results": []})
+        self.assertFalse(cache.has("celular", "src", 5))
+
+    def test_meta_stays_out_of_the_payload(self):
+        cache = ResultCache()
+        cache.set("celular", "src", 5, self.DATA, meta={"prewarm_seconds": 1.5})
+        data, state, meta = cache.lookup_entry("celular", "src", 5)
+        self.assertEqual(meta, {"prewarm_seconds": 1.5})
+        self.assertNotIn("prewarm_seconds", data)
+
+    def test_disabled_cache_is_always_a_miss(self):
+        cache = ResultCache()
+        with override_settings(SEARCH_CACHE={"ENABLED": False}):
+            cache.set("celular", "src", 5, self.DATA)
+            self.assertEqual(cache.lookup("celular", "src", 5), (None, MISS))
+            self.assertEqual(cache.lookup_entry("celular", "src", 5), (None, MISS, {}))
+            self.assertIsNone(_cached_result("src", "celular", 5))
+
+    def test_refresh_is_scheduled_once_per_key(self):
+        cache = ResultCache()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return {"results": [{"title": "Nuevo", "price_cop": 90}]}
+
+        self.assertTrue(cache.schedule_refresh("celular", "src", 5, fetch))
+        self.assertFalse(cache.schedule_refresh("celular", "src", 5, fetch))
+        # La misma consulta escrita distinto comparte la clave
+        self.assertFalse(cache.schedule_refresh("  Celular ", "src", 5, fetch))
+        release.set()
+        for _ in range(50):
+            if cache.stats()["refreshes"]:
+                break
+            time.sleep(0.02)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.lookup("celular", "src", 5)[0]["results"][0]["title"], "Nuevo")
+        # Terminado el refresco, se puede programar otro
+        self.assertTrue(cache.schedule_refresh("celular", "src", 5, fetch))
+
+
+@override_settings(SCRAPER_POLITENESS={
+    "default": {"RATE": 1.0, "BURST": 2, "JITTER": (0, 0), "MAX_WAIT": 2.5},
+})
+class PolitenessTests(SimpleTestCase):
+    URL = "https://www.example.com/busqueda"
+
+    def setUp(self):
+        self.now = 1000.0
+        self.sleeps = []
+        clock = SimpleNamespace(monotonic=lambda: self.now, sleep=self.sleeps.append)
+        patcher = mock.patch("home.politeness.time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reserve_queues_and_refills(self):
+        scheduler = PolitenessScheduler()
+        self.assertEqual([scheduler.reserve("h") for _ in range(4)], [0.0, 0.0, 1.0, 2.0])
+        self.now += 3
+        # En 3 s vuelven 3 tokens: la cola de 2 se vacía y queda uno libre
+        self.assertEqual(scheduler.reserve("h"), 0.0)
+        self.assertEqual(scheduler.reserve("h"), 1.0)
+        scheduler.release("h")
+        self.assertEqual(scheduler.headroom("h"), 0.0)
+        self.assertEqual(scheduler.stats()["h"], {"tokens": 0.0, "requests": 5, "waits": 3, "timeouts": 1})
+
+    def test_wait_is_capped_by_max_wait(self):
+        scheduler = PolitenessScheduler()
+        self.assertEqual([scheduler.wait(self.URL) for _ in range(4)], [0.0, 0.0, 1.0, 2.0])
+        with self.assertRaises(PolitenessTimeout):
+            scheduler.wait(self.URL)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+        # El turno rechazado se devolvió: el siguiente vuelve a quedar a 3 s
+        self.assertEqual(scheduler.headroom(self.URL), -2.0)
+        self.assertEqual(scheduler.stats()["www.example.com"]["timeouts"], 1)
+
+    def test_deadline_shorter_than_the_wait(self):
+        scheduler = PolitenessScheduler()
+        scheduler.wait(self.URL)
+        scheduler.wait(self.URL)
+        with self.assertRaises(PolitenessTimeout):
+            scheduler.wait(self.URL, deadline=self.now + 0.5)
+        with self.assertRaises(PolitenessTimeout):
+            asyncio.run(scheduler.wait_async(self.URL, deadline=self.now + 0.5))
+        self.assertEqual(self.sleeps, [])
+        self.assertEqual(scheduler.wait(self.URL, deadline=self.now + 5), 1.0)
+
+
+POOL = {
+    "POOL_CONNECTIONS": 3, "POOL_MAXSIZE": 7, "MAX_RETRIES": 2, "CONNECT_BACKOFF": 0.1,
+    "KEEPALIVE_SECONDS": 60, "TCP_KEEPALIVE": True, "WARMUP_TTL": 100,
+}
+
+
+class SessionTests(SimpleTestCase):
+    def _check_pool(self, adapter: HTTPAdapter) -> None:
+        kw = adapter.poolmanager.connection_pool_kw
+        self.assertEqual(kw["maxsize"], 7)
+        self.assertIn((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1), kw["socket_options"])
+        self.assertEqual(adapter.poolmanager.pools._maxsize, 3)
+        self.assertEqual((adapter.max_retries.total, adapter.max_retries.read), (2, 0))
+
+    def test_requests_session_uses_the_keepalive_pool(self):
+        session = build_session(POOL)
+        self.addCleanup(session.close)
+        adapter = session.get_adapter("https://www.example.com")
+        self.assertIsInstance(adapter, KeepAliveHTTPAdapter)
+        self._check_pool(adapter)
+
+    def test_cloudscraper_session_gets_the_same_pool(self):
+        class TLSAdapter(HTTPAdapter):
+            # Como el adapter de cloudscraper: fija su propio contexto TLS en el pool
+            def init_poolmanager(self, *args, **kwargs):
+                kwargs["ssl_context"] = "tls"
+                super().init_poolmanager(*args, **kwargs)
+
+        scraper = requests.Session()
+        tls = TLSAdapter()
+        scraper.mount("https://", tls)
+        self.addCleanup(scraper.close)
+        fake = SimpleNamespace(create_scraper=lambda **kwargs: scraper)
+        with mock.patch("home.sessions.cloudscraper", fake):
+            session = build_session(POOL)
+        self.assertIs(session, scraper)
+        # Se conserva el adapter TLS de cloudscraper, con el pool y keep-alive configurados
+        self.assertIs(session.get_adapter("https://www.example.com"), tls)
+        self.assertEqual(tls.poolmanager.connection_pool_kw["ssl_context"], "tls")
+        for adapter in session.adapters.values():
+            self._check_pool(adapter)
+
+
+@override_settings(SCRAPER_HTTP_POOL=POOL)
+class SessionRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = SimpleNamespace(monotonic=lambda: self.now)
+        patcher = mock.patch("home.sessions.time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.registry = SessionRegistry()
+        self.addCleanup(self.registry.reset)
+
+    def test_idle_session_is_recycled(self):
+        session = self.registry.get("src")
+        self.now += 30
+        self.assertIs(self.registry.get("src"), session)
+        self.now += 61
+        self.assertIsNot(self.registry.get("src"), session)
+
+    def test_warmup_ttl(self):
+        self.assertFalse(self.registry.claim_warmup("src"))  # todavía no hay sesión
+        self.registry.get("src")
+        self.assertTrue(self.registry.claim_warmup("src"))
+        # Mientras un hilo calienta, los demás siguen sin esperar
+        self.assertFalse(self.registry.claim_warmup("src"))
+        self.registry.finish_warmup("src", ok=True)
+        self.now += 99
+        self.assertFalse(self.registry.claim_warmup("src"))
+        self.now += 2
+        self.assertTrue(self.registry.claim_warmup("src"))
+        # Un calentamiento fallido se reintenta en la siguiente búsqueda
+        self.registry.finish_warmup("src", ok=False)
+        self.assertTrue(self.registry.claim_warmup("src"))
+        self.registry.finish_warmup("src", ok=True)
+        self.assertTrue(self.registry.stats()["src"]["warm"])
+
+    def test_invalidate_forces_a_new_warmup(self):
+        session = self.registry.get("src")
+        self.registry.claim_warmup("src")
+        self.registry.finish_warmup("src", ok=True)
+        session.cookies.set("sesion", "abc")
+        self.registry.invalidate_warmup("src", clear_cookies=True)
+        self.assertEqual(len(session.cookies), 0)
+        self.assertFalse(self.registry.stats()["src"]["warm"])
+        self.assertTrue(self.registry.claim_warmup("src"))
+
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, headers: dict | None = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    # Devuelve (o lanza) en orden lo guardado en `script`; un callable se ejecuta al llegar su turno
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self._lock:
+            step = self.script[self.calls]
+            self.calls += 1
+        if callable(step):
+            step = step()
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+
+@override_settings(
+    SCRAPER_RETRY={"default": {"MAX_ATTEMPTS": 3, "BACKOFF_BASE": 0.01, "BACKOFF_MAX": 0.01,
+                               "MAX_RETRY_AFTER": 30.0, "MIN_ATTEMPT_SECONDS": 1.0, "HEDGE": False}},
+    SCRAPER_RETRY_BUDGET={"RATIO": 0.0, "MIN_RETRIES": 10, "WINDOW": 60.0},
+)
+class RetryTests(SimpleTestCase):
+    def setUp(self):
+        BUDGET.reset()
+        LATENCY.reset()
+        self.addCleanup(BUDGET.reset)
+        self.addCleanup(LATENCY.reset)
+        # Reloj falso solo para las esperas: time.sleep del resto del proceso no se toca
+        self.sleeps = []
+        clock = SimpleNamespace(monotonic=time.monotonic, time=time.time, sleep=self.sleeps.append)
+        patcher = mock.patch("home.retry.time", clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fetch(self, session: FakeSession, deadline: float | None = None):
+        return fetch_with_retry("src", lambda: session.get("https://example.com"), deadline=deadline)
+
+    def test_retries_429_and_5xx(self):
+        failed = [FakeResponse(503), FakeResponse(429)]
+        session = FakeSession(*failed, FakeResponse(200))
+        self.assertEqual(self._fetch(session).status_code, 200)
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(all(r.closed for r in failed))
+        self.assertEqual(BUDGET.stats()["retries"], 2)
+
+    def test_network_error_is_retried_then_raised(self):
+        session = FakeSession(*[requests.ConnectionError("caída")] * 3)
+        with self.assertRaises(requests.ConnectionError):
+            self._fetch(session)
+        self.assertEqual(session.calls, 3)
+
+    def test_retry_after_is_respected_up_to_the_cap(self):
+        session = FakeSession(FakeResponse(429, {"Retry-After": "5"}), FakeResponse(200))
+        self.assertEqual(self._fetch(session).status_code, 200)
+        self.assertEqual(self.sleeps, [5.0])
+        # Más que MAX_RETRY_AFTER: se devuelve el 429 sin esperar
+        session = FakeSession(FakeResponse(429, {"Retry-After": "120"}), FakeResponse(200))
+        self.assertEqual(self._fetch(session).status_code, 429)
+        self.assertEqual(session.calls, 1)
+        self.assertEqual(self.sleeps, [5.0])
+
+    def test_no_retry_past_the_deadline(self):
+        session = FakeSession(FakeResponse(503), FakeResponse(200))
+        self.assertEqual(self._fetch(session, deadline=time.monotonic() + 0.5).status_code, 503)
+        self.assertEqual(session.calls, 1)
+        session = FakeSession(FakeResponse(429, {"Retry-After": "5"}), FakeResponse(200))
+        self.assertEqual(self._fetch(session, deadline=time.monotonic() + 3).status_code, 429)
+        self.assertEqual(self.sleeps, [])
+
+    def test_budget_exhaustion_stops_retries(self):
+        with override_settings(SCRAPER_RETRY_BUDGET={"RATIO": 0.0, "MIN_RETRIES": 1, "WINDOW": 60.0}):
+            session = FakeSession(FakeResponse(503), FakeResponse(200))
+            self.assertEqual(self._fetch(session).status_code, 200)
+            session = FakeSession(FakeResponse(503), FakeResponse(200))
+            self.assertEqual(self._fetch(session).status_code, 503)
+            self.assertEqual(session.calls, 1)
+            stats = BUDGET.stats()
+        self.assertEqual((stats["retries"], stats["denied"]), (1, 1))
+
+    def _hedged(self, *script):
+        for _ in range(5):
+            LATENCY.record("src", 0.01)
+        policy = {"HEDGE": True, "HEDGE_MIN_SAMPLES": 5, "HEDGE_MIN_DELAY": 0.05}
+        with override_settings(SCRAPER_RETRY={"src": policy}):
+            return self._fetch(FakeSession(*script))
+
+    def test_hedge_wins_and_the_slow_primary_is_closed(self):
+        release = threading.Event()
+        slow = FakeResponse(200)
+        fast = FakeResponse(200)
+
+        def primary():
+            release.wait(5)
+            return slow
+
+        self.assertIs(self._hedged(primary, fast), fast)
+        self.assertFalse(slow.closed)
+        release.set()
+        for _ in range(50):
+            if slow.closed:
+                break
+            time.sleep(0.02)
+        self.assertTrue(slow.closed)
+        self.assertFalse(fast.closed)
+
+    def test_failed_hedge_falls_back_to_the_primary(self):
+        slow = FakeResponse(200)
+
+        def primary():
+            time.sleep(0.2)
+            return slow
+
+        self.assertIs(self._hedged(primary, requests.ConnectionError("caída")), slow)
+        self.assertEqual(BUDGET.stats()["retries"], 1)
+
+
+@override_settings(
+    SEARCH_CACHE={"ENABLED": False},
+    SEARCH_INDEX={"ENABLED": False, "INDEX_FIRST": False},
+    PRICE_HISTORY={"ENABLED": False},
+)
+class FakeSourcesTestCase(SimpleTestCase):
+    # Dos marketplaces de prueba: "rapida" responde al instante y "lenta" hasta que se libera
+    ITEM = {"title": "Celular Xiaomi 128GB", "link": "https://example.com/1", "price_cop": 900000}
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        patcher = mock.patch.dict(service.SCRAPERS, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, use_async: bool = False) -> None:
+        def fast(search_query, max_items=10):
+            return {"results": [dict(self.ITEM)]}
+
+        def slow(search_query, max_items=10):
+            self.release.wait(5)
+            return {"results": []}
+
+        async def fast_async(search_query, max_items=10):
+            return fast(search_query, max_items)
+
+        async def slow_async(search_query, max_items=10):
+            await asyncio.sleep(5)
+            return {"results": []}
+
+        register_scraper("rapida", "Rápida", fast_async if use_async else fast)
+        register_scraper("lenta", "Lenta", slow_async if use_async else slow)
+
+
+class SearchDeadlineTests(FakeSourcesTestCase):
+    def _check(self, data: dict) -> None:
+        self.assertEqual([item["source"] for item in data["results"]], ["Rápida"])
+        self.assertEqual(data["best_item"]["price_cop"], 900000)
+        self.assertEqual(data["timed_out"], ["lenta"])
+        self.assertEqual(data["errors"], ["Lenta: tiempo de espera agotado (0.3 s)"])
+
+    def test_slow_source_times_out_without_losing_the_others(self):
+        self.register()
+        started = time.monotonic()
+        self._check(search_aggregated("celular", budget=0.3))
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_async_pipeline(self):
+        self.register(use_async=True)
+        self._check(asyncio.run(search_aggregated_async("celular", budget=0.3)))
+
+    def test_timeout_is_a_source_timeout(self):
+        self.register()
+        results = service.iter_source_results("celular", ["rapida", "lenta"], 5, 0.3)
+        outcomes = {source: exc for source, _, exc in results}
+        self.assertIsNone(outcomes["rapida"])
+        self.assertIsInstance(outcomes["lenta"], SourceTimeout)
+
+
+@override_settings(
+    ALLOWED_HOSTS=["testserver"],
+    SEARCH_BUDGET_SECONDS=0.3,
+    GLOBAL_RATELIMIT_RATE="1000/m",
+    RATELIMIT_RULES={"search_cached": "1000/m", "search_cold": "1000/m"},
+    RATELIMIT_ENGINE={"PATH": ""},
+)
+class SearchViewTests(FakeSourcesTestCase):
+    def setUp(self):
+        super().setUp()
+        self.register()
+
+    def _stream(self, data: dict):
+        async def collect():
+            response = await AsyncClient().post("/stream/", data)
+            chunks = [chunk async for chunk in response.streaming_content]
+            return response, b"".join(chunks).decode()
+
+        response, body = asyncio.run(collect())
+        events = []
+        for block in body.strip().split("\n\n"):
+            name, payload = block.split("\n")
+            self.assertEqual(name[len("event: "):], json.loads(payload[len("data: "):])["type"])
+            events.append(json.loads(payload[len("data: "):]))
+        return response, events
+
+    def test_stream_emits_each_source_then_done(self):
+        response, events = self._stream({"search_item": "celular"})
+        self.assertTrue(response["Content-Type"].startswith("text/event-stream"))
+        self.assertEqual(response["Cache-Control"], "no-cache")
+        self.assertEqual([(e["type"], e.get("source")) for e in events],
+                         [("source", "rapida"), ("source", "lenta"), ("done", None)])
+        fast, slow, done = events
+        self.assertEqual([item["title"] for item in fast["results"]], ["Celular Xiaomi 128GB"])
+        self.assertEqual(fast["best_item"]["source"], "Rápida")
+        self.assertEqual((slow["results"], slow["errors"]), ([], ["Lenta: tiempo de espera agotado (0.3 s)"]))
+        self.assertEqual((done["total"], done["timed_out"]), (1, ["lenta"]))
+        self.assertEqual(done["best_item"]["price_cop"], 900000)
+
+    def test_stream_only_selected_sources(self):
+        _, events = self._stream({"search_item": "celular", "sources": ["rapida"]})
+        self.assertEqual([e["type"] for e in events], ["source", "done"])
+        self.assertEqual(events[-1]["timed_out"], [])
+
+    def test_stream_requires_post(self):
+        response = asyncio.run(AsyncClient().get("/stream/"))
+        self.assertEqual(response.status_code, 405)
+
+    def test_classic_post_renders_the_results(self):
+        # Sin JavaScript el formulario se envía a la vista clásica, que responde con la página completa
+        response = self.client.post("/", {"search_item": "celular"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Celular Xiaomi 128GB")
+        self.assertContains(response, "Lenta: tiempo de espera agotado (0.3 s)")
+        self.assertEqual(response.context["best_item"]["source"], "Rápida")
+
+
+class CanonicalQueryTests(SimpleTestCase):
+    def test_equivalent_queries_share_a_key(self):
+        for a, b in [
+            ("iPhone 15 Pro", "pro iphone  15"),
+            ("Cámara Sony", "camara sony"),
+            ("celular de 128 GB", "Celular 128gb"),
+            ('Televisor 55"', "televisor 55 pulgadas"),
+            ("audífonos y cargador", "audifonos cargador"),
+            ("pantalla 6,5 pulgadas", "pantalla 6.5in"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(canonical_key(a), canonical_key(b))
+
+    def test_different_products_do_not_collide(self):
+        for a, b in [
+            ("Samsung Galaxy A 15", "samsung galaxy 15"),
+            ("Moto E 13", "moto 13"),
+            ("iphone 15", "iphone 15 pro"),
+            ("128 gb", "128 mb"),
+            ("日本", "中国"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertNotEqual(canonical_key(a), canonical_key(b))
+
+    def test_tokens_keep_query_order(self):
+        self.assertEqual(query_tokens("Celular de 128 GB"), ["celular", "128gb"])
+        self.assertEqual(query_tokens("Galaxy A 15 y funda"), ["galaxy", "a", "15", "funda"])
+        # Una consulta hecha solo de palabras vacías se conserva
+        self.assertEqual(query_tokens("de la"), ["de", "la"])
+
+
+@override_settings(ACCESSORY_FILTER={"ENABLED": True})
+class AccessoryFilterTests(SimpleTestCase):
+    def _kept(self, query: str, titles: list[str]) -> list[str]:
+        items, removed = filter_accessories([{"title": t} for t in titles], query)
+        self.assertEqual(removed, len(titles) - len(items))
+        return [it["title"] for it in items]
+
+    def test_product_descriptions_are_kept(self):
+        titles = [
+            'Televisor Samsung 55" Crystal UHD 4K Smart TV 3 HDMI',
+            "Smart TV LG 50 pulgadas 4K con control remoto Magic",
+            "Cable HDMI 2.1 de 3 metros",
+            "Soporte para TV de 32 a 70 pulgadas",
+            "Control remoto universal para Smart TV",
+        ]
+        self.assertEqual(self._kept("televisor 55 pulgadas", titles), titles[:2])
+        titles = [
+            "Portátil Lenovo IdeaPad 15 Ryzen 5 teclado retroiluminado",
+            "Mouse inalámbrico Logitech M170",
+            "Batería para portátil Lenovo IdeaPad",
+        ]
+        self.assertEqual(self._kept("portatil lenovo", titles), titles[:1])
+
+    def test_searched_accessory_is_not_filtered(self):
+        titles = ["Cable HDMI 2.1 de 3 metros", "Soporte para TV de 32 a 70 pulgadas"]
+        self.assertEqual(self._kept("cable hdmi tv", titles), titles[:1])
+        self.assertEqual(self._kept("fundas iphone 15", ["Funda silicona iPhone 15"]),
+                         ["Funda silicona iPhone 15"])
+
+    def test_category_detection(self):
+        self.assertEqual(detect_category("Smart TV 55"), "televisores")
+        self.assertEqual(detect_category("Portátil Lenovo"), "portatiles")
+        self.assertEqual(detect_category("iPhone 15"), "celulares")
+        self.assertEqual(detect_category("licuadora"), "default")
+
+    def test_disabled_filter_keeps_everything(self):
+        with override_settings(ACCESSORY_FILTER={"ENABLED": False}):
+            self.assertEqual(self._kept("iphone 15", ["Funda iPhone 15"]), ["Funda iPhone 15"])
+
+
+PAGES_DIR = Path(__file__).resolve().parent / "testdata" / "pages"
+
+
+class FalabellaCardTests(SimpleTestCase):
+    def setUp(self):
+        self.html = (PAGES_DIR / "falabella_search.html").read_text(encoding="utf-8")
+
+    def test_fixture_items_and_discards(self):
+        for backend in available_backends():
+            with self.subTest(backend=backend):
+                stats: dict = {}
+                items = parse_falabella_cards(make_soup(self.html, backend), 48, stats=stats)
+                self.assertEqual(stats, {"cards": 48, "items": 44, "no_link": 0, "duplicate": 0,
+                                         "no_title": 0, "no_price": 4, "error": 0})
+                self.assertEqual(items[0], {
+                    "title": "Celular Motorola Moto G40 256 GB",
+                    "link": "https://www.falabella.com.co/falabella-co/product/70000000/"
+                            "Celular-Motorola-Moto-G40-256-GB/70000000",
+                    "price_cop": 4074900,
+                    "price_str": "$ 4.074.900",
+                    "thumbnail": "https://media.falabella.com/falabellaCO/70000000_01/w=240",
+                })
+                self.assertEqual(len({it["link"] for it in items}), 44)
+                self.assertTrue(all(it["price_cop"] > 0 for it in items))
+
+    def test_max_items_stops_the_scan(self):
+        stats: dict = {}
+        items = parse_falabella_cards(make_soup(self.html, "html.parser"), 5, stats=stats)
+        self.assertEqual(len(items), 5)
+        self.assertEqual((stats["cards"], stats["items"]), (5, 5))
+
+
+class NextDataTests(SimpleTestCase):
+    def setUp(self):
+        html = (PAGES_DIR / "falabella_next_data.html").read_text(encoding="utf-8")
+        self.soup = make_soup(html, "html.parser")
+        self.results = json.loads(self.soup.find("script", id="__NEXT_DATA__").string)["props"]["pageProps"]["results"]
+
+    def _moved_soup(self):
+        # Misma lista de productos fuera de las rutas conocidas: obliga al recorrido completo
+        data = {"props": {"pageProps": {"search": {"tracking": {"page": 1}, "list": self.results}}}}
+        html = f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script>'
+        return make_soup(html, "html.parser")
+
+    def test_known_path(self):
+        meta: dict = {}
+        items = parse_next_data_products(self.soup, 48, meta=meta)
+        self.assertEqual(meta, {"next_data_path": "props.pageProps.results"})
+        self.assertEqual(len(items), 48)
+        self.assertEqual(items[0], {
+            "title": "Celular HP 6 Pro 512 GB Dual SIM",
+            "link": "https://www.falabella.com.co/falabella-co/product/70000000/Celular-HP-6-Pro-512-GB-Dual-SIM/70000000",
+            "price_cop": 7927900,
+            "price_str": "$ 7.927.900",
+            "thumbnail": "https://media.falabella.com/falabellaCO/70000000_01",
+        })
+
+    def test_walk_fallback_keeps_the_same_items(self):
+        meta: dict = {}
+        items = parse_next_data_products(self._moved_soup(), 48, meta=meta)
+        self.assertEqual(meta, {"next_data_path": "walk"})
+        self.assertEqual(items, parse_next_data_products(self.soup, 48))
+
+    def test_max_items_stops_early(self):
+        for soup in (self.soup, self._moved_soup()):
+            calls = []
+            for max_items in (48, 5):
+                with mock.patch("home.service._json_product", wraps=service._json_product) as convert:
+                    items = parse_next_data_products(soup, max_items)
+                self.assertEqual(len(items), max_items)
+                calls.append(convert.call_count)
+            # Con 5 items no se visitan los productos restantes
+            self.assertLess(calls[1] * 5, calls[0])
+
+    def test_prices_preference(self):
+        prices = [
+            {"type": "normalPrice", "price": ["9.513.480"], "crossed": True},
+            {"type": "internetPrice", "price": ["7.927.900"]},
+            {"type": "eventPrice", "price": ["7.500.000"]},
+        ]
+        self.assertEqual(_json_prices_value(prices), "7.500.000")
+        self.assertEqual(_json_prices_value(prices[:2]), "7.927.900")
+        self.assertEqual(_json_prices_value([{"type": "otro", "price": "1.000", "crossed": True},
+                                             {"type": "otro", "price": "900"}]), "900")
+        self.assertIsNone(_json_prices_value([{"type": "internetPrice", "price": []}]))
+
+
+class SlugifyQueryTests(SimpleTestCase):
+    def test_accents_and_enie_are_encoded(self):
+        self.assertEqual(slugify_query("Cámara Sony"), "c%C3%A1mara-sony")
+        self.assertEqual(slugify_query("  Zapatos  NIÑA "), "zapatos-ni%C3%B1a")
+        self.assertEqual(slugify_query("日本"), "%E6%97%A5%E6%9C%AC")
+
+    def test_units_stick_to_their_number(self):
+        self.assertEqual(slugify_query("celular 128 GB"), "celular-128gb")
+        self.assertEqual(slugify_query("Celular 128GB"), "celular-128gb")
+        self.assertEqual(slugify_query("batería 5000 mAh"), "bater%C3%ADa-5000mah")
+        # Las unidades escritas completas se dejan como palabra aparte
+        self.assertEqual(slugify_query("Televisor 55 pulgadas"), "televisor-55-pulgadas")
+
+    def test_stopwords_are_dropped(self):
+        self.assertEqual(slugify_query("celular de 128 gb"), "celular-128gb")
+        self.assertEqual(slugify_query("audífonos y cargador para el carro"), "aud%C3%ADfonos-cargador-carro")
+        # Letra de modelo delante de un número: se conserva
+        self.assertEqual(slugify_query("Galaxy A 15"), "galaxy-a-15")
+        self.assertEqual(slugify_query("de la"), "de-la")
+        self.assertEqual(slugify_query(" ¿? "), "")
+
+
+class MatchExpressionTests(SimpleTestCase):
+    TITLES = [
+        "Celular Xiaomi Redmi 128GB Azul",
+        "Celular Xiaomi 128 GB Negro",
+        "Samsung Galaxy A15 128 gigas",
+        "Samsung Galaxy S15",
+        "Televisor LG 55 pulgadas 4K",
+        "Tablet 6.5in Ártico",
+    ]
+
+    def _matches(self, query: str) -> list[str]:
+        conn = sqlite3.connect(":memory:")
+        self.addCleanup(conn.close)
+        # Mismo tokenizador que home.history
+        conn.execute("CREATE VIRTUAL TABLE t USING fts5(title, tokenize='unicode61 remove_diacritics 2')")
+        conn.executemany("INSERT INTO t VALUES (?)", [(t,) for t in self.TITLES])
+        return [row[0] for row in conn.execute("SELECT title FROM t WHERE t MATCH ? ORDER BY rowid",
+                                               (match_expression(query),))]
+
+    def test_sizes_match_glued_or_spaced(self):
+        expected = ["Celular Xiaomi Redmi 128GB Azul", "Celular Xiaomi 128 GB Negro"]
+        self.assertEqual(self._matches("celular xiaomi 128 gb"), expected)
+        self.assertEqual(self._matches("celulares xiaomi 128GB"), expected)
+        self.assertEqual(self._matches("televisor 55\""), ["Televisor LG 55 pulgadas 4K"])
+        self.assertEqual(self._matches("tablet 6,5 pulgadas artico"), ["Tablet 6.5in Ártico"])
+
+    def test_model_letter_and_stopwords(self):
+        self.assertEqual(self._matches("samsung galaxy a 15"), ["Samsung Galaxy A15 128 gigas"])
+        # Las palabras vacías no se exigen en el título
+        self.assertEqual(self._matches("televisor de 55 pulgadas"), ["Televisor LG 55 pulgadas 4K"])
+
+    def test_empty_query(self):
+        self.assertIsNone(match_expression("  ¿? "))
+
+
+class PriceHistoryTests(SimpleTestCase):
+    LINK = "https://example.com/celular"
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / "history.sqlite3"
+        override = override_settings(PRICE_HISTORY={"ENABLED": True, "PATH": self.path})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(self._close_reader)
+        self.conn = connect(self.path)
+        self.addCleanup(self.conn.close)
+
+    @staticmethod
+    def _close_reader():
+        conn = getattr(history._readers, "conn", None)
+        if conn is not None:
+            conn.close()
+            history._readers.conn = None
+
+    def _row(self, price: int, seen_at: float, link: str = LINK) -> tuple:
+        return ("src", link, "Celular Xiaomi 128GB", price, int(seen_at), None)
+
+    def test_repeated_prices_are_not_stored(self):
+        rows = [self._row(price, 1000 + i) for i, price in enumerate([100, 100, 90, 90, 100])]
+        self.assertEqual(write_batch(self.conn, rows), 3)
+        # Mismo precio que el último conocido, en otro lote: solo se actualiza last_seen
+        self.assertEqual(write_batch(self.conn, [self._row(100, 2000)]), 0)
+        self.assertEqual([p["price_cop"] for p in price_history(self.LINK)], [100, 90, 100])
+        last_seen = self.conn.execute("SELECT last_seen FROM products WHERE link = ?", (self.LINK,)).fetchone()
+        self.assertEqual(last_seen, (2000,))
+
+    def test_lowest_price_window(self):
+        now = time.time()
+        write_batch(self.conn, [
+            self._row(50, now - 10 * DAY), self._row(80, now - 5 * DAY), self._row(70, now - DAY),
+            self._row(60, now - 10 * DAY, link="https://example.com/viejo"),
+        ])
+        self.assertEqual(lowest_price(self.LINK, 3)["price_cop"], 70)
+        # El precio vigente al empezar la ventana también cuenta, fechado al inicio de ella
+        lowest = lowest_price(self.LINK, 7)
+        self.assertEqual(lowest["price_cop"], 50)
+        self.assertAlmostEqual(lowest["seen_at"], now - 7 * DAY, delta=5)
+        self.assertEqual(lowest_price(self.LINK, 30)["price_cop"], 50)
+        # Sin observaciones dentro de la ventana no hay precio
+        self.assertIsNone(lowest_price("https://example.com/viejo", 3))
+        self.assertIsNone(lowest_price("https://example.com/otro", 30))
+
+
+class ProductIndexTests(SimpleTestCase):
+    def test_search_filters_by_source_and_age(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / "history.sqlite3"
+        now = int(time.time())
+        with override_settings(PRICE_HISTORY={"ENABLED": True, "PATH": path}, SEARCH_INDEX={"ENABLED": True}):
+            conn = connect(path)
+            write_batch(conn, [
+                ("src", "https://example.com/1", "Celular Xiaomi 128GB", 900000, now - 10, None),
+                ("src", "https://example.com/2", "Celular Xiaomi 256GB", 1200000, now - 5000, None),
+                ("otra", "https://example.com/3", "Celular Xiaomi 128GB", 800000, now, None),
+            ])
+            conn.close()
+            index = ProductIndex()
+            self.addCleanup(index.close)
+            rows = index.search("src", "celular xiaomi", 10, max_age=600)
+        self.assertEqual([row["link"] for row in rows], ["https://example.com/1"])
+        self.assertEqual(rows[0]["price_cop"], 900000)
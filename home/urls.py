@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import home
+from .views import home, home_stream
 
 urlpatterns = [
     path('', home, name='home'),
+    path('stream/', home_stream, name='home_stream'),
 ]
\ No newline at end of file
@@ -1,17 +1,48 @@
+import json
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotAllowed, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from .cache import RESULT_CACHE
+from .metrics import METRICS
+from .prewarm import PREWARMER
+from .ratelimit import rate_limit
+from .service import search_aggregated_async, get_available_sources, search_is_cached, stream_search_events
+from .singleflight import SINGLE_FLIGHT
+
+MAX_ITEMS_PER_SOURCE = 5
+
+
+def _selected_sources(request, available_sources: list[dict]) -> list[str]:
+    return request.POST.getlist("sources") or [s["key"] for s in available_sources]
+
 
-from .service import search_aggregated, get_available_sources
+def search_cost(request) -> str | None:
+    # Regla de RATELIMIT_RULES según el coste: servir de caché es barato, scrapear en frío no
+    if request.method != "POST":
+        return None
+    search_query = request.POST.get("search_item", "").strip()
+    if not search_query:
+        return None
+    sources = _selected_sources(request, get_available_sources())
+    return "search_cached" if search_is_cached(search_query, sources, MAX_ITEMS_PER_SOURCE) else "search_cold"
 
 
-def home(request):
+@rate_limit(search_cost)
+async def home(request):
     search_query = ""
     results_data = {"results": [], "errors": []}
     available_sources = get_available_sources()
 
     if request.method == "POST":
         search_query = request.POST.get("search_item", "").strip()
-        selected_sources = request.POST.getlist("sources") or [s["key"] for s in available_sources]
-        results_data = search_aggregated(search_query, sources=selected_sources, max_items_per_source=5)
+        selected_sources = _selected_sources(request, available_sources)
+        # Popularidad de la consulta para el precalentamiento (solo suma en memoria)
+        PREWARMER.record(search_query, MAX_ITEMS_PER_SOURCE)
+        results_data = await search_aggregated_async(search_query, sources=selected_sources,
+                                                     max_items_per_source=MAX_ITEMS_PER_SOURCE)
 
     context = {
         "search_query": search_query,
@@ -20,5 +51,41 @@ def home(request):
         "selected_sources": results_data.get("sources", []),
         "best_item": results_data.get("best_item"),
         "available_sources": available_sources,
+        "cache_report": results_data.get("cache"),
+        "cache_stats": RESULT_CACHE.stats(),
+        "coalescing_stats": SINGLE_FLIGHT.stats(),
     }
-    return render(request, "home.html", context)
\ No newline at end of file
+    return render(request, "home.html", context)
+
+
+@rate_limit(search_cost)
+async def home_stream(request):
+    # Server-sent events: un evento por marketplace en cuanto responde
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    search_query = request.POST.get("search_item", "").strip()
+    selected_sources = _selected_sources(request, get_available_sources())
+    PREWARMER.record(search_query, MAX_ITEMS_PER_SOURCE)
+
+    async def events():
+        async for event in stream_search_events(search_query, sources=selected_sources,
+                                                max_items_per_source=MAX_ITEMS_PER_SOURCE):
+            payload = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['type']}\ndata: {payload}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream; charset=utf-8")
+    response["Cache-Control"] = "no-cache"
+    # Evita que un proxy (nginx/Railway) acumule la respuesta completa
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def metrics_view(request):
+    # Métricas del worker en formato de texto de Prometheus; con METRICS_TOKEN se exige el token
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        header = request.headers.get("Authorization", "")
+        given = header[len("Bearer "):] if header.startswith("Bearer ") else request.GET.get("token", "")
+        if not constant_time_compare(given, token):
+            return HttpResponseForbidden()
+    return HttpResponse(METRICS.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,40 +1,80 @@
-from django.http import HttpResponse
-from django_ratelimit.decorators import ratelimit
-from django_ratelimit.exceptions import Ratelimited
-from functools import wraps
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
 
+from home.ratelimit import acheck, check
 
 class GlobalRateLimitMiddleware:
     """
-    Middleware para aplicar rate limiting global de 50 requests por minuto
-    basado en la IP del cliente.
+    Middleware para aplicar rate limiting global (GLOBAL_RATELIMIT_RATE, por defecto
+    50 requests por minuto) basado en la IP del cliente. El contador es el de
+    home.ratelimit, compartido por todos los workers del host.
+    Soporta ASGI: con una cadena async no fuerza la adaptación a hilos síncronos.
     """
-    
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return check(request, 'global') or self.get_response(request)
+
+    async def __acall__(self, request):
+        # En un hilo: al acabarse la reserva del worker se consulta la base compartida
+        return await acheck(request, 'global') or await self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """
+    Perfilado a demanda de una petición (home.profiling). Se activa con un token
+    firmado en la cabecera o en el parámetro de consulta configurados; genera el
+    token `python manage.py profile_token`. Con REQUEST_PROFILING['ENABLED'] en
+    False el middleware no se instala y el tráfico normal no paga nada.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
+        from home.profiling import get_profiling_config
+        self.config = get_profiling_config()
+        if not self.config["ENABLED"]:
+            raise MiddlewareNotUsed
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        from home.profiling import ProfileSession, verify_token
+        token = request.headers.get(self.config["HEADER"]) or request.GET.get(self.config["QUERY_PARAM"])
+        if not token:
+            return None
+        label = verify_token(token, self.config["MAX_AGE"])
+        if label is None:
+            return None
+        return ProfileSession(label, request.POST.get("search_item", ""), self.config)
+
+    def _finish(self, request, session, response):
+        directory = session.save({"method": request.method, "path": request.path,
+                                  "status": response.status_code})
+        response["X-Profile-Id"] = directory.name
+        return response
 
     def __call__(self, request):
-        # Aplicar rate limit de 50 requests por minuto por IP
-        @ratelimit(key='ip', rate='50/m', method='ALL')
-        def rate_limited_view(request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        session = self._start(request)
+        if session is None:
             return self.get_response(request)
-        
-        try:
-            return rate_limited_view(request)
-        except Ratelimited:
-            # Respuesta personalizada cuando se excede el rate limit
-            return HttpResponse(
-                "Demasiadas solicitudes. Por favor, espera un momento antes de volver a intentar.",
-                status=429,
-                content_type='text/plain; charset=utf-8'
-            )
-
-    def process_exception(self, request, exception):
-        """Maneja las excepciones de rate limiting"""
-        if isinstance(exception, Ratelimited):
-            return HttpResponse(
-                "Demasiadas solicitudes. Por favor, espera un momento antes de volver a intentar.",
-                status=429,
-                content_type='text/plain; charset=utf-8'
-            )
-        return None
+        response = session.run(self.get_response, request)
+        return self._finish(request, session, response)
+
+    async def __acall__(self, request):
+        session = self._start(request)
+        if session is None:
+            return await self.get_response(request)
+        response = await session.arun(self.get_response, request)
+        return self._finish(request, session, response)
@@ -65,6 +65,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'perciosfacil.middleware.GlobalRateLimitMiddleware',  # Rate limiting global
+    'perciosfacil.middleware.ProfilingMiddleware',  # Perfilado a demanda (REQUEST_PROFILING)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,20 +104,181 @@ DATABASES = {
     }
 }
 
-# Configuración de cache para django-ratelimit
-# Usando cache en memoria local (simple para desarrollo/producción básica)
+# Cache por defecto en memoria local del proceso
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'ratelimit-cache',
+        'LOCATION': 'default-cache',
         'OPTIONS': {
             'MAX_ENTRIES': 1000,
         }
-    }
+    },
+    # Resultados de búsqueda compartidos por todos los workers del host (home.cache)
+    'search': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': getenv('SEARCH_CACHE_DIR', '/tmp/preciosfacil-search-cache'),
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        }
+    },
+}
+
+# Límite global por IP (perciosfacil.middleware); subirlo solo para pruebas de carga
+GLOBAL_RATELIMIT_RATE = getenv('GLOBAL_RATELIMIT_RATE', '50/m')
+# Límites por IP compartidos por los workers del host (home.ratelimit): además del
+# global, una búsqueda que se sirve de caché cobra 'search_cached' y una que obliga a
+# scrapear, 'search_cold'
+RATELIMIT_RULES = {
+    'search_cached': getenv('RATELIMIT_SEARCH_CACHED', '40/m'),
+    'search_cold': getenv('RATELIMIT_SEARCH_COLD', '12/m'),
+}
+RATELIMIT_ENGINE = {
+    # Base SQLite de contadores; vacío = cada worker cuenta por separado
+    'PATH': getenv('RATELIMIT_DB', '/tmp/preciosfacil-ratelimit.sqlite3'),
+    # Parte del margen del cliente que un worker reserva para decidir en memoria
+    'LEASE_FRACTION': 0.25,
+    'LEASE_MAX': 10,
+    # Una reserva sin usar durante LEASE_TTL s vuelve a la base en el siguiente FLUSH_INTERVAL
+    'LEASE_TTL': 1.0,
+    'FLUSH_INTERVAL': 0.5,
+}
+
+# Endpoint /metrics (home.metrics, formato Prometheus). Si se define, se exige
+# 'Authorization: Bearer <token>' o ?token=<token>
+METRICS_TOKEN = getenv('METRICS_TOKEN', '')
+
+# Perfilado a demanda de una búsqueda (home.profiling): con un token de
+# `manage.py profile_token` en la cabecera X-Profile-Token o en ?profile=, la petición
+# se perfila con cProfile y se guardan el perfil y las páginas descargadas en DIR
+REQUEST_PROFILING = {
+    'ENABLED': getenv('REQUEST_PROFILING_ENABLED', '0') == '1',
+    'DIR': getenv('REQUEST_PROFILING_DIR', '') or BASE_DIR / 'profiles',
+    'MAX_AGE': int(getenv('REQUEST_PROFILING_MAX_AGE', '3600')),
+}
+
+# Sesiones HTTP persistentes por marketplace (home.sessions)
+SCRAPER_HTTP_POOL = {
+    'POOL_CONNECTIONS': int(getenv('SCRAPER_POOL_CONNECTIONS', '10')),
+    'POOL_MAXSIZE': int(getenv('SCRAPER_POOL_MAXSIZE', '30')),
+    'MAX_RETRIES': 3,
+    'KEEPALIVE_SECONDS': int(getenv('SCRAPER_KEEPALIVE_SECONDS', '300')),
+    'TCP_KEEPALIVE': True,
+    # Cada cuánto se recalienta la sesión de Mercado Libre (cookies de portada/ofertas)
+    'WARMUP_TTL': int(getenv('SCRAPER_WARMUP_TTL', '1800')),
+}
+
+# Caché de resultados por fuente (home.cache): LRU en memoria + alias 'search' compartido
+SEARCH_CACHE = {
+    'ENABLED': getenv('SEARCH_CACHE_ENABLED', '1') == '1',
+    'MEMORY_MAX_ENTRIES': 512,
+    'SHARED_ALIAS': 'search',
+    # TTL en segundos por clave de fuente; 'default' aplica al resto
+    'TTL': {
+        'default': 300,
+        'mercadolibre': 300,
+        'falabella': 600,
+    },
+    # Stale-while-revalidate: entre TTL y STALE_TTL se sirve lo guardado y se refresca en segundo plano
+    'STALE_WHILE_REVALIDATE': getenv('SEARCH_CACHE_SWR', '1') == '1',
+    'STALE_TTL': {
+        'default': 3600,
+    },
+    'REFRESH_WORKERS': 4,
+}
+
+# URLs base de los marketplaces (home.service.base_url). Para pruebas de carga se apuntan
+# al servidor local de `manage.py loadtest` (ver su --serve-only)
+SCRAPER_BASE_URLS = {
+    'mercadolibre': getenv('SCRAPER_ML_BASE_URL', 'https://www.mercadolibre.com.co'),
+    'mercadolibre_listado': getenv('SCRAPER_ML_LISTADO_URL', 'https://listado.mercadolibre.com.co'),
+    'mercadolibre_api': getenv('SCRAPER_ML_API_URL', 'https://api.mercadolibre.com'),
+    'falabella': getenv('SCRAPER_FALABELLA_BASE_URL', 'https://www.falabella.com.co'),
+}
+
+# Cortesía por host (home.politeness): token bucket compartido por los hilos del worker.
+# RATE = peticiones/segundo sostenidas, BURST = peticiones seguidas sin espera,
+# JITTER = segundos aleatorios que se suman cuando sí hay que esperar
+SCRAPER_POLITENESS = {
+    # MAX_WAIT: si el turno queda más lejos (o después del plazo de la búsqueda), se falla al instante
+    'default': {'RATE': 0.5, 'BURST': 4, 'JITTER': (0.2, 1.0), 'MAX_WAIT': 10.0},
+    'www.mercadolibre.com.co': {'RATE': 0.3, 'BURST': 2, 'JITTER': (0.5, 1.5)},
+    'listado.mercadolibre.com.co': {'RATE': 0.5, 'BURST': 4, 'JITTER': (0.3, 1.2)},
+    'www.falabella.com.co': {'RATE': 0.3, 'BURST': 3, 'JITTER': (0.5, 2.0)},
+    # Servidor local de pruebas de carga: sin espera
+    '127.0.0.1': {'RATE': 10000, 'BURST': 10000, 'JITTER': (0, 0)},
+}
+
+# Reintentos de las peticiones a los marketplaces (home.retry), por fuente: backoff
+# exponencial con jitter, 429/5xx respetando Retry-After y hedging opcional al p95
+SCRAPER_RETRY = {
+    'default': {'MAX_ATTEMPTS': 3, 'BACKOFF_BASE': 0.5, 'BACKOFF_MAX': 8.0, 'MAX_RETRY_AFTER': 30.0, 'HEDGE': False},
+    'mercadolibre': {'HEDGE': getenv('SCRAPER_HEDGE_ML', '0') == '1'},
+}
+# Tope de reintentos + peticiones duplicadas del proceso: MIN_RETRIES + RATIO * peticiones
+# de los últimos WINDOW s, para no multiplicar la carga durante una caída
+SCRAPER_RETRY_BUDGET = {'RATIO': 0.2, 'MIN_RETRIES': 5, 'WINDOW': 10.0}
+
+# Histórico de precios (home.history): cada scrape se guarda en segundo plano en una
+# base SQLite local compartida por los workers; solo se anotan los cambios de precio
+PRICE_HISTORY = {
+    'ENABLED': getenv('PRICE_HISTORY_ENABLED', '1') == '1',
+    'PATH': getenv('PRICE_HISTORY_DB', '') or BASE_DIR / 'data' / 'price_history.sqlite3',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 2.0,
+}
+
+# Índice local de texto completo sobre el histórico (home.index). Con INDEX_FIRST, una
+# fuente sin caché responde desde el índice si tiene MIN_RESULTS items vistos hace menos
+# de MAX_AGE s, y con REFRESH se vuelve a scrapear en segundo plano para la caché
+SEARCH_INDEX = {
+    'ENABLED': getenv('SEARCH_INDEX_ENABLED', '1') == '1',
+    'INDEX_FIRST': getenv('SEARCH_INDEX_FIRST', '0') == '1',
+    'MAX_AGE': int(getenv('SEARCH_INDEX_MAX_AGE', '900')),
+    'MIN_RESULTS': 3,
+    'REFRESH': True,
+}
+
+# Precalentamiento de consultas populares (home.prewarm): cada INTERVAL s un worker vuelve a
+# scrapear las TOP_N búsquedas más frecuentes antes de que venza su caché, a un ritmo de
+# MAX_REQUESTS_PER_MINUTE y sin gastar los últimos POLITENESS_RESERVE tokens de cortesía del host
+PREWARM = {
+    'ENABLED': getenv('PREWARM_ENABLED', '0') == '1',
+    'PATH': getenv('PREWARM_DB', '') or BASE_DIR / 'data' / 'search_log.sqlite3',
+    'TOP_N': int(getenv('PREWARM_TOP_N', '100')),
+    'INTERVAL': 120.0,
+    'CONCURRENCY': 2,
+    'MAX_REQUESTS_PER_MINUTE': int(getenv('PREWARM_MAX_RPM', '30')),
+    'POLITENESS_RESERVE': 2,
+}
+
+# Circuit breaker por fuente (home.breaker): tras FAILURE_THRESHOLD errores o bloqueos
+# seguidos la fuente se omite durante COOLDOWN s (se duplica hasta MAX_COOLDOWN si la
+# sonda de prueba vuelve a fallar). FAILURE_THRESHOLD = 0 lo desactiva
+SCRAPER_CIRCUIT_BREAKER = {
+    'default': {'FAILURE_THRESHOLD': 3, 'COOLDOWN': 30, 'MAX_COOLDOWN': 300, 'HALF_OPEN_PROBES': 1},
+    'falabella': {'COOLDOWN': 60},
+}
+
+# Backend para parsear el HTML de los marketplaces (home.parsers):
+# 'html.parser' (sin dependencias), 'lxml' o 'selectolax' (motor CSS nativo, el más rápido).
+# lxml y selectolax son opcionales: instálalos con pip antes de elegirlos.
+# Comparativa: python manage.py bench_parsers
+SCRAPER_HTML_PARSER = getenv('SCRAPER_HTML_PARSER', 'html.parser')
+
+# Parseo restringido: con html.parser/lxml solo se construye el árbol de la grilla de
+# productos y de los <script> de datos (regiones por fuente en home.service.PARSE_REGIONS)
+SCRAPER_RESTRICTED_PARSE = getenv('SCRAPER_RESTRICTED_PARSE', '1') == '1'
+
+# Filtro de accesorios (home.filters), igual para todas las fuentes. La lista de palabras
+# depende de la categoría detectada en la consulta; 'CATEGORIES' permite ampliar o
+# reemplazar listas, p. ej. {'celulares': [...], 'consolas': [...]}
+ACCESSORY_FILTER = {
+    'ENABLED': getenv('ACCESSORY_FILTER_ENABLED', '1') == '1',
 }
 
-# Configuración de django-ratelimit
-RATELIMIT_USE_CACHE = 'default'
+# Presupuesto total de latencia por búsqueda; las fuentes que no respondan a tiempo se reportan en errores
+SEARCH_BUDGET_SECONDS = float(getenv('SEARCH_BUDGET_SECONDS', '12'))
 
 
 # Password validation
@@ -178,7 +340,7 @@ LOGGING = {
         },
     },
     'loggers': {
-        'home.service': {
+        'home': {
             'handlers': ['console'],
             'level': 'ERROR',
             'propagate': False,
@@ -17,8 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from home.views import metrics_view
+
 urlpatterns = [
     path('', include('home.urls')),  # Root URL will now go to home
     # path('admin/', admin.site.urls),
     path('home/', include('home.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]